@@ -0,0 +1,127 @@
+import hashlib
+
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from api_internal.renderers import ColumnarJSONRenderer
+from core.cache import get_project_data_version
+from core.models import Project
+from core.utils import to_columnar
+
+
+class ProjectMixin:
+    """
+    Adds the project of the nested API endpoints to the view set.
+    """
+
+    def get_project(self):
+        if hasattr(self, "_project"):
+            return self._project
+
+        project_pk = self.kwargs["project_pk"]
+        user = self.request.user
+        kwargs = {
+            "active": True,
+            "pk": project_pk,
+        }
+        if user.is_authenticated:
+            kwargs["user"] = user
+        else:
+            kwargs["private"] = False
+
+        # Superusers can see projects from other users
+        if user.is_superuser:
+            del kwargs["user"]
+
+        project = get_object_or_404(Project, **kwargs)
+
+        # Private projects can only be requested by owner or superuser
+        if project.private and project.user != user and not user.is_superuser:
+            raise Http404("Project does not exist")
+
+        self._project = project
+        return project
+
+
+class ConditionalGetMixin(ProjectMixin):
+    """
+    Answers requests with `304 Not Modified` if the data of the project did not change.
+
+    The data of a project changes when it is updated or when a web hook saves
+    new issues, pull requests or releases, so the ETag is derived from the last
+    update and the data version of the project, the currently active source
+    status and the query parameters of the request.
+    """
+
+    def get_etag(self, project):
+        source_status = project.current_source_status
+        query_params = sorted(self.request.GET.lists())
+
+        key = (
+            f"{project.pk}:"
+            f"{project.last_update.isoformat() if project.last_update else ''}:"
+            f"{get_project_data_version(project.pk)}:"
+            f"{source_status.pk if source_status else ''}:"
+            f"{self.request.path}:{query_params}"
+        )
+
+        return quote_etag(hashlib.md5(key.encode("utf-8")).hexdigest())
+
+    def get_last_modified(self, project):
+        if not project.last_update:
+            return None
+
+        return int(project.last_update.timestamp())
+
+    def list(self, request, *args, **kwargs):
+        project = self.get_project()
+        etag = self.get_etag(project)
+        last_modified = self.get_last_modified(project)
+
+        response = get_conditional_response(
+            request,
+            etag=etag,
+            last_modified=last_modified,
+        )
+        if response is None:
+            response = super().list(request, *args, **kwargs)
+
+        response["ETag"] = etag
+        if last_modified:
+            response["Last-Modified"] = http_date(last_modified)
+
+        # Make browsers always ask if the data is still up to date.
+        patch_cache_control(response, private=True, no_cache=True)
+
+        return response
+
+
+class ColumnarMixin:
+    """
+    Adds the opt-in format `?format=columnar` to a time series endpoint.
+
+    Instead of a paginated list of objects the whole series is returned as
+    `{"dates": [...], "series": {name: [...]}}`. It is built directly from
+    the data frame, without running the serializer for every row.
+    """
+
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [ColumnarJSONRenderer]
+
+    # Name of the column with the dates
+    columnar_date_field = "date"
+
+    # Additional series calculated from the data frame, see `to_columnar`
+    columnar_derived = {}
+
+    def list(self, request, *args, **kwargs):
+        if request.accepted_renderer.format != ColumnarJSONRenderer.format:
+            return super().list(request, *args, **kwargs)
+
+        rows = self.filter_queryset(self.get_queryset())
+        return Response(
+            to_columnar(rows, self.columnar_date_field, self.columnar_derived)
+        )
@@ -1,7 +1,18 @@
+import base64
+import bisect
+import hashlib
+import json
+import uuid
 from collections import OrderedDict
 
-from rest_framework.pagination import PageNumberPagination
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q, QuerySet
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
 
 
 class CustomPageNumberPagination(PageNumberPagination):
@@ -21,3 +32,208 @@ class CustomPageNumberPagination(PageNumberPagination):
                 ]
             )
         )
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginates over a stable sort key instead of page numbers.
+
+    The view defines the sort key with `keyset_ordering`, a list of keys
+    of the result rows. Prefix a key with "-" for descending order.
+    The cursor contains the sort key of the last item returned.
+
+    Querysets are ordered by the sort key and every page is read from the
+    database starting after the cursor (a seek instead of an OFFSET).
+
+    Other results (lists computed in Python) are computed once for the first
+    page and kept in the cache for a short time. The following pages are read
+    from there by the id in the cursor. If the cached result expired, it is
+    computed again and continues after the sort key, so no items are skipped
+    or repeated. (Descending keys have to be numeric for those.)
+    """
+
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    page_size = api_settings.PAGE_SIZE
+    max_page_size = api_settings.PAGE_SIZE
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = view.keyset_ordering
+        self.page_size = self.get_page_size(request)
+
+        cursor = self.decode_cursor(request)
+
+        # `type()` does not evaluate lazy objects (like `isinstance()` would).
+        if issubclass(type(queryset), QuerySet):
+            return self.paginate_database(queryset, request, cursor)
+
+        return self.paginate_snapshot(queryset, request, cursor)
+
+    def paginate_database(self, queryset, request, cursor):
+        """
+        Reads the page after the cursor from the database.
+        """
+        queryset = queryset.order_by(*self.ordering)
+
+        # The number of items is counted once per cursor chain.
+        count = None
+        if cursor:
+            count_id = cursor["id"]
+            count = cache.get(self.get_cache_key(request, count_id))
+        else:
+            count_id = uuid.uuid4().hex
+
+        if count is None:
+            count = queryset.count()
+            cache.set(
+                self.get_cache_key(request, count_id),
+                count,
+                timeout=settings.CURSOR_CACHE_TIMEOUT,
+            )
+
+        if cursor:
+            queryset = queryset.filter(self.get_seek_filter(cursor["after"]))
+
+        # One more item tells whether there is a next page.
+        rows = list(queryset[: self.page_size + 1])
+
+        self.count = count
+        self.next_cursor = None
+        if len(rows) > self.page_size:
+            rows = rows[: self.page_size]
+            self.next_cursor = {"id": count_id, "after": self.get_values(rows[-1])}
+
+        return rows
+
+    def paginate_snapshot(self, rows, request, cursor):
+        """
+        Reads the page after the cursor from the cached result.
+        """
+        snapshot = None
+        if cursor:
+            snapshot = cache.get(self.get_cache_key(request, cursor["id"]))
+
+        if snapshot:
+            snapshot_id = cursor["id"]
+            keys, rows = snapshot
+        else:
+            snapshot_id = uuid.uuid4().hex
+            rows = sorted(rows, key=self.get_key)
+            keys = [self.get_key(row) for row in rows]
+            cache.set(
+                self.get_cache_key(request, snapshot_id),
+                (keys, rows),
+                timeout=settings.CURSOR_CACHE_TIMEOUT,
+            )
+
+        start = bisect.bisect_right(keys, cursor["after"]) if cursor else 0
+        end = start + self.page_size
+
+        self.count = len(rows)
+        self.next_cursor = None
+        if end < len(rows):
+            self.next_cursor = {"id": snapshot_id, "after": keys[end - 1]}
+
+        return rows[start:end]
+
+    def get_seek_filter(self, after):
+        """
+        Returns the filter for the rows following the sort key `after`:
+        `(a > 1) OR (a = 1 AND b > 2) OR ...` (or `<` for descending keys).
+        """
+        seek = Q()
+        for i, field in enumerate(self.ordering):
+            name = field.lstrip("-")
+            lookup = "lt" if field.startswith("-") else "gt"
+
+            condition = Q(**{f"{name}__{lookup}": after[i]})
+            for previous, value in zip(self.ordering[:i], after):
+                condition &= Q(**{previous.lstrip("-"): value})
+
+            seek |= condition
+
+        return seek
+
+    def get_paginated_response(self, data):
+        return Response(
+            OrderedDict(
+                [
+                    ("count", self.count),
+                    ("next", self.get_next_link()),
+                    ("page_size", self.page_size),
+                    ("results", data),
+                ]
+            )
+        )
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+            if page_size > 0:
+                return min(page_size, self.max_page_size)
+        except (KeyError, ValueError):
+            pass
+
+        return self.page_size
+
+    def get_values(self, row):
+        """
+        Returns the sort key of a row for the cursor of a queryset.
+        """
+        values = []
+        for field in self.ordering:
+            value = row[field.lstrip("-")]
+            values.append(
+                value
+                if value is None or isinstance(value, (int, float, str))
+                else str(value)
+            )
+
+        return values
+
+    def get_key(self, row):
+        key = []
+        for field in self.ordering:
+            if field.startswith("-"):
+                key.append(-row[field[1:]])
+            else:
+                value = row[field]
+                key.append(
+                    value if isinstance(value, (int, float, str)) else str(value)
+                )
+
+        return key
+
+    def get_cache_key(self, request, snapshot_id):
+        # A cursor only continues the request it was made for,
+        # not the same endpoint with other filters.
+        query_params = sorted(
+            (key, values)
+            for key, values in request.query_params.lists()
+            if key not in (self.cursor_query_param, self.page_size_query_param)
+        )
+        query_hash = hashlib.md5(repr(query_params).encode("utf-8")).hexdigest()
+
+        return f"cursor:{request.path}:{query_hash}:{snapshot_id}"
+
+    def get_next_link(self):
+        if not self.next_cursor:
+            return None
+
+        cursor = base64.urlsafe_b64encode(
+            json.dumps(self.next_cursor).encode("utf-8")
+        ).decode("ascii")
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode("ascii")))
+            return {"id": str(cursor["id"]), "after": list(cursor["after"])}
+        except (TypeError, ValueError, KeyError):
+            raise NotFound("Invalid cursor")
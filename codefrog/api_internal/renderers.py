@@ -0,0 +1,11 @@
+from rest_framework.renderers import JSONRenderer
+
+
+class ColumnarJSONRenderer(JSONRenderer):
+    """
+    Renders time series as one list per column.
+
+    Selected with `?format=columnar`, see `ColumnarMixin`.
+    """
+
+    format = "columnar"
@@ -1,9 +1,7 @@
-import datetime
-
-from dateutil.parser import parse
-from django.utils import timezone
 from rest_framework import serializers
 
+from api_internal.utils import get_state_of_affairs_date_range
+from core.cache import get_or_compute
 from core.models import Metric, Project
 
 
@@ -25,18 +23,23 @@ class ProjectSerializer(serializers.ModelSerializer):
         ]
 
     def get_state_of_affairs(self, obj):
-        date_to = timezone.now()
-        date_from = date_to - datetime.timedelta(days=14)
-
-        date_override = self.context.get("request").GET.get("date_from", None)
-        if date_override:
-            date_from = parse(date_override)
-
-        date_override = self.context.get("request").GET.get("date_to", None)
-        if date_override:
-            date_to = parse(date_override)
-
-        return obj.get_state_of_affairs(date_from, date_to)
+        # The state of affairs of a list of projects is calculated in one go
+        # and handed over in the context.
+        state_of_affairs = self.context.get("state_of_affairs", {})
+        if obj.pk in state_of_affairs:
+            return state_of_affairs[obj.pk]
+
+        date_from, date_to = get_state_of_affairs_date_range(self.context["request"])
+        params = {
+            "date_from": date_from.strftime("%Y-%m-%d"),
+            "date_to": date_to.strftime("%Y-%m-%d"),
+        }
+        return get_or_compute(
+            obj.pk,
+            "state_of_affairs",
+            params,
+            lambda: obj.get_state_of_affairs(date_from, date_to),
+        )
 
 
 class SimpleMetricSerializer(serializers.Serializer):
@@ -74,7 +77,7 @@ class ReleaseSerializer(serializers.Serializer):
 
 class FileChangesSerializer(serializers.Serializer):
     file_path = serializers.CharField()
-    changes = serializers.FloatField()
+    changes = serializers.FloatField(source="change_count")
     repo_link = serializers.CharField()
 
 
@@ -82,6 +85,18 @@ class SourceStatusSerializer(serializers.Serializer):
     tree = serializers.DictField(source="simple_tree")
     min_changes = serializers.IntegerField()
     max_changes = serializers.IntegerField()
+    total_files = serializers.IntegerField()
+    total_complexity = serializers.IntegerField()
+    hotspots = serializers.ListField(child=serializers.DictField())
+
+
+class SourceTreeSerializer(serializers.Serializer):
+    tree = serializers.DictField()
+    min_changes = serializers.IntegerField()
+    max_changes = serializers.IntegerField()
+    total_files = serializers.IntegerField()
+    total_complexity = serializers.IntegerField()
+    hotspots = serializers.ListField(child=serializers.DictField())
 
 
 class FileStatusSerializer(serializers.Serializer):
@@ -95,3 +110,11 @@ class FileStatusSerializer(serializers.Serializer):
     commit_counts_labels = serializers.ListField(child=serializers.CharField())
     code_ownership = serializers.ListField(child=serializers.IntegerField())
     code_ownership_labels = serializers.ListField(child=serializers.CharField())
+
+
+class DashboardSerializer(serializers.Serializer):
+    project = ProjectSerializer()
+    metrics = SimpleMetricSerializer(many=True)
+    releases = ReleaseSerializer(many=True)
+    file_changes = FileChangesSerializer(many=True)
+    source_status = SourceTreeSerializer(allow_null=True)
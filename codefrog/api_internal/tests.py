@@ -0,0 +1,452 @@
+import datetime
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+
+from django.core.cache import cache
+from django.db.models import Q
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api_internal.pagination import KeysetPagination
+from connectors.github.tasks import save_issue
+from core.cache import bump_project_data_version
+from core.models import Metric, Project, SourceNode, SourceStatus
+from engine.models import CodeChange
+
+LOCMEM_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "github": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "github",
+    },
+}
+
+
+class View:
+    def __init__(self, keyset_ordering):
+        self.keyset_ordering = keyset_ordering
+
+
+def get_page(rows, keyset_ordering, params):
+    """
+    Returns the page for the query parameters and the paginator.
+    """
+    request = Request(APIRequestFactory().get("/api-internal/items/", params))
+    paginator = KeysetPagination()
+    page = paginator.paginate_queryset(rows, request, view=View(keyset_ordering))
+    return list(page), paginator
+
+
+def get_cursor(paginator):
+    return parse_qs(urlparse(paginator.get_next_link()).query)["cursor"][0]
+
+
+def get_pages(rows, keyset_ordering, page_size, expire=False):
+    """
+    Follows the next links of the pagination and returns all pages.
+    """
+    params = {"page_size": page_size}
+
+    pages = []
+    while True:
+        page, paginator = get_page(rows, keyset_ordering, params)
+        pages.append(page)
+
+        if not paginator.get_next_link():
+            return pages
+
+        if expire:
+            cache.clear()
+        params["cursor"] = get_cursor(paginator)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class KeysetPaginationTestCase(SimpleTestCase):
+    rows = [
+        {"date": datetime.date(2020, 1, day), "complexity": day % 3}
+        for day in (5, 1, 4, 2, 3)
+    ]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_cursor_round_trip(self):
+        pages = get_pages(self.rows, ["date"], page_size=2)
+
+        self.assertEqual(
+            [[row["date"].day for row in page] for page in pages],
+            [[1, 2], [3, 4], [5]],
+        )
+
+    def test_last_page(self):
+        pages = get_pages(self.rows, ["date"], page_size=5)
+        self.assertEqual(len(pages), 1)
+        self.assertEqual(len(pages[0]), 5)
+
+    def test_expired_snapshot(self):
+        pages = get_pages(self.rows, ["-complexity", "date"], page_size=2, expire=True)
+
+        self.assertEqual(
+            [(row["complexity"], row["date"].day) for page in pages for row in page],
+            [(2, 2), (2, 5), (1, 1), (1, 4), (0, 3)],
+        )
+
+    def test_max_page_size(self):
+        rows = [
+            {"date": datetime.date(2020, 1, 1) + datetime.timedelta(days=day)}
+            for day in range(5)
+        ]
+
+        with mock.patch.object(KeysetPagination, "max_page_size", 3):
+            page, paginator = get_page(rows, ["date"], {"page_size": 1000000})
+
+        self.assertEqual(len(page), 3)
+        self.assertEqual(paginator.page_size, 3)
+
+    def test_cursor_of_other_query(self):
+        page, paginator = get_page(
+            self.rows, ["date"], {"page_size": 2, "date_from": "2020-01-01"}
+        )
+        cursor = get_cursor(paginator)
+
+        # The snapshot of the first query is not used for the second one,
+        # its rows are computed and continued after the sort key.
+        other_rows = [
+            {"date": datetime.date(2020, 1, day), "complexity": 0} for day in (3, 4)
+        ]
+        page, paginator = get_page(
+            other_rows,
+            ["date"],
+            {"page_size": 2, "date_from": "2020-01-03", "cursor": cursor},
+        )
+        self.assertEqual([row["date"].day for row in page], [3, 4])
+
+        # The same query continues the snapshot.
+        page, paginator = get_page(
+            other_rows,
+            ["date"],
+            {"page_size": 2, "date_from": "2020-01-01", "cursor": cursor},
+        )
+        self.assertEqual([row["date"].day for row in page], [3, 4])
+        self.assertEqual(paginator.count, 5)
+
+    def test_seek_filter(self):
+        paginator = KeysetPagination()
+        paginator.ordering = ["-change_count", "file_path"]
+
+        self.assertEqual(
+            paginator.get_seek_filter([3, "core/models.py"]),
+            Q(change_count__lt=3)
+            | (Q(file_path__gt="core/models.py") & Q(change_count=3)),
+        )
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class FileChangesPaginationTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.project = Project.objects.create(
+            source="github",
+            slug="codefrog",
+            name="codefrog",
+            git_url="https://github.com/codefrog-app/codefrog.git",
+        )
+        source_status = SourceStatus.objects.create(
+            project=cls.project,
+            timestamp=timezone.now(),
+            active=True,
+        )
+
+        # file name: number of changes
+        files = {"a.py": 2, "b.py": 3, "c.py": 0, "d.py": 2, "e.py": 1}
+        for file_path, changes in files.items():
+            SourceNode.objects.create(
+                source_status=source_status,
+                name=file_path,
+                path=f"codefrog/{file_path}",
+                repo_link=cls.project.get_repo_link(file_path),
+            )
+            for i in range(changes):
+                CodeChange.objects.create(
+                    project=cls.project,
+                    timestamp=timezone.now(),
+                    day=timezone.now().date(),
+                    file_path=file_path,
+                    author="Anton Pirker <anton@ignaz.at>",
+                    complexity_added=1,
+                    complexity_removed=0,
+                    git_commit_hash=f"{file_path}{i}",
+                )
+
+    def setUp(self):
+        cache.clear()
+
+    def get_file_changes(self, page_size, expire=False):
+        file_changes = self.project.get_file_changes(
+            datetime.date(1970, 1, 1), timezone.now().date()
+        )
+        pages = get_pages(
+            file_changes, ["-change_count", "file_path"], page_size, expire
+        )
+        return [[row["file_path"] for row in page] for page in pages]
+
+    def test_cursor_round_trip(self):
+        self.assertEqual(
+            self.get_file_changes(page_size=2),
+            [["b.py", "a.py"], ["d.py", "e.py"], ["c.py"]],
+        )
+
+    def test_last_page(self):
+        self.assertEqual(
+            self.get_file_changes(page_size=5),
+            [["b.py", "a.py", "d.py", "e.py", "c.py"]],
+        )
+
+    def test_expired_count(self):
+        self.assertEqual(
+            self.get_file_changes(page_size=3, expire=True),
+            [["b.py", "a.py", "d.py"], ["e.py", "c.py"]],
+        )
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SourceStatusViewTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.project = Project.objects.create(
+            source="github",
+            slug="codefrog",
+            name="codefrog",
+            git_url="https://github.com/codefrog-app/codefrog.git",
+            active=True,
+            private=False,
+        )
+        source_status = SourceStatus.objects.create(
+            project=cls.project,
+            timestamp=timezone.now(),
+            active=True,
+            total_files=1,
+            total_complexity=10,
+            hotspots=[{"path": "core/models.py", "size": 10, "changes": 5}],
+        )
+        SourceNode.objects.create(source_status=source_status, name="root")
+
+    def test_aggregates(self):
+        response = self.client.get(
+            f"/api-internal/projects/{self.project.pk}/source-status/"
+        )
+
+        self.assertEqual(response.status_code, 200)
+        source_status = response.json()[0]
+        self.assertEqual(source_status["total_files"], 1)
+        self.assertEqual(source_status["total_complexity"], 10)
+        self.assertEqual(source_status["hotspots"][0]["path"], "core/models.py")
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ConditionalGetTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.project = Project.objects.create(
+            source="github",
+            slug="codefrog",
+            name="codefrog",
+            git_url="https://github.com/codefrog-app/codefrog.git",
+            active=True,
+            private=False,
+            last_update=timezone.now() - datetime.timedelta(days=1),
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.url = f"/api-internal/projects/{self.project.pk}/releases/"
+
+    def test_matching_etag(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+    def test_if_modified_since(self):
+        response = self.client.get(self.url)
+
+        response = self.client.get(
+            self.url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_changed_query(self):
+        etag = self.client.get(self.url)["ETag"]
+
+        response = self.client.get(
+            self.url, {"date_from": "2020-01-01"}, HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_changed_project(self):
+        response = self.client.get(self.url)
+        etag = response["ETag"]
+        last_modified = response["Last-Modified"]
+
+        self.project.last_update = timezone.now()
+        self.project.save()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+
+    @mock.patch("connectors.github.tasks.calculate_issue_metrics")
+    def test_saved_issue(self, calculate_issue_metrics):
+        response = self.client.get(self.url)
+        etag = response["ETag"]
+        last_modified = response["Last-Modified"]
+
+        issue = {
+            "number": 12,
+            "created_at": "2020-01-01T10:00:00Z",
+            "closed_at": None,
+            "labels": [],
+        }
+        save_issue(self.project.pk, issue)
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+
+    def test_data_version(self):
+        etag = self.client.get(self.url)["ETag"]
+
+        bump_project_data_version(self.project.pk)
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class DashboardTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.project = Project.objects.create(
+            source="github",
+            slug="codefrog",
+            name="codefrog",
+            git_url="https://github.com/codefrog-app/codefrog.git",
+            active=True,
+            private=False,
+        )
+        source_status = SourceStatus.objects.create(
+            project=cls.project,
+            timestamp=timezone.now(),
+            active=True,
+        )
+        root = SourceNode.objects.create(source_status=source_status, name="root")
+        repo = SourceNode.objects.create(
+            source_status=source_status, parent=root, name="codefrog", path="codefrog"
+        )
+        core = SourceNode.objects.create(
+            source_status=source_status,
+            parent=repo,
+            name="core",
+            path="codefrog/core",
+        )
+
+        # file path: number of changes
+        files = {"core/models.py": 3, "core/utils.py": 1, "README.md": 2}
+        for file_path, changes in files.items():
+            parent, name = (
+                (core, file_path[5:]) if "/" in file_path else (repo, file_path)
+            )
+            SourceNode.objects.create(
+                source_status=source_status,
+                parent=parent,
+                name=name,
+                path=f"codefrog/{file_path}",
+                repo_link=cls.project.get_repo_link(file_path),
+                changes=changes,
+            )
+            for i in range(changes):
+                CodeChange.objects.create(
+                    project=cls.project,
+                    timestamp=timezone.now(),
+                    day=timezone.now().date(),
+                    file_path=file_path,
+                    author="Anton Pirker <anton@ignaz.at>",
+                    complexity_added=1,
+                    complexity_removed=0,
+                    git_commit_hash=f"{file_path}{i}",
+                )
+
+    def setUp(self):
+        cache.clear()
+
+    @mock.patch("api_internal.views.DASHBOARD_TREE_DEPTH", 2)
+    @mock.patch("api_internal.views.DASHBOARD_FILE_CHANGES", 2)
+    def test_bounded(self):
+        response = self.client.get(
+            f"/api-internal/projects/{self.project.pk}/dashboard/"
+        )
+
+        self.assertEqual(response.status_code, 200)
+        dashboard = response.json()[0]
+
+        self.assertEqual(
+            [change["file_path"] for change in dashboard["file_changes"]],
+            ["core/models.py", "README.md"],
+        )
+
+        repo = dashboard["source_status"]["tree"]["children"][0]
+        core = next(child for child in repo["children"] if child["path"] == "core")
+        self.assertTrue(core["collapsed"])
+        self.assertEqual(core["children"], [])
+        self.assertEqual(core["changes"], 3)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ColumnarFormatTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.project = Project.objects.create(
+            source="github",
+            slug="codefrog",
+            name="codefrog",
+            git_url="https://github.com/codefrog-app/codefrog.git",
+            active=True,
+            private=False,
+        )
+        for day, merged in ((1, 2), (2, 0)):
+            Metric.objects.create(
+                project=cls.project,
+                date=datetime.date(2020, 1, day),
+                metrics={
+                    "complexity": day,
+                    "github_issue_age": 0,
+                    "github_issues_open": 0,
+                    "github_issues_closed": 0,
+                    "github_pull_requests_merged": merged,
+                    "github_pull_requests_cumulative_age": merged * 60 * 60,
+                },
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_same_as_list(self):
+        url = f"/api-internal/projects/{self.project.pk}/metrics/"
+        rows = self.client.get(url).json()["results"]
+        columnar = self.client.get(url, {"format": "columnar"}).json()
+
+        self.assertEqual(len(columnar["dates"]), len(rows))
+        for name in ("complexity", "github_avg_pull_request_age"):
+            self.assertEqual(columnar["series"][name], [row[name] for row in rows])
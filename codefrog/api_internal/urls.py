@@ -15,9 +15,14 @@ projects_router.register(
 projects_router.register(
     r"source-status", views.SourceStatusViewSet, basename="source-status"
 )
+projects_router.register(
+    r"source-tree", views.SourceTreeViewSet, basename="source-tree"
+)
 projects_router.register(
     r"file-status", views.FileStatusViewSet, basename="file-status"
 )
+projects_router.register(r"dashboard", views.DashboardViewSet, basename="dashboard")
+projects_router.register(r"export", views.ExportViewSet, basename="export")
 
 # Wire up our API using automatic URL routing.
 # Additionally, we include login URLs for the browsable API.
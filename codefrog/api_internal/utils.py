@@ -1,6 +1,27 @@
+import datetime
+
+import numpy as np
+from dateutil.parser import parse
+from django.utils import timezone
+
+from core.cache import get_or_compute
+from core.models import Metric, Release
+from core.utils import (
+    downsample_metrics,
+    get_day_range,
+    resample_metrics,
+    resample_releases,
+)
+
 MONTH = 30
 YEAR = 365
 
+STATE_OF_AFFAIRS_DAYS = 14
+
+# The dashboard only includes the top of the source tree and the most changed files.
+DASHBOARD_TREE_DEPTH = 3
+DASHBOARD_FILE_CHANGES = 50
+
 
 def get_best_frequency(date_from, date_to):
     """
@@ -26,3 +47,180 @@ def get_best_frequency(date_from, date_to):
         frequency = "D"
 
     return frequency
+
+
+def get_state_of_affairs_date_range(request):
+    """
+    Return the time period of the state of affairs requested.
+
+    Defaults to the last two weeks.
+    """
+    date_to = timezone.now()
+    date_from = date_to - datetime.timedelta(days=STATE_OF_AFFAIRS_DAYS)
+
+    date_override = request.GET.get("date_from", None)
+    if date_override:
+        date_from = parse(date_override)
+
+    date_override = request.GET.get("date_to", None)
+    if date_override:
+        date_to = parse(date_override)
+
+    return date_from, date_to
+
+
+def get_avg_pull_request_age(df):
+    """
+    Average age of the merged pull requests in hours.
+
+    Vectorized version of `SimpleMetricSerializer.get_github_avg_pull_request_age`.
+    """
+    merged = df["github_pull_requests_merged"].replace(0, np.nan)
+    avg_age = (df["github_pull_requests_cumulative_age"] / merged).fillna(0)
+
+    return avg_age / 60 / 60
+
+
+def get_date_param(request, name):
+    """
+    Return the date given in the query parameter `name` or None.
+    """
+    try:
+        return parse(request.GET.get(name))
+    except (TypeError, ValueError):
+        return None
+
+
+def get_max_points_param(request):
+    """
+    Return the maximum number of points requested or None.
+    """
+    try:
+        return max(int(request.GET.get("max_points")), 1)
+    except (TypeError, ValueError):
+        return None
+
+
+def get_metrics(project, date_from=None, date_to=None, max_points=None):
+    """
+    Return the metrics of the project resampled to the best frequency for the time span.
+
+    If `max_points` is given the daily metrics are downsampled
+    to at most this number of points instead.
+    """
+    kwargs = {
+        "project": project,
+    }
+    if date_from:
+        kwargs["date__gte"] = date_from
+    if date_to:
+        kwargs["date__lte"] = date_to
+
+    def compute():
+        # Get metrics in the desired frequency
+        metrics = (
+            Metric.objects.filter(**kwargs)
+            .order_by("date")
+            .values(
+                "date",
+                "metrics__complexity",
+                "metrics__github_issue_age",
+                "metrics__github_issues_open",
+                "metrics__github_issues_closed",
+                "metrics__github_pull_requests_merged",
+                "metrics__github_pull_requests_cumulative_age",
+            )
+        )
+        if len(metrics) > 0:
+            if max_points:
+                metrics = resample_metrics(metrics, "D")
+                metrics = downsample_metrics(metrics, max_points)
+            else:
+                frequency = get_best_frequency(
+                    metrics[0]["date"], metrics[len(metrics) - 1]["date"]
+                )
+                metrics = resample_metrics(metrics, frequency)
+
+        return list(metrics)
+
+    params = {key: value for key, value in kwargs.items() if key != "project"}
+    params["max_points"] = max_points
+    return get_or_compute(project.pk, "metrics", params, compute)
+
+
+def get_releases(project, date_from=None, date_to=None):
+    """
+    Return the releases of the project resampled to the best frequency for the time span.
+    """
+    kwargs = {
+        "project": project,
+    }
+    timestamp_from, timestamp_to = get_day_range(date_from, date_to)
+    if timestamp_from:
+        kwargs["timestamp__gte"] = timestamp_from
+    if timestamp_to:
+        kwargs["timestamp__lt"] = timestamp_to
+
+    def compute():
+        releases = (
+            Release.objects.filter(**kwargs)
+            .order_by("timestamp")
+            .values(
+                "timestamp",
+                "name",
+            )
+        )
+
+        if len(releases) > 0:
+            frequency = get_best_frequency(
+                releases[0]["timestamp"], releases[len(releases) - 1]["timestamp"]
+            )
+            releases = resample_releases(releases, frequency)
+
+        return list(releases)
+
+    params = {key: value for key, value in kwargs.items() if key != "project"}
+    return get_or_compute(project.pk, "releases", params, compute)
+
+
+def get_file_changes(project, date_from=None, date_to=None, limit=None):
+    """
+    Return the `limit` most changed files of the project in the time span.
+    """
+    date_from = date_from or datetime.date(1970, 1, 1)
+    date_to = date_to or timezone.now().date()
+
+    def compute():
+        return list(project.get_file_changes(date_from, date_to)[:limit])
+
+    params = {"date_from": date_from, "date_to": date_to, "limit": limit}
+    return get_or_compute(project.pk, "file_changes", params, compute)
+
+
+def get_source_tree(project, date_to=None, path=None, depth=1):
+    """
+    Return the source tree of the project below `path`, `depth` levels deep,
+    with the aggregates of its source status (or None if there is none).
+    """
+    date_to = date_to or timezone.now().date()
+
+    def compute():
+        source_status = project.get_source_status(date=date_to)
+        if not source_status:
+            return None
+
+        tree = source_status.get_subtree(path=path, depth=depth)
+        if not tree:
+            return None
+
+        return {
+            "tree": tree,
+            "min_changes": source_status.min_changes,
+            "max_changes": source_status.max_changes,
+            "total_files": source_status.total_files,
+            "total_complexity": source_status.total_complexity,
+            "hotspots": source_status.hotspots,
+        }
+
+    params = {"date_to": date_to, "path": path, "depth": depth}
+    return get_or_compute(project.pk, "source_tree", params, compute)
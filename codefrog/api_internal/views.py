@@ -3,184 +3,90 @@ import os
 
 from dateutil.parser import parse
 from django.db.models import Count
-from django.http import Http404
-from django.shortcuts import get_object_or_404
+from django.http import Http404, StreamingHttpResponse
 from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
 from rest_framework import permissions
 from rest_framework import viewsets
+from rest_framework.response import Response
 
+from api_internal.mixins import ColumnarMixin, ConditionalGetMixin, ProjectMixin
+from api_internal.pagination import KeysetPagination
 from api_internal.serializers import (
+    DashboardSerializer,
     SimpleMetricSerializer,
     ProjectSerializer,
     ReleaseSerializer,
     FileChangesSerializer,
     SourceStatusSerializer,
+    SourceTreeSerializer,
     FileStatusSerializer,
 )
-from api_internal.utils import get_best_frequency
-from core.models import Metric, Project, Release, SourceNode
-from core.utils import resample_metrics, resample_releases
+from api_internal.utils import (
+    DASHBOARD_FILE_CHANGES,
+    DASHBOARD_TREE_DEPTH,
+    get_avg_pull_request_age,
+    get_date_param,
+    get_file_changes,
+    get_max_points_param,
+    get_metrics,
+    get_releases,
+    get_source_tree,
+    get_state_of_affairs_date_range,
+)
+from core.cache import get_or_compute
+from core.export import EXPORTS, iter_gzip, iter_ndjson
+from core.models import Project, SourceNode
+from core.utils import as_date
 
 
-class MetricViewSet(viewsets.ModelViewSet):
+class MetricViewSet(ConditionalGetMixin, ColumnarMixin, viewsets.ModelViewSet):
     serializer_class = SimpleMetricSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    pagination_class = KeysetPagination
+    keyset_ordering = ["date"]
+    columnar_date_field = "date"
+    columnar_derived = {
+        "github_avg_pull_request_age": get_avg_pull_request_age,
+    }
 
     def get_queryset(self):
-        project_pk = self.kwargs["project_pk"]
-        user = self.request.user
-        kwargs = {
-            "active": True,
-            "pk": project_pk,
-        }
-        if user.is_authenticated:
-            kwargs["user"] = user
-        else:
-            kwargs["private"] = False
+        project = self.get_project()
+        date_from = get_date_param(self.request, "date_from")
+        date_to = get_date_param(self.request, "date_to")
 
-        # Superusers can see projects from other users
-        if user.is_superuser:
-            del kwargs["user"]
+        max_points = get_max_points_param(self.request)
 
-        project = get_object_or_404(
-            Project,
-            **kwargs,
+        # Only computed if the page is not in the cursor cache already.
+        return SimpleLazyObject(
+            lambda: get_metrics(project, date_from, date_to, max_points)
         )
 
-        # Private projects can only be requested by owner or superuser
-        if project.private and project.user != user and not user.is_superuser:
-            raise Http404("Project does not exist")
 
-        # because we will resample the queryset (
-        # and then we return something that is not a queryset)
-        # we need to filter by hand.
-        kwargs = {
-            "project": project,
-        }
-        try:
-            kwargs["date__gte"] = parse(self.request.GET.get("date_from"))
-        except (TypeError, ValueError):
-            pass
-
-        try:
-            kwargs["date__lte"] = parse(self.request.GET.get("date_to"))
-        except (TypeError, ValueError):
-            pass
-
-        # Get metrics in the desired frequency
-        metrics = (
-            Metric.objects.filter(**kwargs)
-            .order_by("date")
-            .values(
-                "date",
-                "metrics__complexity",
-                "metrics__github_issue_age",
-                "metrics__github_issues_open",
-                "metrics__github_issues_closed",
-                "metrics__github_pull_requests_merged",
-                "metrics__github_pull_requests_cumulative_age",
-            )
-        )
-        if len(metrics) > 0:
-            frequency = get_best_frequency(
-                metrics[0]["date"], metrics[len(metrics) - 1]["date"]
-            )
-            metrics = resample_metrics(metrics, frequency)
-
-        return metrics
-
-
-class ReleaseViewSet(viewsets.ModelViewSet):
+class ReleaseViewSet(ConditionalGetMixin, ColumnarMixin, viewsets.ModelViewSet):
     serializer_class = ReleaseSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    pagination_class = KeysetPagination
+    keyset_ordering = ["timestamp"]
+    columnar_date_field = "timestamp"
 
     def get_queryset(self):
-        project_pk = self.kwargs["project_pk"]
-        user = self.request.user
-        kwargs = {
-            "active": True,
-            "pk": project_pk,
-        }
-        if user.is_authenticated:
-            kwargs["user"] = user
-        else:
-            kwargs["private"] = False
-
-        # Superusers can see projects from other users
-        if user.is_superuser:
-            del kwargs["user"]
-
-        project = get_object_or_404(
-            Project,
-            **kwargs,
-        )
+        project = self.get_project()
+        date_from = get_date_param(self.request, "date_from")
+        date_to = get_date_param(self.request, "date_to")
 
-        # Private projects can only be requested by owner or superuser
-        if project.private and project.user != user and not user.is_superuser:
-            raise Http404("Project does not exist")
+        # Only computed if the page is not in the cursor cache already.
+        return SimpleLazyObject(lambda: get_releases(project, date_from, date_to))
 
-        # because we will resample the queryset (
-        # and then we return something that is not a queryset)
-        # we need to filter by hand.
-        kwargs = {
-            "project": project,
-        }
-        try:
-            kwargs["timestamp__date__gte"] = parse(self.request.GET.get("date_from"))
-        except (TypeError, ValueError):
-            pass
 
-        try:
-            kwargs["timestamp__date__lte"] = parse(self.request.GET.get("date_to"))
-        except (TypeError, ValueError):
-            pass
-
-        releases = (
-            Release.objects.filter(**kwargs)
-            .order_by("timestamp")
-            .values(
-                "timestamp",
-                "name",
-            )
-        )
-
-        if len(releases) > 0:
-            frequency = get_best_frequency(
-                releases[0]["timestamp"], releases[len(releases) - 1]["timestamp"]
-            )
-            releases = resample_releases(releases, frequency)
-
-        return releases
-
-
-class FileChangesViewSet(viewsets.ModelViewSet):
+class FileChangesViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     serializer_class = FileChangesSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    pagination_class = KeysetPagination
+    keyset_ordering = ["-change_count", "file_path"]
 
     def get_queryset(self):
-        project_pk = self.kwargs["project_pk"]
-        user = self.request.user
-        kwargs = {
-            "active": True,
-            "pk": project_pk,
-        }
-        if user.is_authenticated:
-            kwargs["user"] = user
-        else:
-            kwargs["private"] = False
-
-        # Superusers can see projects from other users
-        if user.is_superuser:
-            del kwargs["user"]
-
-        project = get_object_or_404(
-            Project,
-            **kwargs,
-        )
-
-        # Private projects can only be requested by owner or superuser
-        if project.private and project.user != user and not user.is_superuser:
-            raise Http404("Project does not exist")
+        project = self.get_project()
 
         try:
             date_from = parse(self.request.GET.get("date_from"))
@@ -196,35 +102,13 @@ class FileChangesViewSet(viewsets.ModelViewSet):
         return changes
 
 
-class SourceStatusViewSet(viewsets.ModelViewSet):
+class SourceStatusViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     serializer_class = SourceStatusSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
     pagination_class = None
 
     def get_queryset(self):
-        project_pk = self.kwargs["project_pk"]
-        user = self.request.user
-        kwargs = {
-            "active": True,
-            "pk": project_pk,
-        }
-        if user.is_authenticated:
-            kwargs["user"] = user
-        else:
-            kwargs["private"] = False
-
-        # Superusers can see projects from other users
-        if user.is_superuser:
-            del kwargs["user"]
-
-        project = get_object_or_404(
-            Project,
-            **kwargs,
-        )
-
-        # Private projects can only be requested by owner or superuser
-        if project.private and project.user != user and not user.is_superuser:
-            raise Http404("Project does not exist")
+        project = self.get_project()
 
         try:
             date_to = parse(self.request.GET.get("date_to"))
@@ -240,32 +124,42 @@ class SourceStatusViewSet(viewsets.ModelViewSet):
         ]
 
 
-class FileStatusViewSet(viewsets.ModelViewSet):
-    serializer_class = FileStatusSerializer
+class SourceTreeViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
+    serializer_class = SourceTreeSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
     pagination_class = None
 
     def get_queryset(self):
-        project_pk = self.kwargs["project_pk"]
-        user = self.request.user
-        kwargs = {
-            "active": True,
-            "pk": project_pk,
-        }
-        if user.is_authenticated:
-            kwargs["user"] = user
-        else:
-            kwargs["private"] = False
+        project = self.get_project()
 
-        # Superusers can see projects from other users
-        if user.is_superuser:
-            del kwargs["user"]
+        try:
+            date_to = parse(self.request.GET.get("date_to"))
+        except (TypeError, ValueError):
+            date_to = timezone.now().date()
+
+        try:
+            depth = max(int(self.request.GET.get("depth")), 0)
+        except (TypeError, ValueError):
+            depth = 1
 
-        project = get_object_or_404(Project, **kwargs)
+        source_tree = get_source_tree(
+            project, date_to, path=self.request.GET.get("path"), depth=depth
+        )
+        if not source_tree:
+            return []
 
-        # Private projects can only be requested by owner or superuser
-        if project.private and project.user != user and not user.is_superuser:
-            raise Http404("Project does not exist")
+        return [
+            source_tree,
+        ]
+
+
+class FileStatusViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
+    serializer_class = FileStatusSerializer
+    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    pagination_class = None
+
+    def get_queryset(self):
+        project = self.get_project()
 
         try:
             date_from = parse(self.request.GET.get("date_from"))
@@ -281,6 +175,15 @@ class FileStatusViewSet(viewsets.ModelViewSet):
         if not path:
             return []
 
+        params = {"path": path, "date_from": date_from, "date_to": date_to}
+        return get_or_compute(
+            project.pk,
+            "file_status",
+            params,
+            lambda: self.get_file_status(project, path, date_from, date_to),
+        )
+
+    def get_file_status(self, project, path, date_from, date_to):
         is_file = (
             SourceNode.objects.get(
                 source_status=project.current_source_status,
@@ -302,8 +205,8 @@ class FileStatusViewSet(viewsets.ModelViewSet):
             # Number of commits in the given time period
             code_changes = (
                 project.codechange_set.filter(
-                    timestamp__date__gte=date_from,
-                    timestamp__date__lte=date_to,
+                    day__gte=as_date(date_from),
+                    day__lte=as_date(date_to),
                     file_path=path,
                 )
                 .values("author")
@@ -322,8 +225,8 @@ class FileStatusViewSet(viewsets.ModelViewSet):
             # Number of commits in the given time period
             code_changes = (
                 project.codechange_set.filter(
-                    timestamp__date__gte=date_from,
-                    timestamp__date__lte=date_to,
+                    day__gte=as_date(date_from),
+                    day__lte=as_date(date_to),
                     file_path__startswith=path,
                 )
                 .values("author")
@@ -366,6 +269,70 @@ class FileStatusViewSet(viewsets.ModelViewSet):
         ]
 
 
+class DashboardViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
+    """
+    All data needed for the evolution diagrams of a project in one response.
+    """
+
+    serializer_class = DashboardSerializer
+    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    pagination_class = None
+
+    def get_queryset(self):
+        project = self.get_project()
+        date_from = get_date_param(self.request, "date_from")
+        date_to = get_date_param(self.request, "date_to")
+
+        # Only the top of the source tree and the most changed files,
+        # the rest is loaded from their own endpoints when needed.
+        json = {
+            "project": project,
+            "metrics": get_metrics(
+                project, date_from, date_to, get_max_points_param(self.request)
+            ),
+            "releases": get_releases(project, date_from, date_to),
+            "file_changes": get_file_changes(
+                project, date_from, date_to, limit=DASHBOARD_FILE_CHANGES
+            ),
+            "source_status": get_source_tree(
+                project, date_to, depth=DASHBOARD_TREE_DEPTH
+            ),
+        }
+
+        return [
+            json,
+        ]
+
+
+class ExportViewSet(ProjectMixin, viewsets.ViewSet):
+    """
+    Streams the raw data of a project as newline delimited JSON.
+
+    `/export/<table>/` with table one of `EXPORTS`, `?gzip=1` to compress.
+    """
+
+    permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+
+    def retrieve(self, request, pk=None, project_pk=None):
+        project = self.get_project()
+        if pk not in EXPORTS:
+            raise Http404("Unknown export")
+
+        chunks = iter_ndjson(project.pk, pk)
+        filename = f"{project.slug}-{pk}.ndjson"
+        content_type = "application/x-ndjson"
+
+        if request.GET.get("gzip"):
+            chunks = iter_gzip(chunks)
+            filename = f"{filename}.gz"
+            content_type = "application/gzip"
+
+        response = StreamingHttpResponse(chunks, content_type=content_type)
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+
+        return response
+
+
 class ProjectViewSet(viewsets.ModelViewSet):
     serializer_class = ProjectSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
@@ -386,3 +353,21 @@ class ProjectViewSet(viewsets.ModelViewSet):
 
         projects = Project.objects.filter(**kwargs)
         return projects
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+
+        page = self.paginate_queryset(queryset)
+        projects = page if page is not None else list(queryset)
+
+        date_from, date_to = get_state_of_affairs_date_range(request)
+        context = self.get_serializer_context()
+        context["state_of_affairs"] = Project.get_state_of_affairs_for_projects(
+            projects, date_from, date_to
+        )
+
+        serializer = self.get_serializer(projects, many=True, context=context)
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+
+        return Response(serializer.data)
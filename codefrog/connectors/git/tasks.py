@@ -6,11 +6,15 @@ from collections import defaultdict
 import structlog
 from celery import shared_task
 from dateutil.parser import parse
+from django.conf import settings
 
 from connectors.github.utils import get_access_token
+from core.bulk import merge_rows
+from core.cache import lock
 from core.models import Project, Release, STATUS_UPDATING
 from core.utils import run_shell_command, log, make_one
-from engine.models import CodeChange
+from engine.models import CodeChange, Issue, get_day, get_issue_refid
+from engine.tasks import calculate_code_complexity, calculate_code_metrics
 
 logger = structlog.get_logger(__name__)
 
@@ -47,25 +51,30 @@ def clone_repo(project_id, *args, **kwargs):
         installation_id = project.user.profile.github_app_installation_refid
         installation_access_token = get_access_token(installation_id)
 
-    if os.path.exists(project.repo_dir):
-        logger.info("Project(%s): Repo Exists. Start pulling new changes.", project_id)
-        cmd = f"git pull"
-        run_shell_command(cmd, cwd=project.repo_dir)
-        logger.info("Project(%s): Finished pulling new changes.", project_id)
-    else:
-        logger.info("Project(%s): Start cloning.", project_id)
-        if installation_access_token:
-            git_url = git_url.replace(
-                "https://", f"https://x-access-token:{installation_access_token}@"
+    # Pushes can be imported at the same time,
+    # but git fails if another process is pulling into the same repository.
+    with lock(f"repo:{project_id}", timeout=settings.REPO_LOCK_TIMEOUT):
+        if os.path.exists(project.repo_dir):
+            logger.info(
+                "Project(%s): Repo Exists. Start pulling new changes.", project_id
             )
-
-        cmd = f'git clone -q "{git_url}" "{project.repo_dir}"'
-        run_shell_command(cmd)
-        logger.info("Project(%s): Finished cloning.", project_id)
-
-    logger.info("Project(%s): Getting branch name.", project_id)
-    cmd = f"git rev-parse --abbrev-ref HEAD"
-    branch_name = run_shell_command(cmd, cwd=project.repo_dir).strip()
+            cmd = f"git pull"
+            run_shell_command(cmd, cwd=project.repo_dir)
+            logger.info("Project(%s): Finished pulling new changes.", project_id)
+        else:
+            logger.info("Project(%s): Start cloning.", project_id)
+            if installation_access_token:
+                git_url = git_url.replace(
+                    "https://", f"https://x-access-token:{installation_access_token}@"
+                )
+
+            cmd = f'git clone -q "{git_url}" "{project.repo_dir}"'
+            run_shell_command(cmd)
+            logger.info("Project(%s): Finished cloning.", project_id)
+
+        logger.info("Project(%s): Getting branch name.", project_id)
+        cmd = f"git rev-parse --abbrev-ref HEAD"
+        branch_name = run_shell_command(cmd, cwd=project.repo_dir).strip()
     project.git_branch = branch_name
     project.save()
     logger.info("Project(%s): Finished getting branch name.", project_id)
@@ -133,8 +142,11 @@ def import_code_changes(project_id, start_date=None, *args, **kwargs):
             if line
         ]
 
-        for change in code_changes:
-            save_code_changes(*change)
+        # Load the changes of all commits in one go.
+        rows = (
+            row for change in code_changes for row in _get_code_change_rows(*change)
+        )
+        _merge_code_changes(project_id, rows)
 
         logger.info(
             "Project(%s): Finished import_code_changes(%s).", project_id, start_date
@@ -144,6 +156,86 @@ def import_code_changes(project_id, start_date=None, *args, **kwargs):
         return project_id
 
 
+# `before` of a push that created the branch.
+NULL_COMMIT = "0" * 40
+
+
+@shared_task
+def import_commit_range(project_id, before, after, *args, **kwargs):
+    """
+    Imports the code changes of the commits pushed to the repository
+    and recalculates the complexity and the code metrics from the oldest
+    imported commit on.
+
+    A forced push can remove commits, it has to be imported with `import_code_changes`.
+
+    :param before: Commit the branch pointed to before the push.
+    :param after: Commit the branch points to after the push.
+    :return: project_id
+    """
+    logger.info(
+        "Project(%s): Starting import_commit_range(%s..%s).", project_id, before, after
+    )
+    project_id = make_one(project_id)
+    log(project_id, "Importing pushed code changes", "start")
+
+    try:
+        project = Project.objects.get(pk=project_id)
+    except Project.DoesNotExist:
+        logger.warning("Project with id %s not found. ", project_id)
+        logger.info("Project(%s): Finished (aborted) import_commit_range.", project_id)
+        return
+
+    # A new branch has no commit before the push.
+    commit_range = after if before == NULL_COMMIT else f"{before}..{after}"
+
+    with project.get_tmp_repo_dir() as tmp_dir:
+        cmd = (
+            f"git log --reverse --date-order {commit_range}"
+            f' --pretty="%ad;~;%H;~;%aN;~;%aE" --date=iso8601-strict-local'
+        )
+
+        output = run_shell_command(cmd, cwd=tmp_dir)
+        code_changes = [
+            operator.add([project_id, tmp_dir], line.split(";~;"))
+            for line in output.split("\n")
+            if line
+        ]
+
+        rows = (
+            row for change in code_changes for row in _get_code_change_rows(*change)
+        )
+        _merge_code_changes(project_id, rows)
+
+    logger.info(
+        "Project(%s): Finished import_commit_range(%s..%s).", project_id, before, after
+    )
+    log(project_id, "Importing pushed code changes", "stop")
+
+    if code_changes:
+        # Commits can be older than the push (e.g. rebased or merged branches),
+        # the date of the commit is used, not the time it was pushed.
+        start_date = min(parse(change[2]) for change in code_changes)
+        calculate_code_complexity(project_id, start_date=start_date.isoformat())
+        calculate_code_metrics(project_id, start_date=start_date.isoformat())
+
+    return project_id
+
+
+CODE_CHANGE_FIELDS = [
+    "project",
+    "timestamp",
+    "day",
+    "file_path",
+    "author",
+    "complexity_added",
+    "complexity_removed",
+    "description",
+    "git_commit_hash",
+    "issue",
+]
+
+
 @shared_task
 def save_code_changes(
     project_id,
@@ -161,8 +253,46 @@ def save_code_changes(
         git_commit_hash,
     )
 
+    _merge_code_changes(
+        project_id,
+        _get_code_change_rows(
+            project_id,
+            source_dir,
+            timestamp,
+            git_commit_hash,
+            author_name,
+            author_email,
+        ),
+    )
+
+    logger.info(
+        "Project(%s): Finished save_code_changes(%s).",
+        project_id,
+        git_commit_hash,
+    )
+
+
+def _get_code_change_rows(
+    project_id, source_dir, timestamp, git_commit_hash, author_name, author_email
+):
+    """
+    Yields one row (in the order of `CODE_CHANGE_FIELDS`) per file changed in the commit.
+
+    Instead of the issue the rows contain the `issue_refid` of the issue referenced
+    in the commit message (like `CodeChange.save()`), see `_merge_code_changes`.
+    """
+    try:
+        timestamp = parse(timestamp)
+    except ValueError as err:
+        logger.error(
+            "Project(%s): Error saving CodeChange %s: %s",
+            project_id,
+            git_commit_hash,
+            err,
+        )
+        return
+
     # get stats
-    timestamp = parse(timestamp)
     added, removed = _get_complexity_change(source_dir, git_commit_hash)
     file_names = list(set(list(added.keys()) + list(removed.keys())))
 
@@ -170,31 +300,49 @@ def save_code_changes(
     cmd = f"git log --format=%B -n 1 {git_commit_hash}"
     commit_message = run_shell_command(cmd, cwd=source_dir)
 
-    try:
-        for file_name in file_names:
-            logger.debug("Project(%s): CodeChange %s", project_id, timestamp)
-            CodeChange.objects.update_or_create(
-                project_id=project_id,
-                timestamp=timestamp,
-                file_path=file_name,
-                author=f"{author_name} <{author_email}>",
-                complexity_added=added[file_name],
-                complexity_removed=removed[file_name],
-                description=commit_message,
-                git_commit_hash=git_commit_hash,
-            )
-    except ValueError as err:
-        logger.error(
-            "Project(%s): Error saving CodeChange %s: %s",
+    # References to issues in other repositories are not linked (yet).
+    issue_refid = get_issue_refid(commit_message)
+    issue_refid = issue_refid[1:] if issue_refid and issue_refid[0] == "#" else None
+
+    for file_name in file_names:
+        logger.debug("Project(%s): CodeChange %s", project_id, timestamp)
+        yield (
             project_id,
+            timestamp,
+            get_day(timestamp),
+            file_name,
+            f"{author_name} <{author_email}>",
+            added[file_name],
+            removed[file_name],
+            commit_message,
             git_commit_hash,
-            err,
+            issue_refid,
         )
 
-    logger.info(
-        "Project(%s): Finished save_code_changes(%s).",
-        project_id,
-        git_commit_hash,
+
+def _merge_code_changes(project_id, rows):
+    """
+    Inserts or updates the code changes and links them to the referenced issues.
+    """
+    issue_ids = dict(
+        Issue.objects.filter(project_id=project_id).values_list("issue_refid", "pk")
+    )
+    rows = (row[:-1] + (issue_ids.get(row[-1]),) for row in rows)
+
+    return merge_rows(
+        CodeChange,
+        CODE_CHANGE_FIELDS,
+        rows,
+        unique_fields=["project", "git_commit_hash", "file_path"],
+        update_fields=[
+            "timestamp",
+            "day",
+            "author",
+            "complexity_added",
+            "complexity_removed",
+            "description",
+            "issue",
+        ],
     )
 
 
@@ -0,0 +1,65 @@
+from contextlib import contextmanager
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from connectors.git.tasks import import_commit_range
+
+GIT_LOG = """\
+2020-01-03T10:00:00+01:00;~;cccc;~;Anton Pirker;~;anton@ignaz.at
+2020-01-01T23:30:00-02:00;~;aaaa;~;Anton Pirker;~;anton@ignaz.at
+2020-01-02T10:00:00+00:00;~;bbbb;~;Anton Pirker;~;anton@ignaz.at
+"""
+
+
+@contextmanager
+def get_tmp_repo_dir():
+    yield "/tmp/repo"
+
+
+@mock.patch("connectors.git.tasks.log")
+@mock.patch("connectors.git.tasks._merge_code_changes")
+@mock.patch("connectors.git.tasks._get_code_change_rows", return_value=[])
+@mock.patch("connectors.git.tasks.calculate_code_metrics")
+@mock.patch("connectors.git.tasks.calculate_code_complexity")
+@mock.patch("connectors.git.tasks.run_shell_command")
+@mock.patch("connectors.git.tasks.Project.objects.get")
+class ImportCommitRangeTestCase(SimpleTestCase):
+    def test_start_date(
+        self,
+        get_project,
+        run_shell_command,
+        calculate_code_complexity,
+        calculate_code_metrics,
+        *args,
+    ):
+        get_project.return_value = mock.Mock(get_tmp_repo_dir=get_tmp_repo_dir)
+        run_shell_command.return_value = GIT_LOG
+
+        import_commit_range(1, "a" * 40, "b" * 40)
+
+        self.assertIn(f"{'a' * 40}..{'b' * 40}", run_shell_command.call_args[0][0])
+        # The oldest commit, not the last one pushed.
+        calculate_code_complexity.assert_called_once_with(
+            1, start_date="2020-01-01T23:30:00-02:00"
+        )
+        calculate_code_metrics.assert_called_once_with(
+            1, start_date="2020-01-01T23:30:00-02:00"
+        )
+
+    def test_nothing_imported(
+        self,
+        get_project,
+        run_shell_command,
+        calculate_code_complexity,
+        calculate_code_metrics,
+        *args,
+    ):
+        get_project.return_value = mock.Mock(get_tmp_repo_dir=get_tmp_repo_dir)
+        run_shell_command.return_value = ""
+
+        import_commit_range(1, "0" * 40, "b" * 40)
+
+        self.assertNotIn("..", run_shell_command.call_args[0][0])
+        calculate_code_complexity.assert_not_called()
+        calculate_code_metrics.assert_not_called()
@@ -0,0 +1,7 @@
+from django.core.cache import caches
+from django.utils.connection import ConnectionProxy
+
+# The state kept for GitHub (rate limits, access tokens, responses for
+# conditional requests and delivered web hooks) must not be evicted like
+# the analytics in the default cache, so it is kept in its own cache.
+cache = ConnectionProxy(caches, "github")
@@ -0,0 +1,156 @@
+from dateutil.parser import parse
+
+from connectors.github.http import get_session
+from connectors.github.utils import parse_timestamp
+
+# Items per page (the maximum GitHub allows).
+GRAPHQL_PAGE_SIZE = 100
+
+# Only labels up to this number are loaded per issue or pull request.
+GRAPHQL_MAX_LABELS = 100
+
+ISSUES_QUERY = """
+query($owner: String!, $name: String!, $cursor: String, $since: DateTime,
+      $pageSize: Int!, $maxLabels: Int!) {
+  repository(owner: $owner, name: $name) {
+    issues(first: $pageSize, after: $cursor, filterBy: {since: $since},
+           orderBy: {field: CREATED_AT, direction: ASC}) {
+      pageInfo { hasNextPage endCursor }
+      nodes {
+        number
+        createdAt
+        closedAt
+        labels(first: $maxLabels) { nodes { name } }
+      }
+    }
+  }
+}
+"""
+
+PULL_REQUESTS_QUERY = """
+query($owner: String!, $name: String!, $cursor: String,
+      $pageSize: Int!, $maxLabels: Int!) {
+  repository(owner: $owner, name: $name) {
+    pullRequests(first: $pageSize, after: $cursor, states: [CLOSED, MERGED],
+                 orderBy: {field: UPDATED_AT, direction: DESC}) {
+      pageInfo { hasNextPage endCursor }
+      nodes {
+        number
+        createdAt
+        updatedAt
+        mergedAt
+        baseRefName
+        labels(first: $maxLabels) { nodes { name } }
+      }
+    }
+  }
+}
+"""
+
+
+class GraphQLError(Exception):
+    """
+    The GitHub GraphQL API answered with errors.
+    """
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__("; ".join(error.get("message", "") for error in errors))
+
+
+def run_query(gh, query, variables):
+    """
+    Runs a GraphQL query with the installation access token of the client.
+
+    :param gh: Instance of `core.utils.GitHub`.
+    :return: The `data` of the response.
+    """
+    r = get_session().post(
+        f"{gh.api_base_url}/graphql",
+        json={"query": query, "variables": variables},
+        headers={"Authorization": "bearer %s" % gh.installation_access_token},
+        # GraphQL has its own rate limit.
+        cache_scope=f"{gh.cache_scope}:graphql",
+    )
+    r.raise_for_status()
+
+    out = r.json()
+    if out.get("errors"):
+        raise GraphQLError(out["errors"])
+
+    return out["data"]
+
+
+def _get_nodes(gh, query, connection, variables):
+    """
+    Yields the nodes of all pages of a connection of the repository.
+    """
+    variables = dict(
+        variables,
+        cursor=None,
+        pageSize=GRAPHQL_PAGE_SIZE,
+        maxLabels=GRAPHQL_MAX_LABELS,
+    )
+
+    while True:
+        data = run_query(gh, query, variables)
+        page = data["repository"][connection]
+
+        yield from page["nodes"]
+
+        if not page["pageInfo"]["hasNextPage"]:
+            break
+        variables["cursor"] = page["pageInfo"]["endCursor"]
+
+
+def get_issues(gh, repo_owner, repo_name, start_date=None):
+    """
+    Yields all issues (without pull requests) of a repository,
+    optionally only those updated since `start_date`.
+
+    GraphQL needs authentication, so the client must have an installation access token.
+    """
+    if isinstance(start_date, str):
+        start_date = parse(start_date)
+
+    variables = {
+        "owner": repo_owner,
+        "name": repo_name,
+        "since": start_date.isoformat() if start_date else None,
+    }
+
+    for node in _get_nodes(gh, ISSUES_QUERY, "issues", variables):
+        yield {
+            "number": node["number"],
+            "opened_at": parse_timestamp(node["createdAt"]),
+            "closed_at": parse_timestamp(node["closedAt"]),
+            "labels": [label["name"] for label in node["labels"]["nodes"]],
+        }
+
+
+def get_pull_requests(gh, repo_owner, repo_name, updated_since=None):
+    """
+    Yields all closed pull requests of a repository, the last updated first.
+
+    If `updated_since` is given, stops at the first pull request updated before.
+
+    GraphQL needs authentication, so the client must have an installation access token.
+    """
+    variables = {
+        "owner": repo_owner,
+        "name": repo_name,
+    }
+
+    for node in _get_nodes(gh, PULL_REQUESTS_QUERY, "pullRequests", variables):
+        updated_at = parse_timestamp(node["updatedAt"])
+        if updated_since and updated_at < updated_since:
+            break
+
+        yield {
+            "number": node["number"],
+            "opened_at": parse_timestamp(node["createdAt"]),
+            "updated_at": updated_at,
+            "merged_at": parse_timestamp(node["mergedAt"]),
+            "base_ref": node["baseRefName"],
+            "labels": [label["name"] for label in node["labels"]["nodes"]],
+        }
@@ -1,13 +1,37 @@
 import secrets
+from datetime import timedelta
 
 import structlog
+from celery import chain
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.http import HttpResponse
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.text import slugify
 
-from connectors.github.utils import create_check_run, get_access_token
+from connectors.git.tasks import import_code_changes, import_commit_range
+from connectors.github.tasks import (
+    delete_issue,
+    delete_release,
+    run_complexity_check,
+    save_issue,
+    save_pull_request,
+    save_release,
+)
+from connectors.github.utils import (
+    delete_access_token,
+    forget_webhook,
+    is_duplicate_webhook,
+)
 from core.models import Project
+from core.tasks import (
+    get_source_status,
+    save_last_update,
+    update_source_status_with_metrics,
+)
 from core.utils import GitHub
+from engine.tasks import calculate_code_complexity, calculate_code_metrics
 from pullrequestbot import checks
 from web.models import UserProfile
 
@@ -79,6 +103,7 @@ def installation__deleted(payload, request=None):
     # delete github_app_installation_refid id from userprofile
     user.profile.github_app_installation_refid = None
     user.profile.save()
+    delete_access_token(installation_id)
     logger.info(f"- Removed link to GitHub app installation from user {user}.")
 
     logger.info("### FINISHED INSTALLATION / DELETED")
@@ -102,17 +127,185 @@ def installation__new_permissions_accepted(payload, request=None):
     logger.info("### FINISHED INSTALLATION / NEW PERMISSIONS ACCEPTED")
 
 
+def _get_projects(payload):
+    """
+    Returns the active projects of the repository the web hook was sent for.
+    """
+    projects = Project.objects.filter(
+        active=True,
+        git_url=payload["repository"]["clone_url"],
+    )
+    if not projects:
+        logger.warning(
+            "Project not found for Github web hook for repo %s(%s)",
+            payload["repository"]["full_name"],
+            payload["repository"]["id"],
+        )
+
+    return projects
+
+
+def _is_source_status_outdated(project):
+    """
+    Returns if the source status of the project is older than
+    `PUSH_SOURCE_STATUS_INTERVAL`.
+    """
+    source_status = project.current_source_status
+    if not source_status:
+        return True
+
+    interval = timedelta(seconds=settings.PUSH_SOURCE_STATUS_INTERVAL)
+    return source_status.timestamp < timezone.now() - interval
+
+
+def push(payload, request=None):
+    """
+    Imports the commits pushed to the default branch.
+
+    A forced push can remove commits, then all code changes are imported again.
+
+    A new source status is a snapshot of the whole repository, so it is only
+    built if the active one is older than `PUSH_SOURCE_STATUS_INTERVAL`.
+    Otherwise the periodic update of the project builds it.
+    """
+    logger.info("### PUSH")
+    # A forced push without commits can still remove commits.
+    if payload["deleted"] or not (payload["commits"] or payload["forced"]):
+        logger.info("### FINISHED (nothing to import) PUSH")
+        return
+
+    for project in _get_projects(payload):
+        branch = project.git_branch or payload["repository"]["default_branch"]
+        if payload["ref"] != f"refs/heads/{branch}":
+            continue
+
+        if payload["forced"]:
+            tasks = [
+                import_code_changes.s(project.pk),
+                calculate_code_complexity.s(),
+                calculate_code_metrics.s(),
+            ]
+        else:
+            # Also recalculates the complexity and the code metrics
+            # of the imported commits.
+            tasks = [
+                import_commit_range.s(project.pk, payload["before"], payload["after"]),
+            ]
+
+        if _is_source_status_outdated(project):
+            tasks += [
+                get_source_status.s(),
+                update_source_status_with_metrics.s(),
+            ]
+
+        chain(*tasks, save_last_update.s()).apply_async()
+        logger.info(f"- Importing commits pushed to project {project}")
+
+    logger.info("### FINISHED PUSH")
+
+
+def _issue_changed(payload, request=None):
+    logger.info(f"### ISSUES / {payload['action'].upper()}")
+    for project in _get_projects(payload):
+        save_issue.delay(project.pk, payload["issue"])
+        logger.info(f"- Saving issue {payload['issue']['number']} of project {project}")
+
+    logger.info(f"### FINISHED ISSUES / {payload['action'].upper()}")
+
+
+issues__opened = _issue_changed
+issues__edited = _issue_changed
+issues__closed = _issue_changed
+issues__reopened = _issue_changed
+issues__labeled = _issue_changed
+issues__unlabeled = _issue_changed
+
+
+def _issue_removed(payload, request=None):
+    logger.info(f"### ISSUES / {payload['action'].upper()}")
+    for project in _get_projects(payload):
+        delete_issue.delay(project.pk, payload["issue"]["number"])
+        logger.info(
+            f"- Deleting issue {payload['issue']['number']} of project {project}"
+        )
+
+    logger.info(f"### FINISHED ISSUES / {payload['action'].upper()}")
+
+
+issues__deleted = _issue_removed
+# The issue was moved to another repository.
+issues__transferred = _issue_removed
+
+
+def _pull_request_changed(payload, request=None):
+    """
+    Saves closed pull requests, like `import_pull_requests` does.
+    """
+    logger.info(f"### PULL REQUEST / {payload['action'].upper()}")
+    if payload["pull_request"]["state"] != "closed":
+        logger.info(
+            f"### FINISHED (still open) PULL REQUEST / {payload['action'].upper()}"
+        )
+        return
+
+    for project in _get_projects(payload):
+        save_pull_request.delay(project.pk, payload["pull_request"])
+        logger.info(f"- Saving pull request {payload['number']} of project {project}")
+
+    logger.info(f"### FINISHED PULL REQUEST / {payload['action'].upper()}")
+
+
+pull_request__closed = _pull_request_changed
+pull_request__edited = _pull_request_changed
+pull_request__labeled = _pull_request_changed
+pull_request__unlabeled = _pull_request_changed
+
+
+def _release_changed(payload, request=None):
+    logger.info(f"### RELEASE / {payload['action'].upper()}")
+    old_tag_name = payload.get("changes", {}).get("tag_name", {}).get("from")
+    for project in _get_projects(payload):
+        save_release.delay(project.pk, payload["release"], old_tag_name=old_tag_name)
+        logger.info(
+            f"- Saving release {payload['release']['tag_name']} of project {project}"
+        )
+
+    logger.info(f"### FINISHED RELEASE / {payload['action'].upper()}")
+
+
+release__published = _release_changed
+release__released = _release_changed
+release__edited = _release_changed
+
+
+def _release_removed(payload, request=None):
+    logger.info(f"### RELEASE / {payload['action'].upper()}")
+    for project in _get_projects(payload):
+        delete_release.delay(project.pk, payload["release"]["tag_name"])
+        logger.info(
+            f"- Deleting release {payload['release']['tag_name']} of project {project}"
+        )
+
+    logger.info(f"### FINISHED RELEASE / {payload['action'].upper()}")
+
+
+release__deleted = _release_removed
+release__unpublished = _release_removed
+
+
 def check_suite__requested(payload, request=None):
     """
-    Performs the pull request bot check.
+    Queues the pull request bot check.
+
+    The check takes too long to be done while GitHub waits for the response,
+    GitHub is told the web hook was accepted and the check is done by a task.
 
     :param payload:
     :param request:
-    :return:
+    :return: 202 Accepted
     """
     logger.info("Starting check_suite__requested")
     event = "check_suite"
-    action = "requested"
 
     installation_id = payload["installation"]["id"]
     repository_full_name = payload["repository"]["full_name"]
@@ -133,57 +326,30 @@ def check_suite__requested(payload, request=None):
         )
         return
 
-    installation_access_token = get_access_token(installation_id)
-
-    check_run_name = "Complexity Check"
-
-    # Tell Github we queued our check
-    check_run_payload = {
-        "name": check_run_name,
-        "head_sha": commit_sha_after,
-        "status": "queued",
-    }
-    create_check_run(repository_full_name, installation_access_token, check_run_payload)
-    logger.info('Set check to "queued" in Github')
-
-    # Tell Github we started the check
-    check_run_payload = {
-        "name": check_run_name,
-        "head_sha": commit_sha_after,
-        "status": "in_progress",
-    }
-    create_check_run(repository_full_name, installation_access_token, check_run_payload)
-    logger.info('Set check to "in progress" in Github')
-
-    # Perform check
-    logger.info("Performing complexity check")
     details_url = request.build_absolute_uri(
         reverse("project-detail", kwargs={"slug": project.slug})
     )
-    output = checks.perform_complexity_check(
-        project=project,
-        commit_sha_before=commit_sha_before,
-        commit_sha_after=commit_sha_after,
-        project_url=details_url,
-    )
-    logger.info("Finished performing complexity check")
-
-    # Set check to completed and display result
-    check_run_payload = {
-        "name": check_run_name,
-        "status": "completed",
-        "head_sha": commit_sha_after,
-        "details_url": details_url,
-        "conclusion": output["conclusion"],
-        "output": {
-            "title": output["title"],
-            "summary": output["summary"],
-        },
-    }
-    out = create_check_run(
-        repository_full_name, installation_access_token, check_run_payload
-    )
-    logger.info('Told Github the result of the check and set it to "completed".')
+
+    # Check every commit only once, even if GitHub sends more than one check suite.
+    check_key = f"check_suite:{repository_full_name}:{commit_sha_after}"
+    if is_duplicate_webhook(check_key):
+        logger.info(f"Complexity check of {commit_sha_after} already queued")
+        logger.info("Finished check_suite__requested")
+        return HttpResponse(status=202)
+
+    try:
+        run_complexity_check.delay(
+            project.pk,
+            installation_id,
+            repository_full_name,
+            commit_sha_before,
+            commit_sha_after,
+            details_url,
+        )
+    except Exception:
+        forget_webhook(check_key)
+        raise
+    logger.info("Queued complexity check")
 
     logger.info("Finished check_suite__requested")
-    return out
+    return HttpResponse(status=202)
@@ -0,0 +1,167 @@
+import hashlib
+import os
+import time
+
+import requests
+import structlog
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from connectors.github import ratelimit
+from connectors.github.cache import cache
+
+logger = structlog.get_logger(__name__)
+
+# Hosts the GitHub connector talks to (the API and the OAuth endpoints).
+GITHUB_HOSTS = ["https://api.github.com", "https://github.com"]
+
+# Headers of a response that are stored with its body.
+CACHED_HEADERS = ["Content-Type", "Link"]
+
+
+def _http_cache_key(scope, url, params):
+    url = requests.Request("GET", url, params=params).prepare().url
+    digest = hashlib.sha1(f"{scope}:{url}".encode("utf-8")).hexdigest()
+    return f"github:http:{digest}"
+
+
+class GitHubSession(requests.Session):
+    """
+    Session used for all requests to GitHub.
+
+    Connections are kept alive and reused, so only the first request
+    to a host pays for the TCP and TLS handshake.
+
+    GET requests with a `cache_scope` are conditional requests: the body of
+    a response is stored with its `ETag` and `Last-Modified` headers and sent
+    again as `If-None-Match` and `If-Modified-Since`. If GitHub answers with
+    `304 Not Modified` (which does not count against the rate limit),
+    the stored response is returned instead.
+
+    All requests with a `cache_scope` (not only GET requests) are governed by
+    the rate limit of their scope (see `connectors.github.ratelimit`) and are
+    retried if they fail because of a rate limit or a server error.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.headers.update(
+            {
+                "User-Agent": "codefrog",
+                "Accept-Encoding": "gzip, deflate",
+            }
+        )
+
+        # Only failed connections are retried here,
+        # responses with an error status are handled by the caller.
+        retries = Retry(total=3, connect=3, read=0, status=0, backoff_factor=0.5)
+        for host in GITHUB_HOSTS:
+            self.mount(
+                host,
+                HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=settings.GITHUB_HTTP_POOL_SIZE,
+                    max_retries=retries,
+                ),
+            )
+
+    def request(self, method, url, cache_scope=None, **kwargs):
+        """
+        :param cache_scope: Who is allowed to see the response (for example the
+            installation). Responses are only shared by requests with the same scope.
+            GitHub applies rate limits to the same scopes.
+        """
+        kwargs.setdefault("timeout", settings.GITHUB_HTTP_TIMEOUT)
+
+        if cache_scope is None:
+            return super().request(method, url, **kwargs)
+
+        if method.upper() != "GET":
+            return self._governed_request(method, url, cache_scope, **kwargs)
+
+        key = _http_cache_key(cache_scope, url, kwargs.get("params"))
+        cached = cache.get(key)
+
+        headers = dict(kwargs.pop("headers", None) or {})
+        if cached:
+            if cached["etag"]:
+                headers["If-None-Match"] = cached["etag"]
+            if cached["last_modified"]:
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        response = self._governed_request(
+            method, url, cache_scope, headers=headers, **kwargs
+        )
+        response.from_cache = False
+
+        if response.status_code == 304 and cached:
+            logger.debug(f"---> GitHub not modified url={url}")
+            response.status_code = 200
+            response.reason = "OK"
+            response._content = cached["content"]
+            response.headers.update(cached["headers"])
+            response.from_cache = True
+
+        elif response.status_code == 200:
+            etag = response.headers.get("ETag")
+            last_modified = response.headers.get("Last-Modified")
+            if etag or last_modified:
+                cache.set(
+                    key,
+                    {
+                        "etag": etag,
+                        "last_modified": last_modified,
+                        "headers": {
+                            name: response.headers[name]
+                            for name in CACHED_HEADERS
+                            if name in response.headers
+                        },
+                        "content": response.content,
+                    },
+                    timeout=settings.GITHUB_HTTP_CACHE_TIMEOUT,
+                )
+
+        return response
+
+    def _governed_request(self, method, url, scope, **kwargs):
+        for attempt in range(settings.GITHUB_MAX_RETRIES + 1):
+            ratelimit.acquire(scope)
+            response = super().request(method, url, **kwargs)
+            ratelimit.update(scope, response)
+
+            wait = ratelimit.get_retry_wait(response, attempt)
+            if (
+                wait is None
+                or attempt == settings.GITHUB_MAX_RETRIES
+                or wait > ratelimit.get_max_wait()
+            ):
+                break
+
+            logger.warning(
+                f"GitHub request failed with {response.status_code}, "
+                f"retrying in {wait:.0f}s: {url}"
+            )
+            time.sleep(wait)
+
+        return response
+
+
+_session = None
+_session_pid = None
+
+
+def get_session():
+    """
+    Returns the session of the current process.
+
+    The session is created on first use in every process, so Celery worker
+    processes forked from the same parent do not share open connections.
+    """
+    global _session, _session_pid
+
+    if _session is None or _session_pid != os.getpid():
+        _session = GitHubSession()
+        _session_pid = os.getpid()
+
+    return _session
@@ -0,0 +1,244 @@
+import contextvars
+import random
+import time
+from contextlib import contextmanager
+
+import structlog
+from django.conf import settings
+
+from connectors.github.cache import cache
+
+logger = structlog.get_logger(__name__)
+
+# Exponential backoff for server errors (in seconds).
+BACKOFF_BASE = 1
+BACKOFF_MAX = 60
+# GitHub asks to wait at least a minute after hitting a secondary rate limit.
+SECONDARY_RATE_LIMIT_WAIT = 60
+
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# Set while a request to codefrog is handled (see `fail_fast`).
+_fail_fast = contextvars.ContextVar("github_rate_limit_fail_fast", default=False)
+
+
+class RateLimitExceeded(Exception):
+    """
+    The rate limit of a scope is exhausted for longer than the caller can wait.
+    """
+
+    def __init__(self, scope, wait):
+        super().__init__(f"GitHub rate limit of {scope} exhausted for {wait:.0f}s.")
+        self.scope = scope
+        self.wait = wait
+
+
+@contextmanager
+def fail_fast():
+    """
+    Makes the GitHub requests in the block fail fast instead of waiting.
+
+    For requests made while handling a request to codefrog (views and web hooks):
+    they may use the reserve of the rate limit, wait at most
+    `GITHUB_REQUEST_RATE_LIMIT_MAX_WAIT` seconds and raise `RateLimitExceeded`
+    instead of waiting longer. Can also be used as a decorator.
+    """
+    token = _fail_fast.set(True)
+    try:
+        yield
+    finally:
+        _fail_fast.reset(token)
+
+
+def get_max_wait():
+    """
+    Returns the longest time in seconds the current caller waits for the rate limit.
+    """
+    if _fail_fast.get():
+        return settings.GITHUB_REQUEST_RATE_LIMIT_MAX_WAIT
+
+    return settings.GITHUB_RATE_LIMIT_MAX_WAIT
+
+
+def _key(scope, name):
+    return f"github:ratelimit:{scope}:{name}"
+
+
+def _increment(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=None)
+
+
+def _get_wait(scope, reserve):
+    """
+    Takes a token from the bucket of the scope, unless only `reserve` tokens are left.
+
+    :return: Seconds to wait before trying again if no token is left, otherwise 0.
+    """
+    now = time.time()
+
+    blocked_until = cache.get(_key(scope, "blocked_until"))
+    if blocked_until and blocked_until > now:
+        return blocked_until - now
+
+    try:
+        tokens = cache.decr(_key(scope, "tokens"))
+    except ValueError:
+        # Nothing known about the budget (yet) or the rate limit was reset.
+        return 0
+
+    if tokens >= reserve:
+        return 0
+
+    # Give the token back, it is not used.
+    try:
+        cache.incr(_key(scope, "tokens"))
+    except ValueError:
+        pass
+
+    reset = cache.get(_key(scope, "reset")) or now
+    return max(reset - now, 1)
+
+
+def acquire(scope):
+    """
+    Blocks until a request in the scope is allowed by the rate limit.
+
+    All workers share one bucket per scope. It holds as many tokens as GitHub
+    reported remaining requests and is refilled when GitHub resets the limit.
+    The last `GITHUB_RATE_LIMIT_RESERVE` tokens are kept for the requests
+    made in `fail_fast` blocks. Waits at most `get_max_wait()` seconds,
+    in a `fail_fast` block `RateLimitExceeded` is raised instead of waiting longer.
+
+    :return: Seconds waited.
+    """
+    fail_fast = _fail_fast.get()
+    reserve = 0 if fail_fast else settings.GITHUB_RATE_LIMIT_RESERVE
+    max_wait = get_max_wait()
+
+    waited = 0
+    while True:
+        wait = _get_wait(scope, reserve)
+        if not wait:
+            break
+
+        if fail_fast and waited + wait > max_wait:
+            _increment(_key(scope, "throttled"))
+            raise RateLimitExceeded(scope, wait)
+
+        if waited >= max_wait:
+            logger.warning(
+                f"GitHub rate limit of {scope} still exhausted after waiting {waited:.0f}s."
+            )
+            break
+
+        wait = min(wait, max_wait - waited)
+        logger.info(f"GitHub rate limit of {scope} exhausted, waiting {wait:.0f}s.")
+        _increment(_key(scope, "throttled"))
+        time.sleep(wait)
+        waited += wait
+
+    _increment(_key(scope, "requests"))
+    return waited
+
+
+def update(scope, response):
+    """
+    Updates the bucket of the scope from the rate limit headers of a response.
+    """
+    now = time.time()
+    headers = response.headers
+
+    retry_after = headers.get("Retry-After")
+    if retry_after:
+        retry_after = int(retry_after)
+        cache.set(
+            _key(scope, "blocked_until"), now + retry_after, timeout=retry_after + 1
+        )
+
+    if "X-RateLimit-Remaining" not in headers or "X-RateLimit-Reset" not in headers:
+        return
+
+    remaining = int(headers["X-RateLimit-Remaining"])
+    reset = int(headers["X-RateLimit-Reset"])
+
+    # Responses of parallel requests can arrive out of order,
+    # within the same rate limit window the lowest number is the most recent one.
+    if cache.get(_key(scope, "reset")) == reset:
+        tokens = cache.get(_key(scope, "tokens"))
+        if tokens is not None:
+            remaining = min(remaining, tokens)
+
+    timeout = max(int(reset - now), 1)
+    cache.set_many(
+        {
+            _key(scope, "tokens"): remaining,
+            _key(scope, "reset"): reset,
+        },
+        timeout=timeout,
+    )
+
+
+def is_retryable(response):
+    """
+    Returns whether the request failed because of a rate limit or a server error.
+    """
+    if response.status_code in RETRYABLE_STATUS_CODES:
+        return True
+
+    if response.status_code == 403:
+        return (
+            "Retry-After" in response.headers
+            or response.headers.get("X-RateLimit-Remaining") == "0"
+            or b"secondary rate limit" in response.content.lower()
+        )
+
+    return False
+
+
+def get_retry_wait(response, attempt):
+    """
+    Returns the seconds to wait before retrying a failed request
+    or None if the request should not be retried.
+    """
+    if not is_retryable(response):
+        return None
+
+    if "Retry-After" in response.headers:
+        return int(response.headers["Retry-After"])
+
+    if response.headers.get("X-RateLimit-Remaining") == "0":
+        reset = int(response.headers.get("X-RateLimit-Reset", 0))
+        return max(reset - time.time(), 1)
+
+    if response.status_code in (403, 429):
+        # Secondary rate limit
+        wait = SECONDARY_RATE_LIMIT_WAIT * 2**attempt
+        return wait * random.uniform(1, 1.5)
+
+    # Jitter, so workers do not retry all at the same time.
+    wait = min(BACKOFF_BASE * 2**attempt, BACKOFF_MAX)
+    return wait * random.uniform(0.5, 1)
+
+
+def get_rate_limit_stats(scopes):
+    """
+    Return the remaining budget and the number of requests and throttled requests
+    of the given scopes.
+    """
+    names = ("tokens", "reset", "blocked_until", "requests", "throttled")
+    keys = [_key(scope, name) for scope in scopes for name in names]
+    values = cache.get_many(keys)
+
+    return {
+        scope: {
+            "remaining": values.get(_key(scope, "tokens")),
+            "reset": values.get(_key(scope, "reset")),
+            "blocked_until": values.get(_key(scope, "blocked_until")),
+            "requests": values.get(_key(scope, "requests"), 0),
+            "throttled": values.get(_key(scope, "throttled"), 0),
+        }
+        for scope in scopes
+    }
@@ -2,8 +2,13 @@ import json
 from importlib import import_module
 
 import structlog
+from django.http import HttpResponse
 
-from connectors.github.utils import check_github_webhook_secret
+from connectors.github.utils import (
+    check_github_webhook_secret,
+    forget_webhook,
+    is_duplicate_webhook,
+)
 
 
 logger = structlog.get_logger(__name__)
@@ -20,11 +25,19 @@ def github_hook(request):
     logger.info("Starting github_hook")
     event = request.headers["X-Github-Event"]
     payload = json.loads(request.body)
-    action = payload["action"]
+    # Some events (like `push`) have no action.
+    action = payload.get("action")
     logger.info(f"RECEIVED GITHUB HOOK (event/action):  {event}/{action}")
 
+    # Web hooks redelivered by GitHub have the same delivery id.
+    delivery_id = request.headers.get("X-Github-Delivery")
+    if delivery_id and is_duplicate_webhook(f"delivery:{delivery_id}"):
+        msg = f"Github web hook {delivery_id} was already received."
+        logger.info(msg)
+        return HttpResponse(msg, status=202)
+
     handlers_module = import_module("%s.handlers" % __name__.rpartition(".")[0])
-    handler_name = f"{event}__{action}"
+    handler_name = f"{event}__{action}" if action else event
     try:
         handler = getattr(handlers_module, handler_name)
         out = handler(payload, request)
@@ -32,6 +45,11 @@ def github_hook(request):
         msg = f"Could not import handler for Github event: {event} / action: {action}. Error: {err}"
         logger.warning(msg)
         out = msg
+    except Exception:
+        # Let GitHub deliver the web hook again.
+        if delivery_id:
+            forget_webhook(f"delivery:{delivery_id}")
+        raise
 
     logger.info("Finished github_hook")
     return out
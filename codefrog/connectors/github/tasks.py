@@ -1,16 +1,224 @@
-import datetime
+import itertools
 
 import structlog
 from celery import shared_task
 from django.utils import timezone
 
+from connectors.github import graphql
+from connectors.github.utils import (
+    create_check_run,
+    forget_webhook,
+    parse_timestamp,
+)
+from core.bulk import merge_rows
+from core.cache import bump_project_data_version
 from core.models import Project, Release
 from core.utils import GitHub, log, make_one
+from engine.mixins import get_categories
 from engine.models import Issue, OpenIssue, PullRequest
+from engine.tasks import calculate_issue_metrics, calculate_pull_request_metrics
+from pullrequestbot import checks
 from web.models import UserProfile
 
 logger = structlog.get_logger(__name__)
 
+# Number of issues or pull requests written to the database with one statement.
+SAVE_PAGE_SIZE = GitHub.GITHUB_ITEMS_PER_PAGE
+
+ISSUE_FIELDS = [
+    "project",
+    "issue_refid",
+    "opened_at",
+    "closed_at",
+    "labels",
+    "category",
+]
+
+PULL_REQUEST_FIELDS = [
+    "project",
+    "pull_request_refid",
+    "opened_at",
+    "merged_at",
+    "age",
+    "labels",
+    "category",
+]
+
+
+def _get_pages(items, size=SAVE_PAGE_SIZE):
+    """
+    Yields lists of up to `size` items.
+    """
+    items = iter(items)
+    while True:
+        page = list(itertools.islice(items, size))
+        if not page:
+            return
+
+        yield page
+
+
+def _save_issues(project_id, issues, bug_labels):
+    """
+    Inserts or updates a page of issues with one statement.
+    """
+    if not issues:
+        return 0
+
+    categories = get_categories([issue["labels"] for issue in issues], bug_labels)
+    rows = [
+        (
+            project_id,
+            str(issue["number"]),
+            issue["opened_at"],
+            issue["closed_at"],
+            issue["labels"],
+            category,
+        )
+        for issue, category in zip(issues, categories)
+    ]
+
+    return merge_rows(
+        Issue,
+        ISSUE_FIELDS,
+        rows,
+        unique_fields=["project", "issue_refid"],
+        update_fields=["opened_at", "closed_at", "labels", "category"],
+    )
+
+
+def _save_pull_requests(project_id, pull_requests, bug_labels):
+    """
+    Inserts or updates a page of pull requests with one statement.
+    """
+    if not pull_requests:
+        return 0
+
+    categories = get_categories(
+        [pull_request["labels"] for pull_request in pull_requests], bug_labels
+    )
+
+    rows = []
+    for pull_request, category in zip(pull_requests, categories):
+        opened_at = pull_request["opened_at"]
+        merged_at = pull_request["merged_at"]
+
+        if merged_at:
+            age = (merged_at - opened_at).seconds
+        else:
+            age = None
+
+        rows.append(
+            (
+                project_id,
+                str(pull_request["number"]),
+                opened_at,
+                merged_at,
+                age,
+                pull_request["labels"],
+                category,
+            )
+        )
+
+    return merge_rows(
+        PullRequest,
+        PULL_REQUEST_FIELDS,
+        rows,
+        unique_fields=["project", "pull_request_refid"],
+        update_fields=["opened_at", "merged_at", "age", "labels", "category"],
+    )
+
+
+def _get_labels(item):
+    try:
+        return [label["name"] for label in item["labels"]]
+    except TypeError:
+        return []
+
+
+def _parse_rest_issue(issue):
+    """
+    Returns an issue of the REST API (or of a web hook)
+    in the same format as `graphql.get_issues`.
+    """
+    return {
+        "number": issue["number"],
+        "opened_at": parse_timestamp(issue["created_at"]),
+        "closed_at": parse_timestamp(issue["closed_at"]),
+        "labels": _get_labels(issue),
+    }
+
+
+def _parse_rest_pull_request(pull_request):
+    """
+    Returns a pull request of the REST API (or of a web hook)
+    in the same format as `graphql.get_pull_requests`.
+    """
+    return {
+        "number": pull_request["number"],
+        "opened_at": parse_timestamp(pull_request["created_at"]),
+        "updated_at": parse_timestamp(pull_request["updated_at"]),
+        "merged_at": parse_timestamp(pull_request["merged_at"]),
+        "base_ref": pull_request["base"]["ref"],
+        "labels": _get_labels(pull_request),
+    }
+
+
+def _get_first_change(old_values, new_values):
+    """
+    Returns the earliest of the timestamps that changed or None if nothing changed.
+    """
+    changed = [
+        value
+        for old_value, new_value in zip(old_values, new_values)
+        if old_value != new_value
+        for value in (old_value, new_value)
+        if value
+    ]
+    return min(changed) if changed else None
+
+
+def _data_changed(project_id):
+    """
+    Marks the data of the project as changed by a web hook, so the cached
+    analytics are recalculated and conditional requests do not get a
+    `304 Not Modified` with the old data.
+    """
+    Project.objects.filter(pk=project_id).update(last_update=timezone.now())
+    bump_project_data_version(project_id)
+
+
+def _get_rest_issues(gh, repo_owner, repo_name, start_date=None):
+    """
+    Yields the issues of a repository from the REST API
+    in the same format as `graphql.get_issues`.
+    """
+    issues = gh.get_issues(
+        repo_owner=repo_owner,
+        repo_name=repo_name,
+        start_date=start_date,
+    )
+    for issue in issues:
+        is_pull_request = "pull_request" in issue
+        if is_pull_request:
+            continue
+
+        yield _parse_rest_issue(issue)
+
+
+def _get_rest_pull_requests(gh, repo_owner, repo_name, updated_since=None):
+    """
+    Yields the closed pull requests of a repository from the REST API
+    in the same format as `graphql.get_pull_requests`.
+    """
+    pull_requests = gh.get_pull_requests(
+        repo_owner=repo_owner,
+        repo_name=repo_name,
+        updated_since=updated_since,
+    )
+    for pull_request in pull_requests:
+        yield _parse_rest_pull_request(pull_request)
+
 
 @shared_task
 def import_issues(project_id, start_date=None, *args, **kwargs):
@@ -32,43 +240,28 @@ def import_issues(project_id, start_date=None, *args, **kwargs):
 
     gh = GitHub(installation_id=installation_id)
 
-    issues = gh.get_issues(
-        repo_owner=project.github_repo_owner,
-        repo_name=project.github_repo_name,
-        start_date=start_date,
-    )
+    if gh.installation_access_token:
+        issues = graphql.get_issues(
+            gh,
+            repo_owner=project.github_repo_owner,
+            repo_name=project.github_repo_name,
+            start_date=start_date,
+        )
+    else:
+        # GraphQL needs authentication, public repositories are read using REST.
+        issues = _get_rest_issues(
+            gh,
+            repo_owner=project.github_repo_owner,
+            repo_name=project.github_repo_name,
+            start_date=start_date,
+        )
 
-    for issue in issues:
-        is_pull_request = "pull_request" in issue
-        if not is_pull_request:
-            try:
-                labels = [label["name"] for label in issue["labels"]]
-            except TypeError:
-                labels = []
-
-            opened_at = datetime.datetime.strptime(
-                issue["created_at"],
-                "%Y-%m-%dT%H:%M:%SZ",
-            ).replace(tzinfo=timezone.utc)
-
-            if issue["closed_at"]:
-                closed_at = datetime.datetime.strptime(
-                    issue["closed_at"],
-                    "%Y-%m-%dT%H:%M:%SZ",
-                ).replace(tzinfo=timezone.utc)
-            else:
-                closed_at = None
-
-            raw_issue, created = Issue.objects.update_or_create(
-                project_id=project_id,
-                issue_refid=issue["number"],
-                opened_at=opened_at,
-                defaults={
-                    "closed_at": closed_at,
-                    "labels": labels,
-                },
-            )
-            logger.debug(f"{raw_issue}: created: {created}")
+    bug_labels = project.get_bug_labels()
+    count = 0
+    for page in _get_pages(issues):
+        count += _save_issues(project_id, page, bug_labels)
+
+    logger.debug("Project(%s): %s issues saved.", project_id, count)
 
     logger.info(
         "Project(%s): Finished import_issues. (%s)",
@@ -114,16 +307,11 @@ def import_open_issues(project_id, *args, **kwargs):
     for issue in issues:
         is_pull_request = "pull_request" in issue
         if not is_pull_request:
-            try:
-                labels = [label["name"] for label in issue["labels"]]
-            except TypeError:
-                labels = []
-
             OpenIssue.objects.create(
                 project_id=project_id,
                 issue_refid=issue["number"],
                 query_time=timezone.now(),
-                labels=labels,
+                labels=_get_labels(issue),
             )
 
     logger.info(
@@ -212,55 +400,317 @@ def import_pull_requests(project_id, *args, **kwargs):
 
     gh = GitHub(installation_id=installation_id)
 
-    pull_requests = gh.get_pull_requests(
-        repo_owner=project.github_repo_owner,
-        repo_name=project.github_repo_name,
+    # Only pull requests updated since the last import are loaded.
+    updated_since = project.pull_requests_updated_at
+
+    if gh.installation_access_token:
+        pull_requests = graphql.get_pull_requests(
+            gh,
+            repo_owner=project.github_repo_owner,
+            repo_name=project.github_repo_name,
+            updated_since=updated_since,
+        )
+    else:
+        # GraphQL needs authentication, public repositories are read using REST.
+        pull_requests = _get_rest_pull_requests(
+            gh,
+            repo_owner=project.github_repo_owner,
+            repo_name=project.github_repo_name,
+            updated_since=updated_since,
+        )
+
+    bug_labels = project.get_bug_labels()
+    count = 0
+    last_updated_at = updated_since
+    for page in _get_pages(pull_requests):
+        updated = [pull_request["updated_at"] for pull_request in page]
+        if last_updated_at:
+            updated.append(last_updated_at)
+        last_updated_at = max(updated)
+
+        page = [
+            pull_request
+            for pull_request in page
+            if pull_request["base_ref"] == project.git_branch
+        ]
+        count += _save_pull_requests(project_id, page, bug_labels)
+
+    logger.debug("Project(%s): %s pull requests saved.", project_id, count)
+
+    # Only move the watermark after all pull requests are saved.
+    Project.objects.filter(pk=project_id).update(
+        pull_requests_updated_at=last_updated_at
     )
 
-    for pull_request in pull_requests:
-        is_merge_into_default_branch = project.git_branch == pull_request["base"]["ref"]
-        if not is_merge_into_default_branch:
-            continue
+    logger.info(
+        "Project(%s): Finished import_pull_requests.",
+        project_id,
+    )
+    log(project_id, "Importing Github pull requests", "stop")
+
+    return project_id
 
-        opened_at = datetime.datetime.strptime(
-            pull_request["created_at"],
-            "%Y-%m-%dT%H:%M:%SZ",
-        ).replace(tzinfo=timezone.utc)
 
-        if pull_request["merged_at"]:
-            merged_at = datetime.datetime.strptime(
-                pull_request["merged_at"],
-                "%Y-%m-%dT%H:%M:%SZ",
-            ).replace(tzinfo=timezone.utc)
-        else:
-            merged_at = None
+@shared_task
+def save_issue(project_id, issue, *args, **kwargs):
+    """
+    Inserts or updates one issue sent by a GitHub web hook
+    and recalculates the issue metrics of the days that changed.
 
-        if merged_at:
-            age = (merged_at - opened_at).seconds
-        else:
-            age = None
+    :param issue: The issue as sent in the web hook.
+    """
+    logger.info("Project(%s): Starting save_issue(%s).", project_id, issue["number"])
 
-        try:
-            labels = [label["name"] for label in pull_request["labels"]]
-        except TypeError:
-            labels = []
+    try:
+        project = Project.objects.get(pk=project_id)
+    except Project.DoesNotExist:
+        logger.warning("Project with id %s not found. ", project_id)
+        logger.info("Project(%s): Finished (aborted) save_issue.", project_id)
+        return
 
-        raw_pull_request, created = PullRequest.objects.update_or_create(
-            project_id=project_id,
-            pull_request_refid=pull_request["number"],
-            opened_at=opened_at,
-            defaults={
-                "merged_at": merged_at,
-                "age": age,
-                "labels": labels,
-            },
+    issue = _parse_rest_issue(issue)
+    old_issue = Issue.objects.filter(
+        project_id=project_id, issue_refid=str(issue["number"])
+    ).first()
+
+    if old_issue:
+        old_values = (old_issue.opened_at, old_issue.closed_at)
+    else:
+        old_values = (None, None)
+
+    _save_issues(project_id, [issue], project.get_bug_labels())
+
+    # Labels are not part of the metrics, only the days changed by
+    # opening or closing the issue are recalculated.
+    start_date = _get_first_change(old_values, (issue["opened_at"], issue["closed_at"]))
+    if start_date:
+        calculate_issue_metrics(project_id, start_date=start_date)
+
+    _data_changed(project_id)
+
+    logger.info("Project(%s): Finished save_issue(%s).", project_id, issue["number"])
+
+    return project_id
+
+
+@shared_task
+def delete_issue(project_id, number, *args, **kwargs):
+    """
+    Deletes one issue and recalculates the issue metrics of the days that changed.
+    """
+    logger.info("Project(%s): Starting delete_issue(%s).", project_id, number)
+
+    old_issue = Issue.objects.filter(
+        project_id=project_id, issue_refid=str(number)
+    ).first()
+
+    if old_issue:
+        old_issue.delete()
+        calculate_issue_metrics(project_id, start_date=old_issue.opened_at)
+        _data_changed(project_id)
+
+    logger.info("Project(%s): Finished delete_issue(%s).", project_id, number)
+
+    return project_id
+
+
+@shared_task
+def save_pull_request(project_id, pull_request, *args, **kwargs):
+    """
+    Inserts or updates one closed pull request sent by a GitHub web hook
+    and recalculates the pull request metrics of the days that changed.
+
+    :param pull_request: The pull request as sent in the web hook.
+    """
+    logger.info(
+        "Project(%s): Starting save_pull_request(%s).",
+        project_id,
+        pull_request["number"],
+    )
+
+    try:
+        project = Project.objects.get(pk=project_id)
+    except Project.DoesNotExist:
+        logger.warning("Project with id %s not found. ", project_id)
+        logger.info("Project(%s): Finished (aborted) save_pull_request.", project_id)
+        return
+
+    pull_request = _parse_rest_pull_request(pull_request)
+    if pull_request["base_ref"] != project.git_branch:
+        logger.info(
+            "Project(%s): Finished (skipped) save_pull_request(%s).",
+            project_id,
+            pull_request["number"],
         )
-        logger.debug(f"{raw_pull_request}: created: {created}")
+        return
+
+    old_pull_request = PullRequest.objects.filter(
+        project_id=project_id, pull_request_refid=str(pull_request["number"])
+    ).first()
+
+    if old_pull_request:
+        old_values = (old_pull_request.merged_at,)
+    else:
+        old_values = (None,)
+
+    _save_pull_requests(project_id, [pull_request], project.get_bug_labels())
+
+    # The metrics only count merged pull requests on the day they were merged.
+    start_date = _get_first_change(old_values, (pull_request["merged_at"],))
+    if start_date:
+        calculate_pull_request_metrics(project_id, start_date=start_date)
+
+    _data_changed(project_id)
 
     logger.info(
-        "Project(%s): Finished import_pull_requests.",
+        "Project(%s): Finished save_pull_request(%s).",
         project_id,
+        pull_request["number"],
+    )
+
+    return project_id
+
+
+@shared_task
+def save_release(project_id, release, old_tag_name=None, *args, **kwargs):
+    """
+    Inserts or updates one release sent by a GitHub web hook.
+
+    :param release: The release as sent in the web hook.
+    :param old_tag_name: Tag name of the release before it was edited.
+    """
+    logger.info(
+        "Project(%s): Starting save_release(%s).", project_id, release["tag_name"]
+    )
+
+    Release.objects.filter(
+        project_id=project_id,
+        type="github_release",
+        name__in=[release["tag_name"], old_tag_name],
+    ).delete()
+
+    # Drafts are not published yet.
+    if release["published_at"]:
+        Release.objects.create(
+            project_id=project_id,
+            timestamp=release["published_at"],
+            type="github_release",
+            name=release["tag_name"],
+            url=release["html_url"],
+        )
+
+    _data_changed(project_id)
+
+    logger.info(
+        "Project(%s): Finished save_release(%s).", project_id, release["tag_name"]
+    )
+
+    return project_id
+
+
+@shared_task
+def delete_release(project_id, tag_name, *args, **kwargs):
+    """
+    Deletes one release.
+    """
+    logger.info("Project(%s): Starting delete_release(%s).", project_id, tag_name)
+
+    Release.objects.filter(
+        project_id=project_id,
+        type="github_release",
+        name=tag_name,
+    ).delete()
+
+    _data_changed(project_id)
+
+    logger.info("Project(%s): Finished delete_release(%s).", project_id, tag_name)
+
+    return project_id
+
+
+CHECK_RUN_NAME = "Complexity Check"
+
+
+@shared_task
+def run_complexity_check(
+    project_id,
+    installation_id,
+    repository_full_name,
+    commit_sha_before,
+    commit_sha_after,
+    details_url,
+    *args,
+    **kwargs,
+):
+    """
+    Performs the pull request bot check of a check suite
+    and reports its progress and result to GitHub.
+
+    Runs on the `high` queue (see `CELERY_TASK_ROUTES`).
+
+    :param details_url: URL of the project shown with the result.
+    """
+    logger.info(
+        "Project(%s): Starting run_complexity_check(%s).", project_id, commit_sha_after
+    )
+
+    try:
+        project = Project.objects.get(pk=project_id)
+    except Project.DoesNotExist:
+        logger.warning("Project with id %s not found. ", project_id)
+        logger.info("Project(%s): Finished (aborted) run_complexity_check.", project_id)
+        return
+
+    try:
+        # Tell Github we queued our check
+        check_run_payload = {
+            "name": CHECK_RUN_NAME,
+            "head_sha": commit_sha_after,
+            "status": "queued",
+        }
+        create_check_run(installation_id, repository_full_name, check_run_payload)
+        logger.info('Set check to "queued" in Github')
+
+        # Tell Github we started the check
+        check_run_payload = {
+            "name": CHECK_RUN_NAME,
+            "head_sha": commit_sha_after,
+            "status": "in_progress",
+        }
+        create_check_run(installation_id, repository_full_name, check_run_payload)
+        logger.info('Set check to "in progress" in Github')
+
+        # Perform check
+        logger.info("Performing complexity check")
+        output = checks.perform_complexity_check(
+            project=project,
+            commit_sha_before=commit_sha_before,
+            commit_sha_after=commit_sha_after,
+            project_url=details_url,
+        )
+        logger.info("Finished performing complexity check")
+
+        # Set check to completed and display result
+        check_run_payload = {
+            "name": CHECK_RUN_NAME,
+            "status": "completed",
+            "head_sha": commit_sha_after,
+            "details_url": details_url,
+            "conclusion": output["conclusion"],
+            "output": {
+                "title": output["title"],
+                "summary": output["summary"],
+            },
+        }
+        create_check_run(installation_id, repository_full_name, check_run_payload)
+        logger.info('Told Github the result of the check and set it to "completed".')
+    except Exception:
+        # The check suite of the commit can be requested again.
+        forget_webhook(f"check_suite:{repository_full_name}:{commit_sha_after}")
+        raise
+
+    logger.info(
+        "Project(%s): Finished run_complexity_check(%s).", project_id, commit_sha_after
     )
-    log(project_id, "Importing Github pull requests", "stop")
 
     return project_id
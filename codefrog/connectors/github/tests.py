@@ -1,34 +1,917 @@
-from django.test import TestCase
+import datetime
+import hashlib
+import hmac
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest import mock
+
+import requests
+from django.core.cache import caches
+from django.test import SimpleTestCase, TestCase, override_settings
 from django.test.client import RequestFactory
+from django.utils import timezone
+from requests.structures import CaseInsensitiveDict
 
+from connectors.git.tasks import import_code_changes, import_commit_range
+from connectors.github import graphql, handlers, ratelimit, utils
+from connectors.github.http import GitHubSession, get_session
+from connectors.github.tasks import (
+    _get_first_change,
+    _get_pages,
+    delete_issue,
+    delete_release,
+    save_issue,
+    save_pull_request,
+    save_release,
+)
 from connectors.github.views import authorization, hook, setup
+from core.models import Project, Release
+from core.tasks import (
+    get_source_status,
+    save_last_update,
+    update_source_status_with_metrics,
+)
+from core.utils import GitHub
+from engine.models import Issue, PullRequest
+from engine.tasks import calculate_code_complexity, calculate_code_metrics
 
+LOCMEM_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "github": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "github",
+    },
+}
 
-class GithubChecksWebhooksTestCase(TestCase):
-    def test_check_suite__requested(self):
-        rf = RequestFactory()
+# Responses of the GitHub GraphQL API (shortened to a few items per page),
+# by connection and cursor of the requested page.
+RECORDED_GRAPHQL_RESPONSES = {
+    ("issues", None): {
+        "data": {
+            "repository": {
+                "issues": {
+                    "pageInfo": {"hasNextPage": True, "endCursor": "Y3Vyc29yOjI="},
+                    "nodes": [
+                        {
+                            "number": 1,
+                            "createdAt": "2019-09-17T07:40:12Z",
+                            "closedAt": "2019-09-18T10:02:45Z",
+                            "labels": {"nodes": [{"name": "bug"}]},
+                        },
+                        {
+                            "number": 3,
+                            "createdAt": "2019-09-19T14:21:03Z",
+                            "closedAt": None,
+                            "labels": {"nodes": []},
+                        },
+                    ],
+                }
+            }
+        }
+    },
+    ("issues", "Y3Vyc29yOjI="): {
+        "data": {
+            "repository": {
+                "issues": {
+                    "pageInfo": {"hasNextPage": False, "endCursor": "Y3Vyc29yOjM="},
+                    "nodes": [
+                        {
+                            "number": 4,
+                            "createdAt": "2019-09-23T12:17:09Z",
+                            "closedAt": None,
+                            "labels": {
+                                "nodes": [{"name": "enhancement"}, {"name": "docs"}]
+                            },
+                        },
+                    ],
+                }
+            }
+        }
+    },
+    ("pullRequests", None): {
+        "data": {
+            "repository": {
+                "pullRequests": {
+                    "pageInfo": {"hasNextPage": False, "endCursor": "Y3Vyc29yOjE="},
+                    "nodes": [
+                        {
+                            "number": 2,
+                            "createdAt": "2019-09-18T08:00:00Z",
+                            "updatedAt": "2019-09-18T09:30:00Z",
+                            "mergedAt": "2019-09-18T09:30:00Z",
+                            "baseRefName": "master",
+                            "labels": {"nodes": [{"name": "bugfix"}]},
+                        },
+                        {
+                            "number": 5,
+                            "createdAt": "2019-09-10T11:00:00Z",
+                            "updatedAt": "2019-09-12T16:45:00Z",
+                            "mergedAt": None,
+                            "baseRefName": "master",
+                            "labels": {"nodes": []},
+                        },
+                    ],
+                }
+            }
+        }
+    },
+}
 
-        request = rf.post(
-            "/incoming/hook",
-            content_type="application/json",
-            data=b'{"action":"requested","check_suite":{"id":234959143,"node_id":"MDEwOkNoZWNrU3VpdGUyMzQ5NTkxNDM=","head_branch":"test_states","head_sha":"ff6d4a6c035c56e92ea0bda647821bf34822ea53","status":"queued","conclusion":null,"url":"https://api.github.com/repos/antonpirker/django-docker-setup/check-suites/234959143","before":"1cdc05f8e66bd8d99d32186e7b52f82c4fecd87d","after":"ff6d4a6c035c56e92ea0bda647821bf34822ea53","pull_requests":[],"app":{"id":41302,"slug":"codefrog-checks","node_id":"MDM6QXBwNDEzMDI=","owner":{"login":"antonpirker","id":202325,"node_id":"MDQ6VXNlcjIwMjMyNQ==","avatar_url":"https://avatars1.githubusercontent.com/u/202325?v=4","gravatar_id":"","url":"https://api.github.com/users/antonpirker","html_url":"https://github.com/antonpirker","followers_url":"https://api.github.com/users/antonpirker/followers","following_url":"https://api.github.com/users/antonpirker/following{/other_user}","gists_url":"https://api.github.com/users/antonpirker/gists{/gist_id}","starred_url":"https://api.github.com/users/antonpirker/starred{/owner}{/repo}","subscriptions_url":"https://api.github.com/users/antonpirker/subscriptions","organizations_url":"https://api.github.com/users/antonpirker/orgs","repos_url":"https://api.github.com/users/antonpirker/repos","events_url":"https://api.github.com/users/antonpirker/events{/privacy}","received_events_url":"https://api.github.com/users/antonpirker/received_events","type":"User","site_admin":false},"name":"Codefrog Checks","description":"","external_url":"http://antonpirker.pagekite.me","html_url":"https://github.com/apps/codefrog-checks","created_at":"2019-09-17T10:00:13Z","updated_at":"2019-09-23T10:12:31Z","permissions":{"checks":"write","contents":"read","metadata":"read"},"events":["check_run"]},"created_at":"2019-09-23T12:17:09Z","updated_at":"2019-09-23T12:17:09Z","latest_check_runs_count":0,"check_runs_url":"https://api.github.com/repos/antonpirker/django-docker-setup/check-suites/234959143/check-runs","head_commit":{"id":"ff6d4a6c035c56e92ea0bda647821bf34822ea53","tree_id":"b6997d75eee5ce4ab25964c919a0896215f7ce57","message":"Test","timestamp":"2019-09-23T12:17:04Z","author":{"name":"Anton Pirker","email":"anton@ignaz.at"},"committer":{"name":"Anton Pirker","email":"anton@ignaz.at"}}},"repository":{"id":208989587,"node_id":"MDEwOlJlcG9zaXRvcnkyMDg5ODk1ODc=","name":"django-docker-setup","full_name":"antonpirker/django-docker-setup","private":false,"owner":{"login":"antonpirker","id":202325,"node_id":"MDQ6VXNlcjIwMjMyNQ==","avatar_url":"https://avatars1.githubusercontent.com/u/202325?v=4","gravatar_id":"","url":"https://api.github.com/users/antonpirker","html_url":"https://github.com/antonpirker","followers_url":"https://api.github.com/users/antonpirker/followers","following_url":"https://api.github.com/users/antonpirker/following{/other_user}","gists_url":"https://api.github.com/users/antonpirker/gists{/gist_id}","starred_url":"https://api.github.com/users/antonpirker/starred{/owner}{/repo}","subscriptions_url":"https://api.github.com/users/antonpirker/subscriptions","organizations_url":"https://api.github.com/users/antonpirker/orgs","repos_url":"https://api.github.com/users/antonpirker/repos","events_url":"https://api.github.com/users/antonpirker/events{/privacy}","received_events_url":"https://api.github.com/users/antonpirker/received_events","type":"User","site_admin":false},"html_url":"https://github.com/antonpirker/django-docker-setup","description":"A sample application to show how to use docker-compose to setupa non trivial Django project. (For our Django Meetup)","fork":false,"url":"https://api.github.com/repos/antonpirker/django-docker-setup","forks_url":"https://api.github.com/repos/antonpirker/django-docker-setup/forks","keys_url":"https://api.github.com/repos/antonpirker/django-docker-setup/keys{/key_id}","collaborators_url":"https://api.github.com/repos/antonpirker/django-docker-setup/collaborators{/collaborator}","teams_url":"https://api.github.com/repos/antonpirker/django-docker-setup/teams","hooks_url":"https://api.github.com/repos/antonpirker/django-docker-setup/hooks","issue_events_url":"https://api.github.com/repos/antonpirker/django-docker-setup/issues/events{/number}","events_url":"https://api.github.com/repos/antonpirker/django-docker-setup/events","assignees_url":"https://api.github.com/repos/antonpirker/django-docker-setup/assignees{/user}","branches_url":"https://api.github.com/repos/antonpirker/django-docker-setup/branches{/branch}","tags_url":"https://api.github.com/repos/antonpirker/django-docker-setup/tags","blobs_url":"https://api.github.com/repos/antonpirker/django-docker-setup/git/blobs{/sha}","git_tags_url":"https://api.github.com/repos/antonpirker/django-docker-setup/git/tags{/sha}","git_refs_url":"https://api.github.com/repos/antonpirker/django-docker-setup/git/refs{/sha}","trees_url":"https://api.github.com/repos/antonpirker/django-docker-setup/git/trees{/sha}","statuses_url":"https://api.github.com/repos/antonpirker/django-docker-setup/statuses/{sha}","languages_url":"https://api.github.com/repos/antonpirker/django-docker-setup/languages","stargazers_url":"https://api.github.com/repos/antonpirker/django-docker-setup/stargazers","contributors_url":"https://api.github.com/repos/antonpirker/django-docker-setup/contributors","subscribers_url":"https://api.github.com/repos/antonpirker/django-docker-setup/subscribers","subscription_url":"https://api.github.com/repos/antonpirker/django-docker-setup/subscription","commits_url":"https://api.github.com/repos/antonpirker/django-docker-setup/commits{/sha}","git_commits_url":"https://api.github.com/repos/antonpirker/django-docker-setup/git/commits{/sha}","comments_url":"https://api.github.com/repos/antonpirker/django-docker-setup/comments{/number}","issue_comment_url":"https://api.github.com/repos/antonpirker/django-docker-setup/issues/comments{/number}","contents_url":"https://api.github.com/repos/antonpirker/django-docker-setup/contents/{+path}","compare_url":"https://api.github.com/repos/antonpirker/django-docker-setup/compare/{base}...{head}","merges_url":"https://api.github.com/repos/antonpirker/django-docker-setup/merges","archive_url":"https://api.github.com/repos/antonpirker/django-docker-setup/{archive_format}{/ref}","downloads_url":"https://api.github.com/repos/antonpirker/django-docker-setup/downloads","issues_url":"https://api.github.com/repos/antonpirker/django-docker-setup/issues{/number}","pulls_url":"https://api.github.com/repos/antonpirker/django-docker-setup/pulls{/number}","milestones_url":"https://api.github.com/repos/antonpirker/django-docker-setup/milestones{/number}","notifications_url":"https://api.github.com/repos/antonpirker/django-docker-setup/notifications{?since,all,participating}","labels_url":"https://api.github.com/repos/antonpirker/django-docker-setup/labels{/name}","releases_url":"https://api.github.com/repos/antonpirker/django-docker-setup/releases{/id}","deployments_url":"https://api.github.com/repos/antonpirker/django-docker-setup/deployments","created_at":"2019-09-17T07:38:43Z","updated_at":"2019-09-17T10:35:41Z","pushed_at":"2019-09-23T12:17:08Z","git_url":"git://github.com/antonpirker/django-docker-setup.git","ssh_url":"git@github.com:antonpirker/django-docker-setup.git","clone_url":"https://github.com/antonpirker/django-docker-setup.git","svn_url":"https://github.com/antonpirker/django-docker-setup","homepage":null,"size":72,"stargazers_count":0,"watchers_count":0,"language":"Python","has_issues":true,"has_projects":true,"has_downloads":true,"has_wiki":true,"has_pages":false,"forks_count":0,"mirror_url":null,"archived":false,"disabled":false,"open_issues_count":2,"license":null,"forks":0,"open_issues":2,"watchers":0,"default_branch":"master"},"sender":{"login":"antonpirker","id":202325,"node_id":"MDQ6VXNlcjIwMjMyNQ==","avatar_url":"https://avatars1.githubusercontent.com/u/202325?v=4","gravatar_id":"","url":"https://api.github.com/users/antonpirker","html_url":"https://github.com/antonpirker","followers_url":"https://api.github.com/users/antonpirker/followers","following_url":"https://api.github.com/users/antonpirker/following{/other_user}","gists_url":"https://api.github.com/users/antonpirker/gists{/gist_id}","starred_url":"https://api.github.com/users/antonpirker/starred{/owner}{/repo}","subscriptions_url":"https://api.github.com/users/antonpirker/subscriptions","organizations_url":"https://api.github.com/users/antonpirker/orgs","repos_url":"https://api.github.com/users/antonpirker/repos","events_url":"https://api.github.com/users/antonpirker/events{/privacy}","received_events_url":"https://api.github.com/users/antonpirker/received_events","type":"User","site_admin":false},"installation":{"id":1939914,"node_id":"MDIzOkludGVncmF0aW9uSW5zdGFsbGF0aW9uMTkzOTkxNA=="}}',  # noqa
+
+class RecordedGraphQLHandler(BaseHTTPRequestHandler):
+    """
+    Stands in for the GitHub GraphQL API and answers with recorded responses.
+    """
+
+    requests = []
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.requests.append((self.path, dict(self.headers), body))
+
+        connection = "issues" if "issues(" in body["query"] else "pullRequests"
+        response = RECORDED_GRAPHQL_RESPONSES[(connection, body["variables"]["cursor"])]
+
+        content = json.dumps(response).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class GraphQLImportTestCase(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = HTTPServer(("127.0.0.1", 0), RecordedGraphQLHandler)
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        RecordedGraphQLHandler.requests = []
+
+        patcher = mock.patch.object(
+            GitHub, "api_base_url", "http://127.0.0.1:%s" % self.server.server_port
         )
+        patcher.start()
+        self.addCleanup(patcher.stop)
 
-        request.headers = {
-            "Content-Length": "8780",
-            "Content-Type": "application/json",
-            "X-Forwarded-For": "::ffff:140.82.115.245",
-            "X-Forwarded-Proto": "http",
-            "X-Pagekite-Port": "80",
-            "Host": "antonpirker.pagekite.me",
-            "Accept": "*/*",
-            "User-Agent": "GitHub-Hookshot/acf94e7",
-            "X-Github-Event": "check_suite",
-            "X-Github-Delivery": "10c2f4e0-ddfc-11e9-899e-65272afcd6ed",
+        self.gh = GitHub()
+        self.gh.installation_id = 1939914
+        self.gh.installation_access_token = "v1.recorded"
+
+    def test_get_issues(self):
+        issues = list(graphql.get_issues(self.gh, "antonpirker", "codefrog"))
+
+        self.assertEqual([issue["number"] for issue in issues], [1, 3, 4])
+        self.assertEqual(
+            issues[0]["opened_at"],
+            datetime.datetime(2019, 9, 17, 7, 40, 12, tzinfo=timezone.utc),
+        )
+        self.assertIsNone(issues[1]["closed_at"])
+        self.assertEqual(issues[2]["labels"], ["enhancement", "docs"])
+
+        # one request per page, the second one continues after the first page
+        self.assertEqual(len(RecordedGraphQLHandler.requests), 2)
+        path, headers, body = RecordedGraphQLHandler.requests[1]
+        self.assertEqual(path, "/graphql")
+        self.assertEqual(headers["Authorization"], "bearer v1.recorded")
+        self.assertEqual(body["variables"]["cursor"], "Y3Vyc29yOjI=")
+        self.assertEqual(body["variables"]["pageSize"], 100)
+
+    def test_get_issues_since(self):
+        start_date = datetime.datetime(2019, 9, 1, tzinfo=timezone.utc)
+        list(graphql.get_issues(self.gh, "antonpirker", "codefrog", start_date))
+
+        path, headers, body = RecordedGraphQLHandler.requests[0]
+        self.assertEqual(body["variables"]["since"], "2019-09-01T00:00:00+00:00")
+
+    def test_get_pull_requests(self):
+        pull_requests = list(
+            graphql.get_pull_requests(self.gh, "antonpirker", "codefrog")
+        )
+
+        self.assertEqual(
+            pull_requests,
+            [
+                {
+                    "number": 2,
+                    "opened_at": datetime.datetime(
+                        2019, 9, 18, 8, 0, tzinfo=timezone.utc
+                    ),
+                    "updated_at": datetime.datetime(
+                        2019, 9, 18, 9, 30, tzinfo=timezone.utc
+                    ),
+                    "merged_at": datetime.datetime(
+                        2019, 9, 18, 9, 30, tzinfo=timezone.utc
+                    ),
+                    "base_ref": "master",
+                    "labels": ["bugfix"],
+                },
+                {
+                    "number": 5,
+                    "opened_at": datetime.datetime(
+                        2019, 9, 10, 11, 0, tzinfo=timezone.utc
+                    ),
+                    "updated_at": datetime.datetime(
+                        2019, 9, 12, 16, 45, tzinfo=timezone.utc
+                    ),
+                    "merged_at": None,
+                    "base_ref": "master",
+                    "labels": [],
+                },
+            ],
+        )
+
+    def test_get_pull_requests_updated_since(self):
+        updated_since = datetime.datetime(2019, 9, 15, tzinfo=timezone.utc)
+        pull_requests = list(
+            graphql.get_pull_requests(
+                self.gh, "antonpirker", "codefrog", updated_since=updated_since
+            )
+        )
+
+        self.assertEqual([pr["number"] for pr in pull_requests], [2])
+
+    def test_errors(self):
+        errors = {"errors": [{"message": "Could not resolve to a Repository."}]}
+        with mock.patch.dict(RECORDED_GRAPHQL_RESPONSES, {("issues", None): errors}):
+            with self.assertRaises(graphql.GraphQLError):
+                list(graphql.get_issues(self.gh, "antonpirker", "unknown"))
+
+
+def get_response(status_code=200, headers=None, content=b"{}"):
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers = CaseInsensitiveDict(headers or {})
+    response._content = content
+    return response
+
+
+@override_settings(GITHUB_HTTP_POOL_SIZE=4, GITHUB_HTTP_TIMEOUT=5)
+class GitHubSessionTestCase(SimpleTestCase):
+    def test_get_session(self):
+        session = get_session()
+        self.assertIs(get_session(), session)
+
+        # Forked worker processes get their own session.
+        with mock.patch("os.getpid", return_value=-1):
+            self.assertIsNot(get_session(), session)
+
+    def test_connection_pool(self):
+        session = GitHubSession()
+
+        for url in ("https://api.github.com/repos", "https://github.com/login"):
+            adapter = session.get_adapter(url)
+            self.assertEqual(adapter._pool_maxsize, 4)
+            self.assertEqual(adapter.max_retries.connect, 3)
+            self.assertEqual(adapter.max_retries.status, 0)
+
+    def test_timeout(self):
+        with mock.patch.object(requests.Session, "request") as request:
+            GitHubSession().request("GET", "https://api.github.com/")
+
+        self.assertEqual(request.call_args[1]["timeout"], 5)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+@mock.patch("connectors.github.utils.create_jwt", return_value="jwt")
+class AccessTokenTestCase(SimpleTestCase):
+    def setUp(self):
+        caches["github"].clear()
+
+    def get_token_response(self, token, expires_in):
+        expires_at = timezone.now() + datetime.timedelta(seconds=expires_in)
+        content = {"token": token, "expires_at": expires_at.isoformat()}
+        return get_response(content=json.dumps(content).encode("utf-8"))
+
+    def post(self, *responses):
+        return mock.patch.object(GitHubSession, "request", side_effect=list(responses))
+
+    def test_cached(self, create_jwt):
+        with self.post(self.get_token_response("token-1", 60 * 60)) as request:
+            self.assertEqual(utils.get_access_token(1), "token-1")
+            self.assertEqual(utils.get_access_token(1), "token-1")
+
+        self.assertEqual(request.call_count, 1)
+
+    def test_refreshed_before_expiry(self, create_jwt):
+        # Tokens expiring within the refresh margin are not cached.
+        with self.post(
+            self.get_token_response("token-1", 60),
+            self.get_token_response("token-2", 60 * 60),
+        ) as request:
+            self.assertEqual(utils.get_access_token(1), "token-1")
+            self.assertEqual(utils.get_access_token(1), "token-2")
+
+        self.assertEqual(request.call_count, 2)
+
+    def test_delete_access_token(self, create_jwt):
+        with self.post(
+            self.get_token_response("token-1", 60 * 60),
+            self.get_token_response("token-2", 60 * 60),
+        ):
+            utils.get_access_token(1)
+            utils.delete_access_token(1)
+            self.assertEqual(utils.get_access_token(1), "token-2")
+
+
+def get_page_response(page, last_page):
+    """
+    Returns page `page` of a GitHub listing, its items are `page * 10` and `page * 10 + 1`.
+    """
+    url = "https://api.github.com/repos/codefrog-app/codefrog/issues?per_page=2"
+    links = []
+    if page < last_page:
+        links.append(f'<{url}&page={page + 1}>; rel="next"')
+        links.append(f'<{url}&page={last_page}>; rel="last"')
+
+    return get_response(
+        headers={"Link": ", ".join(links)} if links else None,
+        content=json.dumps([page * 10, page * 10 + 1]).encode("utf-8"),
+    )
+
+
+@override_settings(GITHUB_CONCURRENT_PAGES=2)
+class GetPagesTestCase(SimpleTestCase):
+    url = "https://api.github.com/repos/codefrog-app/codefrog/issues?per_page=2"
+    last_page = 5
+
+    def get_page(self, url, headers, missing=()):
+        match = re.search(r"[?&]page=(\d+)", url)
+        page = int(match.group(1)) if match else 1
+        if page in missing:
+            return None
+
+        # Later pages are answered faster.
+        time.sleep((self.last_page - page) * 0.01)
+        return get_page_response(page, self.last_page)
+
+    def get_items(self, concurrent=True, missing=()):
+        gh = GitHub()
+        with mock.patch.object(
+            gh,
+            "_get_page",
+            side_effect=lambda url, headers: self.get_page(url, headers, missing),
+        ) as get_page:
+            items = list(gh._get_pages(self.url, {}, concurrent=concurrent))
+
+        return items, get_page.call_count
+
+    def test_concurrent(self):
+        items, count = self.get_items()
+
+        self.assertEqual(items, [10, 11, 20, 21, 30, 31, 40, 41, 50, 51])
+        self.assertEqual(count, 5)
+
+    def test_sequential(self):
+        items, count = self.get_items(concurrent=False)
+
+        self.assertEqual(items, [10, 11, 20, 21, 30, 31, 40, 41, 50, 51])
+        self.assertEqual(count, 5)
+
+    def test_missing_page(self):
+        items, count = self.get_items(missing=[3])
+
+        # The pages after a missing page are not returned.
+        self.assertEqual(items, [10, 11, 20, 21])
+
+
+class FakeClock:
+    """
+    Replaces `time.time` and `time.sleep`, sleeping only advances the time.
+    """
+
+    def __init__(self, now=1600000000):
+        self.now = now
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES,
+    GITHUB_RATE_LIMIT_RESERVE=1,
+    GITHUB_RATE_LIMIT_MAX_WAIT=15 * 60,
+    GITHUB_REQUEST_RATE_LIMIT_MAX_WAIT=0,
+    GITHUB_MAX_RETRIES=5,
+)
+class RateLimitTestCase(SimpleTestCase):
+    scope = "installation:1"
+
+    def setUp(self):
+        caches["github"].clear()
+        self.clock = FakeClock()
+        for name in ("time", "sleep"):
+            patcher = mock.patch(f"time.{name}", getattr(self.clock, name))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def get_rate_limit_headers(self, remaining, reset_in=60):
+        return {
+            "X-RateLimit-Remaining": str(remaining),
+            "X-RateLimit-Reset": str(int(self.clock.now + reset_in)),
         }
 
+    def get_remaining(self):
+        return ratelimit.get_rate_limit_stats([self.scope])[self.scope]["remaining"]
+
+    def send(self, *responses):
+        """
+        Sends a governed request, GitHub answers with the given responses.
+        """
+        with mock.patch.object(
+            requests.Session, "request", side_effect=list(responses)
+        ) as request:
+            response = GitHubSession().request(
+                "GET", "https://api.github.com/", cache_scope=self.scope
+            )
+        return response, request.call_count
+
+    def test_bucket_refill(self):
+        ratelimit.update(
+            self.scope, get_response(headers=self.get_rate_limit_headers(3))
+        )
+
+        self.assertEqual(ratelimit.acquire(self.scope), 0)
+        self.assertEqual(ratelimit.acquire(self.scope), 0)
+        self.assertEqual(self.get_remaining(), 1)
+
+        # Only the reserve is left, wait for the reset of the rate limit
+        # and continue with the budget reported after the reset.
+        def sleep(seconds):
+            self.clock.sleep(seconds)
+            ratelimit.update(
+                self.scope, get_response(headers=self.get_rate_limit_headers(5000))
+            )
+
+        with mock.patch("time.sleep", sleep):
+            self.assertEqual(ratelimit.acquire(self.scope), 60)
+
+        self.assertEqual(self.clock.sleeps, [60])
+        self.assertEqual(self.get_remaining(), 4999)
+
+    def test_out_of_order_responses(self):
+        ratelimit.update(
+            self.scope, get_response(headers=self.get_rate_limit_headers(10))
+        )
+        ratelimit.update(
+            self.scope, get_response(headers=self.get_rate_limit_headers(12))
+        )
+        self.assertEqual(self.get_remaining(), 10)
+
+        # A new rate limit window
+        ratelimit.update(
+            self.scope, get_response(headers=self.get_rate_limit_headers(12, 3600))
+        )
+        self.assertEqual(self.get_remaining(), 12)
+
+    def test_retry_after(self):
+        response, requests_sent = self.send(
+            get_response(403, {"Retry-After": "30"}),
+            get_response(200),
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(requests_sent, 2)
+        # Waited once, not again for the blocked scope.
+        self.assertEqual(self.clock.sleeps, [30])
+
+    def test_secondary_rate_limit(self):
+        response, requests_sent = self.send(
+            get_response(
+                403, content=b'{"message": "You have exceeded a secondary rate limit."}'
+            ),
+            get_response(200),
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(requests_sent, 2)
+        self.assertEqual(len(self.clock.sleeps), 1)
+        self.assertTrue(60 <= self.clock.sleeps[0] <= 90)
+
+    def test_rate_limit_exhausted(self):
+        reset = str(int(self.clock.now + 120))
+        headers = {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": reset}
+        response, requests_sent = self.send(
+            get_response(403, headers),
+            get_response(200, self.get_rate_limit_headers(5000)),
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(requests_sent, 2)
+        self.assertEqual(self.clock.sleeps, [120])
+
+    def test_fail_fast(self):
+        ratelimit.update(
+            self.scope, get_response(headers=self.get_rate_limit_headers(1))
+        )
+
+        # The reserve is only used by fail fast requests.
+        with ratelimit.fail_fast():
+            self.assertEqual(ratelimit.acquire(self.scope), 0)
+            with self.assertRaises(ratelimit.RateLimitExceeded):
+                ratelimit.acquire(self.scope)
+
+        self.assertEqual(self.clock.sleeps, [])
+
+    def test_fail_fast_retry_after(self):
+        with ratelimit.fail_fast():
+            response, requests_sent = self.send(
+                get_response(403, {"Retry-After": "30"}),
+                get_response(200),
+            )
+
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(requests_sent, 1)
+        self.assertEqual(self.clock.sleeps, [])
+
+    def test_hook_fails_fast(self):
+        request = RequestFactory().post(
+            "/github-hook/",
+            data=b"{}",
+            content_type="application/json",
+            HTTP_X_GITHUB_EVENT="push",
+        )
+        exceeded = ratelimit.RateLimitExceeded(self.scope, 41.5)
+
+        with mock.patch("connectors.github.views.github_hook", side_effect=exceeded):
+            response = hook(request)
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "42")
+
+
+class SavePagesTestCase(SimpleTestCase):
+    def test_get_pages(self):
+        self.assertEqual(
+            list(_get_pages(iter(range(5)), size=2)), [[0, 1], [2, 3], [4]]
+        )
+        self.assertEqual(list(_get_pages([], size=2)), [])
+
+
+class WebhookDeltaTestCase(SimpleTestCase):
+    def test_get_first_change(self):
+        opened_at = datetime.datetime(2019, 9, 17, 7, 40, 12, tzinfo=timezone.utc)
+        closed_at = datetime.datetime(2019, 9, 18, 10, 2, 45, tzinfo=timezone.utc)
+
+        # new issue
+        self.assertEqual(_get_first_change((None, None), (opened_at, None)), opened_at)
+        # closed
+        self.assertEqual(
+            _get_first_change((opened_at, None), (opened_at, closed_at)), closed_at
+        )
+        # reopened
+        self.assertEqual(
+            _get_first_change((opened_at, closed_at), (opened_at, None)), closed_at
+        )
+        # labeled
+        self.assertIsNone(
+            _get_first_change((opened_at, closed_at), (opened_at, closed_at))
+        )
+
+
+CHECK_SUITE_REQUESTED = b'{"action":"requested","check_suite":{"id":234959143,"node_id":"MDEwOkNoZWNrU3VpdGUyMzQ5NTkxNDM=","head_branch":"test_states","head_sha":"ff6d4a6c035c56e92ea0bda647821bf34822ea53","status":"queued","conclusion":null,"url":"https://api.github.com/repos/antonpirker/django-docker-setup/check-suites/234959143","before":"1cdc05f8e66bd8d99d32186e7b52f82c4fecd87d","after":"ff6d4a6c035c56e92ea0bda647821bf34822ea53","pull_requests":[],"app":{"id":41302,"slug":"codefrog-checks","node_id":"MDM6QXBwNDEzMDI=","owner":{"login":"antonpirker","id":202325,"node_id":"MDQ6VXNlcjIwMjMyNQ==","avatar_url":"https://avatars1.githubusercontent.com/u/202325?v=4","gravatar_id":"","url":"https://api.github.com/users/antonpirker","html_url":"https://github.com/antonpirker","followers_url":"https://api.github.com/users/antonpirker/followers","following_url":"https://api.github.com/users/antonpirker/following{/other_user}","gists_url":"https://api.github.com/users/antonpirker/gists{/gist_id}","starred_url":"https://api.github.com/users/antonpirker/starred{/owner}{/repo}","subscriptions_url":"https://api.github.com/users/antonpirker/subscriptions","organizations_url":"https://api.github.com/users/antonpirker/orgs","repos_url":"https://api.github.com/users/antonpirker/repos","events_url":"https://api.github.com/users/antonpirker/events{/privacy}","received_events_url":"https://api.github.com/users/antonpirker/received_events","type":"User","site_admin":false},"name":"Codefrog Checks","description":"","external_url":"http://antonpirker.pagekite.me","html_url":"https://github.com/apps/codefrog-checks","created_at":"2019-09-17T10:00:13Z","updated_at":"2019-09-23T10:12:31Z","permissions":{"checks":"write","contents":"read","metadata":"read"},"events":["check_run"]},"created_at":"2019-09-23T12:17:09Z","updated_at":"2019-09-23T12:17:09Z","latest_check_runs_count":0,"check_runs_url":"https://api.github.com/repos/antonpirker/django-docker-setup/check-suites/234959143/check-runs","head_commit":{"id":"ff6d4a6c035c56e92ea0bda647821bf34822ea53","tree_id":"b6997d75eee5ce4ab25964c919a0896215f7ce57","message":"Test","timestamp":"2019-09-23T12:17:04Z","author":{"name":"Anton Pirker","email":"anton@ignaz.at"},"committer":{"name":"Anton Pirker","email":"anton@ignaz.at"}}},"repository":{"id":208989587,"node_id":"MDEwOlJlcG9zaXRvcnkyMDg5ODk1ODc=","name":"django-docker-setup","full_name":"antonpirker/django-docker-setup","private":false,"owner":{"login":"antonpirker","id":202325,"node_id":"MDQ6VXNlcjIwMjMyNQ==","avatar_url":"https://avatars1.githubusercontent.com/u/202325?v=4","gravatar_id":"","url":"https://api.github.com/users/antonpirker","html_url":"https://github.com/antonpirker","followers_url":"https://api.github.com/users/antonpirker/followers","following_url":"https://api.github.com/users/antonpirker/following{/other_user}","gists_url":"https://api.github.com/users/antonpirker/gists{/gist_id}","starred_url":"https://api.github.com/users/antonpirker/starred{/owner}{/repo}","subscriptions_url":"https://api.github.com/users/antonpirker/subscriptions","organizations_url":"https://api.github.com/users/antonpirker/orgs","repos_url":"https://api.github.com/users/antonpirker/repos","events_url":"https://api.github.com/users/antonpirker/events{/privacy}","received_events_url":"https://api.github.com/users/antonpirker/received_events","type":"User","site_admin":false},"html_url":"https://github.com/antonpirker/django-docker-setup","description":"A sample application to show how to use docker-compose to setupa non trivial Django project. (For our Django Meetup)","fork":false,"url":"https://api.github.com/repos/antonpirker/django-docker-setup","forks_url":"https://api.github.com/repos/antonpirker/django-docker-setup/forks","keys_url":"https://api.github.com/repos/antonpirker/django-docker-setup/keys{/key_id}","collaborators_url":"https://api.github.com/repos/antonpirker/django-docker-setup/collaborators{/collaborator}","teams_url":"https://api.github.com/repos/antonpirker/django-docker-setup/teams","hooks_url":"https://api.github.com/repos/antonpirker/django-docker-setup/hooks","issue_events_url":"https://api.github.com/repos/antonpirker/django-docker-setup/issues/events{/number}","events_url":"https://api.github.com/repos/antonpirker/django-docker-setup/events","assignees_url":"https://api.github.com/repos/antonpirker/django-docker-setup/assignees{/user}","branches_url":"https://api.github.com/repos/antonpirker/django-docker-setup/branches{/branch}","tags_url":"https://api.github.com/repos/antonpirker/django-docker-setup/tags","blobs_url":"https://api.github.com/repos/antonpirker/django-docker-setup/git/blobs{/sha}","git_tags_url":"https://api.github.com/repos/antonpirker/django-docker-setup/git/tags{/sha}","git_refs_url":"https://api.github.com/repos/antonpirker/django-docker-setup/git/refs{/sha}","trees_url":"https://api.github.com/repos/antonpirker/django-docker-setup/git/trees{/sha}","statuses_url":"https://api.github.com/repos/antonpirker/django-docker-setup/statuses/{sha}","languages_url":"https://api.github.com/repos/antonpirker/django-docker-setup/languages","stargazers_url":"https://api.github.com/repos/antonpirker/django-docker-setup/stargazers","contributors_url":"https://api.github.com/repos/antonpirker/django-docker-setup/contributors","subscribers_url":"https://api.github.com/repos/antonpirker/django-docker-setup/subscribers","subscription_url":"https://api.github.com/repos/antonpirker/django-docker-setup/subscription","commits_url":"https://api.github.com/repos/antonpirker/django-docker-setup/commits{/sha}","git_commits_url":"https://api.github.com/repos/antonpirker/django-docker-setup/git/commits{/sha}","comments_url":"https://api.github.com/repos/antonpirker/django-docker-setup/comments{/number}","issue_comment_url":"https://api.github.com/repos/antonpirker/django-docker-setup/issues/comments{/number}","contents_url":"https://api.github.com/repos/antonpirker/django-docker-setup/contents/{+path}","compare_url":"https://api.github.com/repos/antonpirker/django-docker-setup/compare/{base}...{head}","merges_url":"https://api.github.com/repos/antonpirker/django-docker-setup/merges","archive_url":"https://api.github.com/repos/antonpirker/django-docker-setup/{archive_format}{/ref}","downloads_url":"https://api.github.com/repos/antonpirker/django-docker-setup/downloads","issues_url":"https://api.github.com/repos/antonpirker/django-docker-setup/issues{/number}","pulls_url":"https://api.github.com/repos/antonpirker/django-docker-setup/pulls{/number}","milestones_url":"https://api.github.com/repos/antonpirker/django-docker-setup/milestones{/number}","notifications_url":"https://api.github.com/repos/antonpirker/django-docker-setup/notifications{?since,all,participating}","labels_url":"https://api.github.com/repos/antonpirker/django-docker-setup/labels{/name}","releases_url":"https://api.github.com/repos/antonpirker/django-docker-setup/releases{/id}","deployments_url":"https://api.github.com/repos/antonpirker/django-docker-setup/deployments","created_at":"2019-09-17T07:38:43Z","updated_at":"2019-09-17T10:35:41Z","pushed_at":"2019-09-23T12:17:08Z","git_url":"git://github.com/antonpirker/django-docker-setup.git","ssh_url":"git@github.com:antonpirker/django-docker-setup.git","clone_url":"https://github.com/antonpirker/django-docker-setup.git","svn_url":"https://github.com/antonpirker/django-docker-setup","homepage":null,"size":72,"stargazers_count":0,"watchers_count":0,"language":"Python","has_issues":true,"has_projects":true,"has_downloads":true,"has_wiki":true,"has_pages":false,"forks_count":0,"mirror_url":null,"archived":false,"disabled":false,"open_issues_count":2,"license":null,"forks":0,"open_issues":2,"watchers":0,"default_branch":"master"},"sender":{"login":"antonpirker","id":202325,"node_id":"MDQ6VXNlcjIwMjMyNQ==","avatar_url":"https://avatars1.githubusercontent.com/u/202325?v=4","gravatar_id":"","url":"https://api.github.com/users/antonpirker","html_url":"https://github.com/antonpirker","followers_url":"https://api.github.com/users/antonpirker/followers","following_url":"https://api.github.com/users/antonpirker/following{/other_user}","gists_url":"https://api.github.com/users/antonpirker/gists{/gist_id}","starred_url":"https://api.github.com/users/antonpirker/starred{/owner}{/repo}","subscriptions_url":"https://api.github.com/users/antonpirker/subscriptions","organizations_url":"https://api.github.com/users/antonpirker/orgs","repos_url":"https://api.github.com/users/antonpirker/repos","events_url":"https://api.github.com/users/antonpirker/events{/privacy}","received_events_url":"https://api.github.com/users/antonpirker/received_events","type":"User","site_admin":false},"installation":{"id":1939914,"node_id":"MDIzOkludGVncmF0aW9uSW5zdGFsbGF0aW9uMTkzOTkxNA=="}}'  # noqa
+
+
+def get_hook_request(body, event, delivery_id):
+    """
+    Returns a web hook request signed with the `GITHUB_WEBHOOK_SECRET` "secret".
+    """
+    signature = hmac.new(b"secret", body, digestmod=hashlib.sha1).hexdigest()
+    return RequestFactory().post(
+        "/incoming/hook",
+        data=body,
+        content_type="application/json",
+        HTTP_X_GITHUB_EVENT=event,
+        HTTP_X_GITHUB_DELIVERY=delivery_id,
+        HTTP_X_HUB_SIGNATURE=f"sha1={signature}",
+    )
+
+
+@override_settings(CACHES=LOCMEM_CACHES, GITHUB_WEBHOOK_SECRET="secret")
+@mock.patch("connectors.github.handlers.run_complexity_check.delay")
+@mock.patch("connectors.github.handlers.checks.get_project_matching_github_hook")
+class WebhookDeduplicationTestCase(SimpleTestCase):
+    def setUp(self):
+        caches["github"].clear()
+
+    def test_same_head_sha(self, get_project, delay):
+        get_project.return_value = mock.Mock(pk=1, slug="django-docker-setup")
+
+        # GitHub can send more than one check suite for the same commit.
+        for delivery_id in ("delivery-1", "delivery-2"):
+            out = hook(
+                get_hook_request(CHECK_SUITE_REQUESTED, "check_suite", delivery_id)
+            )
+            self.assertEqual(out.status_code, 202)
+
+        delay.assert_called_once()
+
+    def test_forget_webhook_on_failure(self, get_project, delay):
+        get_project.return_value = mock.Mock(pk=1, slug="django-docker-setup")
+        delay.side_effect = [ConnectionError, None]
+
+        request = get_hook_request(CHECK_SUITE_REQUESTED, "check_suite", "delivery-1")
+        with self.assertRaises(ConnectionError):
+            hook(request)
+
+        # The redelivered web hook is processed again.
+        request = get_hook_request(CHECK_SUITE_REQUESTED, "check_suite", "delivery-1")
         out = hook(request)
 
+        self.assertEqual(out.status_code, 202)
+        self.assertEqual(delay.call_count, 2)
+
+
+class WebhookHandlersTestCase(SimpleTestCase):
+    project = mock.Mock(pk=1, git_branch="main", current_source_status=None)
+
+    def setUp(self):
+        patcher = mock.patch.object(
+            handlers, "_get_projects", return_value=[self.project]
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_push_payload(self, **kwargs):
+        payload = {
+            "ref": "refs/heads/main",
+            "before": "a" * 40,
+            "after": "b" * 40,
+            "deleted": False,
+            "forced": False,
+            "commits": [{"id": "b" * 40}],
+            "repository": {"default_branch": "main"},
+        }
+        payload.update(kwargs)
+        return payload
+
+    def push(self, payload):
+        with mock.patch.object(handlers, "chain") as chain:
+            handlers.push(payload)
+        return chain
+
+    def test_push(self):
+        chain = self.push(self.get_push_payload())
+
+        chain.assert_called_once_with(
+            import_commit_range.s(1, "a" * 40, "b" * 40),
+            get_source_status.s(),
+            update_source_status_with_metrics.s(),
+            save_last_update.s(),
+        )
+        chain.return_value.apply_async.assert_called_once_with()
+
+    def test_push_forced(self):
+        chain = self.push(self.get_push_payload(forced=True, commits=[]))
+
+        chain.assert_called_once_with(
+            import_code_changes.s(1),
+            calculate_code_complexity.s(),
+            calculate_code_metrics.s(),
+            get_source_status.s(),
+            update_source_status_with_metrics.s(),
+            save_last_update.s(),
+        )
+
+    @override_settings(PUSH_SOURCE_STATUS_INTERVAL=60 * 60)
+    def test_push_recent_source_status(self):
+        source_status = mock.Mock(
+            timestamp=timezone.now() - datetime.timedelta(minutes=10)
+        )
+        with mock.patch.object(self.project, "current_source_status", source_status):
+            chain = self.push(self.get_push_payload())
+
+        # The source status is built by the next periodic update.
+        chain.assert_called_once_with(
+            import_commit_range.s(1, "a" * 40, "b" * 40),
+            save_last_update.s(),
+        )
+
+        source_status.timestamp = timezone.now() - datetime.timedelta(hours=2)
+        with mock.patch.object(self.project, "current_source_status", source_status):
+            chain = self.push(self.get_push_payload())
+
+        chain.assert_called_once_with(
+            import_commit_range.s(1, "a" * 40, "b" * 40),
+            get_source_status.s(),
+            update_source_status_with_metrics.s(),
+            save_last_update.s(),
+        )
+
+    def test_push_ignored(self):
+        for payload in (
+            self.get_push_payload(ref="refs/heads/feature"),
+            self.get_push_payload(deleted=True),
+            self.get_push_payload(commits=[]),
+        ):
+            with self.subTest(payload=payload):
+                self.push(payload).assert_not_called()
+
+    def test_issues(self):
+        issue = {"number": 12}
+        with mock.patch.object(handlers.save_issue, "delay") as delay:
+            handlers.issues__closed({"action": "closed", "issue": issue})
+        delay.assert_called_once_with(1, issue)
+
+        with mock.patch.object(handlers.delete_issue, "delay") as delay:
+            handlers.issues__transferred({"action": "transferred", "issue": issue})
+        delay.assert_called_once_with(1, 12)
+
+    def test_pull_request(self):
+        pull_request = {"number": 3, "state": "closed"}
+        with mock.patch.object(handlers.save_pull_request, "delay") as delay:
+            handlers.pull_request__closed(
+                {"action": "closed", "number": 3, "pull_request": pull_request}
+            )
+        delay.assert_called_once_with(1, pull_request)
+
+        with mock.patch.object(handlers.save_pull_request, "delay") as delay:
+            handlers.pull_request__edited(
+                {
+                    "action": "edited",
+                    "number": 4,
+                    "pull_request": {"number": 4, "state": "open"},
+                }
+            )
+        delay.assert_not_called()
+
+    def test_release(self):
+        release = {"tag_name": "v1.0"}
+        with mock.patch.object(handlers.save_release, "delay") as delay:
+            handlers.release__edited(
+                {
+                    "action": "edited",
+                    "release": release,
+                    "changes": {"tag_name": {"from": "v0.9"}},
+                }
+            )
+        delay.assert_called_once_with(1, release, old_tag_name="v0.9")
+
+        with mock.patch.object(handlers.delete_release, "delay") as delay:
+            handlers.release__deleted({"action": "deleted", "release": release})
+        delay.assert_called_once_with(1, "v1.0")
+
+
+@mock.patch("connectors.github.tasks.bump_project_data_version")
+class WebhookTasksTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.project = Project.objects.create(
+            source="github",
+            slug="codefrog",
+            name="codefrog",
+            git_url="https://github.com/codefrog-app/codefrog.git",
+            git_branch="main",
+        )
+
+    def get_issue(self, closed_at=None, labels=()):
+        return {
+            "number": 12,
+            "created_at": "2020-01-01T10:00:00Z",
+            "closed_at": closed_at,
+            "labels": [{"name": label} for label in labels],
+        }
+
+    @mock.patch("connectors.github.tasks.calculate_issue_metrics")
+    def test_save_issue(self, calculate_issue_metrics, bump_project_data_version):
+        save_issue(self.project.pk, self.get_issue())
+        calculate_issue_metrics.assert_called_once_with(
+            self.project.pk,
+            start_date=datetime.datetime(2020, 1, 1, 10, tzinfo=timezone.utc),
+        )
+
+        # Closing the issue changes the metrics from the day it was closed on.
+        calculate_issue_metrics.reset_mock()
+        save_issue(self.project.pk, self.get_issue("2020-02-01T10:00:00Z", ["bug"]))
+        calculate_issue_metrics.assert_called_once_with(
+            self.project.pk,
+            start_date=datetime.datetime(2020, 2, 1, 10, tzinfo=timezone.utc),
+        )
+
+        issue = Issue.objects.get(project=self.project)
+        self.assertEqual(issue.issue_refid, "12")
+        self.assertEqual(issue.labels, ["bug"])
+        self.assertEqual(bump_project_data_version.call_count, 2)
+
+        # Labels are not part of the metrics.
+        calculate_issue_metrics.reset_mock()
+        save_issue(self.project.pk, self.get_issue("2020-02-01T10:00:00Z"))
+        calculate_issue_metrics.assert_not_called()
+
+    @mock.patch("connectors.github.tasks.calculate_issue_metrics")
+    def test_delete_issue(self, calculate_issue_metrics, bump_project_data_version):
+        save_issue(self.project.pk, self.get_issue())
+        calculate_issue_metrics.reset_mock()
+
+        delete_issue(self.project.pk, 12)
+        self.assertFalse(Issue.objects.filter(project=self.project).exists())
+        calculate_issue_metrics.assert_called_once()
+
+        # Deleting it again does nothing.
+        calculate_issue_metrics.reset_mock()
+        delete_issue(self.project.pk, 12)
+        calculate_issue_metrics.assert_not_called()
+
+    @mock.patch("connectors.github.tasks.calculate_pull_request_metrics")
+    def test_save_pull_request(
+        self, calculate_pull_request_metrics, bump_project_data_version
+    ):
+        pull_request = {
+            "number": 3,
+            "created_at": "2020-01-01T10:00:00Z",
+            "updated_at": "2020-01-02T10:00:00Z",
+            "merged_at": "2020-01-02T10:00:00Z",
+            "base": {"ref": "main"},
+            "labels": [],
+        }
+        save_pull_request(self.project.pk, pull_request)
+
+        pull_request_saved = PullRequest.objects.get(project=self.project)
+        self.assertEqual(pull_request_saved.pull_request_refid, "3")
+        self.assertEqual(
+            pull_request_saved.merged_at,
+            datetime.datetime(2020, 1, 2, 10, tzinfo=timezone.utc),
+        )
+        calculate_pull_request_metrics.assert_called_once_with(
+            self.project.pk,
+            start_date=datetime.datetime(2020, 1, 2, 10, tzinfo=timezone.utc),
+        )
+
+        # Pull requests into other branches are skipped.
+        pull_request.update(number=4, base={"ref": "feature"})
+        save_pull_request(self.project.pk, pull_request)
+        self.assertEqual(PullRequest.objects.filter(project=self.project).count(), 1)
+
+    def test_save_and_delete_release(self, bump_project_data_version):
+        release = {
+            "tag_name": "v0.9",
+            "published_at": "2020-01-01T10:00:00Z",
+            "html_url": "https://github.com/codefrog-app/codefrog/releases/v0.9",
+        }
+        save_release(self.project.pk, release)
+        save_release(
+            self.project.pk, dict(release, tag_name="v1.0"), old_tag_name="v0.9"
+        )
+
+        releases = Release.objects.filter(project=self.project)
+        self.assertEqual(list(releases.values_list("name", flat=True)), ["v1.0"])
+
+        # Drafts are not saved.
+        save_release(self.project.pk, dict(release, tag_name="v1.1", published_at=None))
+        self.assertEqual(releases.count(), 1)
+
+        delete_release(self.project.pk, "v1.0")
+        self.assertFalse(releases.exists())
+
+
+class GithubChecksWebhooksTestCase(TestCase):
+    @override_settings(CACHES=LOCMEM_CACHES, GITHUB_WEBHOOK_SECRET="secret")
+    @mock.patch("connectors.github.handlers.run_complexity_check.delay")
+    @mock.patch("connectors.github.handlers.checks.get_project_matching_github_hook")
+    def test_check_suite__requested(self, get_project, delay):
+        caches["github"].clear()
+        get_project.return_value = mock.Mock(pk=1, slug="django-docker-setup")
+
+        # GitHub redelivers the web hook with the same delivery id.
+        for _ in range(2):
+            request = get_hook_request(
+                CHECK_SUITE_REQUESTED,
+                "check_suite",
+                "10c2f4e0-ddfc-11e9-899e-65272afcd6ed",
+            )
+            out = hook(request)
+            self.assertEqual(out.status_code, 202)
+
+        delay.assert_called_once_with(
+            1,
+            1939914,
+            "antonpirker/django-docker-setup",
+            "1cdc05f8e66bd8d99d32186e7b52f82c4fecd87d",
+            "ff6d4a6c035c56e92ea0bda647821bf34822ea53",
+            "http://testserver/project/django-docker-setup",
+        )
+
     def test_installation__created(self):
         rf = RequestFactory()
 
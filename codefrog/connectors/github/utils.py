@@ -1,15 +1,25 @@
+import datetime
 import hashlib
 import hmac
 import json
 import time
 
 import jwt
-import requests
 from django.conf import settings
 from django.http import Http404
+from django.utils import timezone
 from django.utils.crypto import constant_time_compare
+from django.utils.dateparse import parse_datetime
 from urllib.parse import parse_qs
 
+from connectors.github.cache import cache
+from connectors.github.http import get_session
+
+# Installation access tokens expire after one hour.
+# Cached tokens are replaced this many seconds before they expire.
+ACCESS_TOKEN_REFRESH_MARGIN = 5 * 60
+ACCESS_TOKEN_LIFETIME = 60 * 60
+
 
 def create_jwt():
     """
@@ -28,10 +38,54 @@ def create_jwt():
     return token
 
 
+def parse_timestamp(value):
+    """
+    Converts a timestamp of the GitHub API into an aware datetime (or None).
+    """
+    if not value:
+        return None
+
+    return datetime.datetime.strptime(value, "%Y-%m-%dT%H:%M:%SZ").replace(
+        tzinfo=timezone.utc
+    )
+
+
+# Scopes of the requests authenticated as the GitHub App (with a JWT)
+# and of the requests for OAuth access tokens of users.
+APP_SCOPE = "app"
+OAUTH_SCOPE = "oauth"
+
+
+def get_installation_scope(installation_id):
+    """
+    Scope of the requests made with the access token of the installation.
+    """
+    return f"installation:{installation_id}"
+
+
+def get_token_scope(access_token):
+    """
+    Scope of the requests made with an access token (for example of a user).
+    """
+    digest = hashlib.sha1(access_token.encode("utf-8")).hexdigest()
+    return f"token:{digest}"
+
+
+def _access_token_key(installation_id):
+    return f"github:access_token:{installation_id}"
+
+
 def get_access_token(installation_id):
     """
     Authenticate as a Github App and get an installation access token.
+
+    The token is cached (for all workers) until shortly before it expires.
     """
+    key = _access_token_key(installation_id)
+    token = cache.get(key)
+    if token:
+        return token
+
     headers = {
         "Accept": "application/vnd.github.machine-man-preview+json",
         "Authorization": "Bearer %s" % create_jwt(),
@@ -41,12 +95,30 @@ def get_access_token(installation_id):
     api_base_url = "https://api.github.com"
     api_url = f"{api_base_url}{url}"
 
-    out = requests.post(api_url, headers=headers)
+    out = get_session().post(api_url, headers=headers, cache_scope=APP_SCOPE)
     out = json.loads(out.content)
     token = out["token"]
+
+    expires_at = parse_datetime(out.get("expires_at") or "")
+    if expires_at:
+        lifetime = (expires_at - timezone.now()).total_seconds()
+    else:
+        lifetime = ACCESS_TOKEN_LIFETIME
+
+    timeout = int(lifetime - ACCESS_TOKEN_REFRESH_MARGIN)
+    if timeout > 0:
+        cache.set(key, token, timeout=timeout)
+
     return token
 
 
+def delete_access_token(installation_id):
+    """
+    Remove the cached installation access token (e.g. if the app was uninstalled).
+    """
+    cache.delete(_access_token_key(installation_id))
+
+
 def get_user_access_token(code, state):
     api_url = f"https://github.com/login/oauth/access_token"
 
@@ -58,7 +130,7 @@ def get_user_access_token(code, state):
         "state": state,
     }
 
-    out = requests.post(api_url, data=payload)
+    out = get_session().post(api_url, data=payload, cache_scope=OAUTH_SCOPE)
     data = parse_qs(out.content.decode())
     access_token = data["access_token"][0]
 
@@ -75,7 +147,7 @@ def get_app_installations():
     api_base_url = "https://api.github.com"
     api_url = f"{api_base_url}{url}"
 
-    out = requests.get(api_url, headers=headers)
+    out = get_session().get(api_url, headers=headers, cache_scope=APP_SCOPE)
 
     return json.loads(out.content)
 
@@ -90,7 +162,7 @@ def get_repo_installation(repo_owner, repo_name):
     api_base_url = "https://api.github.com"
     api_url = f"{api_base_url}{url}"
 
-    out = requests.get(api_url, headers=headers)
+    out = get_session().get(api_url, headers=headers, cache_scope=APP_SCOPE)
     return json.loads(out.content)
 
 
@@ -102,7 +174,9 @@ def get_installations(access_token):
         "Authorization": "token %s" % access_token,
     }
 
-    out = requests.get(api_url, headers=headers)
+    out = get_session().get(
+        api_url, headers=headers, cache_scope=get_token_scope(access_token)
+    )
 
     return json.loads(out.content)
 
@@ -117,7 +191,9 @@ def get_installation_repositories(access_token, installations_id):
         "Authorization": "token %s" % access_token,
     }
 
-    out = requests.get(api_url, headers=headers)
+    out = get_session().get(
+        api_url, headers=headers, cache_scope=get_token_scope(access_token)
+    )
 
     return json.loads(out.content)
 
@@ -130,12 +206,38 @@ def get_app_installation_repositories(installation_access_token):
         "Authorization": "token %s" % installation_access_token,
     }
 
-    out = requests.get(api_url, headers=headers)
+    out = get_session().get(
+        api_url,
+        headers=headers,
+        cache_scope=get_token_scope(installation_access_token),
+    )
 
     return json.loads(out.content)
 
 
-def create_check_run(repository_full_name, installation_access_token, payload):
+def is_duplicate_webhook(key):
+    """
+    Returns whether a web hook with the given key was already received.
+    """
+    # If the cache is not available `add` returns None and the web hook is processed.
+    added = cache.add(
+        f"github:webhook:{key}",
+        True,
+        timeout=settings.GITHUB_WEBHOOK_DEDUPLICATION_TIMEOUT,
+    )
+    return added is False
+
+
+def forget_webhook(key):
+    """
+    Allows a web hook with the given key to be processed again.
+    """
+    cache.delete(f"github:webhook:{key}")
+
+
+def create_check_run(installation_id, repository_full_name, payload):
+    installation_access_token = get_access_token(installation_id)
+
     url = f"/repos/{repository_full_name}/check-runs"
     api_base_url = "https://api.github.com"
     api_url = f"{api_base_url}{url}"
@@ -145,7 +247,12 @@ def create_check_run(repository_full_name, installation_access_token, payload):
         "Authorization": "token %s" % installation_access_token,
     }
 
-    out = requests.post(api_url, data=json.dumps(payload), headers=headers)
+    out = get_session().post(
+        api_url,
+        data=json.dumps(payload),
+        headers=headers,
+        cache_scope=get_installation_scope(installation_id),
+    )
     return out
 
 
@@ -161,7 +268,9 @@ def get_repository(installation_id, repository_full_name):
         "Authorization": "token %s" % installation_access_token,
     }
 
-    out = requests.get(api_url, headers=headers)
+    out = get_session().get(
+        api_url, headers=headers, cache_scope=get_installation_scope(installation_id)
+    )
     return json.loads(out.content)
 
 
@@ -10,6 +10,7 @@ from django.urls import reverse
 from django.utils.text import slugify
 from django.views.decorators.csrf import csrf_exempt
 
+from connectors.github import ratelimit
 from connectors.github.router import github_hook
 from core.models import Project
 from core.utils import GitHub
@@ -20,6 +21,7 @@ logger = structlog.get_logger(__name__)
 
 
 @csrf_exempt
+@ratelimit.fail_fast()
 def hook(request):
     logger.debug("########## hook")
     logger.debug("########## hook request.headers: %s " % request.headers)
@@ -27,10 +29,21 @@ def hook(request):
 
     if "X-Github-Event" in request.headers:
         logger.debug("GitHub web hook received")
-        msg = github_hook(request)
+        try:
+            msg = github_hook(request)
+        except ratelimit.RateLimitExceeded as err:
+            # Do not keep GitHub waiting, the web hook can be redelivered.
+            logger.warning(str(err))
+            response = HttpResponse(str(err), status=503)
+            response["Retry-After"] = int(err.wait) + 1
+            return response
     else:
         msg = "Not implemented yet."
 
+    # Handlers that only queue their work answer with `202 Accepted`.
+    if isinstance(msg, HttpResponse):
+        return msg
+
     return HttpResponse(msg)
 
 
@@ -50,6 +63,7 @@ def setup(request):
 
 
 @csrf_exempt
+@ratelimit.fail_fast()
 def authorization(request):
     logger.debug("########## authorization")
     logger.debug("-----------------------------------------------------------")
@@ -0,0 +1,321 @@
+import itertools
+import json
+import zipfile
+
+import numpy as np
+import pandas as pd
+from django.db import transaction
+
+from core.bulk import copy_rows
+from core.cache import bump_project_data_version
+from core.models import Complexity, Metric, Release
+from engine.models import CodeChange, Issue, PullRequest
+
+ARCHIVE_VERSION = 1
+
+# Number of rows read from the database and encoded at once
+ARCHIVE_CHUNK_SIZE = 10000
+
+# Tables in the archive with their columns and how the columns are stored.
+# The issues come before the code changes, which reference them by `issue_refid`.
+ARCHIVE_TABLES = [
+    (
+        "issues",
+        Issue,
+        [
+            ("issue_refid", "string"),
+            ("opened_at", "datetime"),
+            ("closed_at", "datetime"),
+            ("labels", "json"),
+            ("category", "string"),
+        ],
+    ),
+    (
+        "pull_requests",
+        PullRequest,
+        [
+            ("pull_request_refid", "string"),
+            ("opened_at", "datetime"),
+            ("merged_at", "datetime"),
+            ("age", "integer"),
+            ("labels", "json"),
+            ("category", "string"),
+        ],
+    ),
+    (
+        "code_changes",
+        CodeChange,
+        [
+            ("timestamp", "datetime"),
+            ("day", "date"),
+            ("file_path", "string"),
+            ("author", "string"),
+            ("complexity_added", "integer"),
+            ("complexity_removed", "integer"),
+            ("description", "string"),
+            ("git_commit_hash", "string"),
+            ("issue__issue_refid", "string"),
+        ],
+    ),
+    (
+        "complexities",
+        Complexity,
+        [
+            ("timestamp", "datetime"),
+            ("file_path", "string"),
+            ("complexity", "integer"),
+        ],
+    ),
+    (
+        "releases",
+        Release,
+        [
+            ("timestamp", "datetime"),
+            ("type", "string"),
+            ("name", "string"),
+            ("url", "string"),
+        ],
+    ),
+    (
+        "metrics",
+        Metric,
+        [
+            ("date", "date"),
+            ("file_path", "string"),
+            ("metrics", "json"),
+        ],
+    ),
+]
+
+
+class ColumnEncoder:
+    """
+    Converts the values of a column into NumPy arrays, chunk by chunk.
+
+    Strings are dictionary encoded: every distinct string is stored once
+    (as utf-8 in one byte array with the offsets of the strings)
+    and the column holds the index of the string (-1 for None).
+    The dictionary is shared by all chunks of the column.
+    """
+
+    def __init__(self, kind):
+        if kind not in ("string", "json", "datetime", "date", "integer"):
+            raise ValueError(f"Unknown column type {kind}")
+
+        self.kind = kind
+        self.chunks = {}
+        self.string_codes = {}
+        self.strings = bytearray()
+        self.offsets = [0]
+
+    def append(self, values):
+        """
+        Encodes a chunk of values (a sequence) of the column.
+        """
+        kind = self.kind
+        if kind == "json":
+            values = [
+                json.dumps(value) if value is not None else None for value in values
+            ]
+            kind = "string"
+
+        if kind == "string":
+            codes, uniques = pd.factorize(pd.Series(values, dtype=object))
+            lookup = np.empty(len(uniques) + 1, dtype=np.int32)
+            lookup[-1] = -1  # The code -1 (None) selects the last item.
+            for i, value in enumerate(uniques):
+                if value not in self.string_codes:
+                    self.string_codes[value] = len(self.string_codes)
+                    self.strings += value.encode("utf-8")
+                    self.offsets.append(len(self.strings))
+                lookup[i] = self.string_codes[value]
+            self._add("codes", lookup[codes])
+
+        elif kind == "datetime":
+            timestamps = pd.to_datetime(pd.Series(values, dtype=object), utc=True)
+            self._add(
+                "values",
+                timestamps.dt.tz_localize(None).to_numpy().astype("datetime64[us]"),
+            )
+
+        elif kind == "date":
+            self._add("values", np.array(values, dtype="datetime64[D]"))
+
+        elif kind == "integer":
+            self._add(
+                "values",
+                np.array(
+                    [value if value is not None else 0 for value in values],
+                    dtype=np.int64,
+                ),
+            )
+            self._add(
+                "nulls", np.array([value is None for value in values], dtype=bool)
+            )
+
+    def _add(self, part, array):
+        self.chunks.setdefault(part, []).append(array)
+
+    def finish(self):
+        """
+        :return: Dict of the name of the part and the array.
+        """
+        dtypes = {
+            "string": {"codes": np.int32},
+            "json": {"codes": np.int32},
+            "datetime": {"values": "datetime64[us]"},
+            "date": {"values": "datetime64[D]"},
+            "integer": {"values": np.int64, "nulls": bool},
+        }[self.kind]
+
+        parts = {
+            part: np.concatenate(self.chunks.get(part, [np.empty(0, dtype=dtype)]))
+            for part, dtype in dtypes.items()
+        }
+        if self.kind in ("string", "json"):
+            parts["strings"] = np.frombuffer(bytes(self.strings), dtype=np.uint8)
+            parts["offsets"] = np.array(self.offsets, dtype=np.int64)
+
+        return parts
+
+
+def decode_column(parts, kind):
+    """
+    Converts the arrays of an encoded column back into a list of values.
+    """
+    if kind in ("string", "json"):
+        strings = parts["strings"].tobytes()
+        offsets = parts["offsets"]
+        uniques = [
+            strings[offsets[i] : offsets[i + 1]].decode("utf-8")
+            for i in range(len(offsets) - 1)
+        ]
+        if kind == "json":
+            uniques = [json.loads(value) for value in uniques]
+
+        # The code -1 selects the last item, None.
+        lookup = np.empty(len(uniques) + 1, dtype=object)
+        lookup[:-1] = uniques
+        return lookup[parts["codes"]].tolist()
+
+    if kind in ("datetime", "date"):
+        values = parts["values"]
+        if kind == "datetime":
+            strings = np.datetime_as_string(values, unit="us", timezone="UTC")
+        else:
+            strings = np.datetime_as_string(values, unit="D")
+        strings = strings.astype(object)
+        strings[np.isnat(values)] = None
+        return strings.tolist()
+
+    if kind == "integer":
+        values = parts["values"].astype(object)
+        values[parts["nulls"]] = None
+        return values.tolist()
+
+    raise ValueError(f"Unknown column type {kind}")
+
+
+def write_array(archive, name, array):
+    """
+    Writes one array into the zip file of an `.npz` archive.
+    """
+    with archive.open(f"{name}.npy", "w", force_zip64=True) as file:
+        np.lib.format.write_array(file, array, allow_pickle=False)
+
+
+def export_archive(project, file):
+    """
+    Writes the imported data of the project into a compressed `.npz` archive.
+
+    The rows are read in chunks and every column is encoded into typed arrays
+    right away. The arrays of a table are written into the archive
+    before the next table is read.
+    """
+    meta = {
+        "version": ARCHIVE_VERSION,
+        "project": project.github_repo_name,
+        "tables": {},
+    }
+
+    with zipfile.ZipFile(file, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, model, columns in ARCHIVE_TABLES:
+            fields = [field for field, kind in columns]
+            encoders = [ColumnEncoder(kind) for field, kind in columns]
+
+            rows = (
+                model.objects.filter(project=project)
+                .order_by("pk")
+                .values_list(*fields)
+                .iterator(chunk_size=ARCHIVE_CHUNK_SIZE)
+            )
+            count = 0
+            while True:
+                chunk = list(itertools.islice(rows, ARCHIVE_CHUNK_SIZE))
+                if not chunk:
+                    break
+
+                for encoder, values in zip(encoders, zip(*chunk)):
+                    encoder.append(values)
+                count += len(chunk)
+
+            for field, encoder in zip(fields, encoders):
+                for part, array in encoder.finish().items():
+                    write_array(archive, f"{name}.{field}.{part}", array)
+
+            meta["tables"][name] = count
+
+        write_array(
+            archive,
+            "meta",
+            np.frombuffer(json.dumps(meta).encode("utf-8"), dtype=np.uint8),
+        )
+
+    return meta
+
+
+def import_archive(project, file):
+    """
+    Loads an archive written by `export_archive` into the project using COPY.
+
+    Existing data of the project in the archived tables is replaced.
+    """
+    archive = np.load(file, allow_pickle=False)
+    meta = json.loads(archive["meta"].tobytes().decode("utf-8"))
+    if meta["version"] != ARCHIVE_VERSION:
+        raise ValueError(f"Unsupported archive version {meta['version']}")
+
+    with transaction.atomic():
+        # In reverse, so the code changes are deleted before the issues they reference.
+        for name, model, columns in reversed(ARCHIVE_TABLES):
+            model.objects.filter(project=project).delete()
+
+        for name, model, columns in ARCHIVE_TABLES:
+            db_columns = ["project_id"]
+            values = [[project.pk] * meta["tables"][name]]
+
+            for field, kind in columns:
+                parts = {
+                    key.rsplit(".", 1)[1]: archive[key]
+                    for key in archive.files
+                    if key.startswith(f"{name}.{field}.")
+                }
+                column = decode_column(parts, kind)
+
+                if field == "issue__issue_refid":
+                    issue_ids = dict(
+                        Issue.objects.filter(project=project).values_list(
+                            "issue_refid", "pk"
+                        )
+                    )
+                    column = [issue_ids.get(refid) for refid in column]
+                    field = "issue"
+
+                db_columns.append(model._meta.get_field(field).column)
+                values.append(column)
+
+            copy_rows(model._meta.db_table, db_columns, zip(*values))
+
+    bump_project_data_version(project.pk)
+
+    return meta
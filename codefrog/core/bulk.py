@@ -0,0 +1,144 @@
+import datetime
+import io
+import json
+
+from django.db import connection, transaction
+
+# Number of rows sent to the database in one COPY statement.
+COPY_BATCH_SIZE = 50000
+
+
+def escape(text):
+    """
+    Escapes a string for the text format of COPY.
+    """
+    return (
+        text.replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def to_copy_value(value):
+    """
+    Converts a Python value to its representation in the text format of COPY.
+    """
+    if value is None:
+        return "\\N"
+
+    if isinstance(value, bool):
+        return "t" if value else "f"
+
+    if isinstance(value, dict):
+        return escape(json.dumps(value))
+
+    if isinstance(value, (list, tuple)):
+        # Postgres array literal
+        items = [
+            '"' + str(item).replace("\\", "\\\\").replace('"', '\\"') + '"'
+            for item in value
+        ]
+        return escape("{" + ",".join(items) + "}")
+
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+
+    return escape(str(value))
+
+
+def copy_rows(table, columns, rows):
+    """
+    Loads rows into a database table using `COPY ... FROM STDIN`.
+
+    :param table: Name of the database table.
+    :param columns: Names of the database columns in the order of the values in a row.
+    :param rows: Iterable of rows, each a sequence of values.
+    :return: Number of rows copied.
+    """
+    sql = "COPY {} ({}) FROM STDIN".format(
+        connection.ops.quote_name(table),
+        ", ".join(connection.ops.quote_name(column) for column in columns),
+    )
+
+    def copy(lines):
+        with connection.cursor() as cursor:
+            cursor.copy_expert(sql, io.StringIO("".join(lines)))
+
+    count = 0
+    lines = []
+    for row in rows:
+        lines.append("\t".join(to_copy_value(value) for value in row) + "\n")
+        count += 1
+
+        if len(lines) == COPY_BATCH_SIZE:
+            copy(lines)
+            lines = []
+
+    if lines:
+        copy(lines)
+
+    return count
+
+
+def merge_rows(model, fields, rows, unique_fields, update_fields=()):
+    """
+    Inserts or updates rows of a model using a staging table.
+
+    The rows are loaded with COPY into a temporary table and then merged
+    into the table of the model with one `INSERT ... ON CONFLICT`.
+    No model instances are created and `save()` is not called.
+
+    :param model: The model to load the rows into.
+    :param fields: Names of the fields in the order of the values in a row.
+    :param rows: Iterable of rows, each a sequence of values.
+    :param unique_fields: Fields of a unique constraint identifying a row.
+        If a row is given more than once, the last one is used.
+    :param update_fields: Fields to overwrite if the row already exists
+        (JSON objects are merged key by key). If empty, existing rows are kept.
+    :return: Number of rows inserted or updated.
+    """
+    qn = connection.ops.quote_name
+    opts = model._meta
+    table = qn(opts.db_table)
+    staging = qn(f"{opts.db_table}_staging")
+
+    columns = [opts.get_field(field).column for field in fields]
+    column_list = ", ".join(qn(column) for column in columns)
+    unique_list = ", ".join(qn(opts.get_field(field).column) for field in unique_fields)
+
+    updates = []
+    for field in update_fields:
+        field = opts.get_field(field)
+        column = qn(field.column)
+        if field.get_internal_type() == "JSONField":
+            updates.append(
+                f"{column} = COALESCE({table}.{column}, '{{}}'::jsonb) "
+                f"|| EXCLUDED.{column}"
+            )
+        else:
+            updates.append(f"{column} = EXCLUDED.{column}")
+    on_conflict = f"DO UPDATE SET {', '.join(updates)}" if updates else "DO NOTHING"
+
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {staging}")
+            cursor.execute(
+                f"CREATE TEMPORARY TABLE {staging} ON COMMIT DROP AS "
+                f"SELECT {column_list} FROM {table} WITH NO DATA"
+            )
+            # Remembers the order of the rows, so the last duplicate wins.
+            cursor.execute(f"ALTER TABLE {staging} ADD COLUMN _row_number serial")
+
+        copy_rows(f"{opts.db_table}_staging", columns, rows)
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} ({column_list}) "
+                f"SELECT DISTINCT ON ({unique_list}) {column_list} FROM {staging} "
+                f"ORDER BY {unique_list}, _row_number DESC "
+                f"ON CONFLICT ({unique_list}) {on_conflict}"
+            )
+            count = cursor.rowcount
+
+    return count
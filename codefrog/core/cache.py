@@ -0,0 +1,156 @@
+import hashlib
+import time
+import uuid
+from contextlib import contextmanager
+
+import structlog
+from django.conf import settings
+from django.core.cache import cache, caches
+
+logger = structlog.get_logger(__name__)
+
+MISSING = object()
+
+ANALYTICS = (
+    "metrics",
+    "releases",
+    "file_changes",
+    "source_tree",
+    "file_status",
+    "state_of_affairs",
+)
+
+
+def _version_key(project_id):
+    return f"analytics:{project_id}:version"
+
+
+def _stats_key(name, event):
+    return f"analytics:stats:{name}:{event}"
+
+
+def _lock_key(name):
+    return f"lock:{name}"
+
+
+def _increment(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, timeout=None)
+
+
+def get_project_data_version(project_id):
+    """
+    Return the current version of the data of the given project.
+
+    The version is part of every cache key of the project,
+    so bumping it makes all cached analytics of the project unreachable at once.
+    """
+    key = _version_key(project_id)
+    version = cache.get(key)
+    if version is None:
+        # Start with the current time so a lost version key
+        # can never revive entries cached under an old version.
+        cache.add(key, int(time.time()), timeout=None)
+        version = cache.get(key)
+
+    return version
+
+
+def bump_project_data_version(project_id):
+    """
+    Invalidate all cached analytics of the given project.
+    """
+    key = _version_key(project_id)
+    try:
+        version = cache.incr(key)
+    except ValueError:
+        version = int(time.time())
+        cache.set(key, version, timeout=None)
+
+    logger.info("Project(%s): Bumped data version to %s.", project_id, version)
+    return version
+
+
+def get_cache_key(project_id, name, params):
+    version = get_project_data_version(project_id)
+    params_hash = hashlib.md5(repr(sorted(params.items())).encode("utf-8")).hexdigest()
+
+    return f"analytics:{project_id}:{version}:{name}:{params_hash}"
+
+
+def get_or_compute(project_id, name, params, compute):
+    """
+    Return the cached analytics `name` of the project or compute and cache them.
+
+    :param project_id: The project the analytics belong to.
+    :param name: Name of the analytics (e.g. "metrics").
+    :param params: Dict of all parameters the result depends on.
+    :param compute: Callable without arguments that computes the result.
+    :return: The cached or freshly computed result.
+    """
+    key = get_cache_key(project_id, name, params)
+
+    value = cache.get(key, MISSING)
+    if value is not MISSING:
+        _increment(_stats_key(name, "hits"))
+        return value
+
+    _increment(_stats_key(name, "misses"))
+    value = compute()
+    cache.set(key, value, timeout=settings.ANALYTICS_CACHE_TIMEOUT)
+
+    return value
+
+
+def get_cache_stats(names=ANALYTICS):
+    """
+    Return the number of cache hits and misses for the given analytics.
+    """
+    keys = [_stats_key(name, event) for name in names for event in ("hits", "misses")]
+    counters = cache.get_many(keys)
+
+    return {
+        name: {
+            event: counters.get(_stats_key(name, event), 0)
+            for event in ("hits", "misses")
+        }
+        for name in names
+    }
+
+
+class LockTimeout(Exception):
+    pass
+
+
+@contextmanager
+def lock(name, timeout, wait=None):
+    """
+    Lock shared by all processes, held while the block runs.
+
+    The lock is kept in the persistent "locks" cache, which does not evict keys
+    and raises its errors, so the block never runs without holding the lock.
+
+    :param timeout: Seconds after which the lock is released,
+        in case the process holding it dies.
+    :param wait: Seconds to wait for the lock before `LockTimeout` is raised
+        (defaults to `timeout`).
+    """
+    locks = caches["locks"]
+    key = _lock_key(name)
+    token = uuid.uuid4().hex
+    wait = timeout if wait is None else wait
+
+    started = time.time()
+    while not locks.add(key, token, timeout=timeout):
+        if time.time() - started >= wait:
+            raise LockTimeout(f"Could not get lock {name} within {wait}s.")
+        time.sleep(1)
+
+    try:
+        yield
+    finally:
+        # Do not release the lock of another process if ours expired.
+        if locks.get(key) == token:
+            locks.delete(key)
@@ -0,0 +1,99 @@
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from core.models import Metric
+from engine.models import CodeChange, Issue, PullRequest
+
+# Number of rows fetched from the database at once.
+EXPORT_CHUNK_SIZE = 5000
+
+# Tables that can be exported and the exported fields.
+EXPORTS = {
+    "code-changes": (
+        CodeChange,
+        [
+            "id",
+            "timestamp",
+            "git_commit_hash",
+            "file_path",
+            "author",
+            "complexity_added",
+            "complexity_removed",
+            "description",
+        ],
+    ),
+    "issues": (
+        Issue,
+        [
+            "id",
+            "issue_refid",
+            "opened_at",
+            "closed_at",
+            "labels",
+            "category",
+        ],
+    ),
+    "pull-requests": (
+        PullRequest,
+        [
+            "id",
+            "pull_request_refid",
+            "opened_at",
+            "merged_at",
+            "age",
+            "labels",
+            "category",
+        ],
+    ),
+    "metrics": (
+        Metric,
+        [
+            "id",
+            "date",
+            "file_path",
+            "metrics",
+        ],
+    ),
+}
+
+
+def iter_ndjson(project_id, name):
+    """
+    Yields all rows of the table `name` of the project as newline delimited JSON.
+
+    The rows are read with a server side cursor and yielded in chunks,
+    so the memory used does not depend on the number of rows.
+    """
+    model, fields = EXPORTS[name]
+    rows = (
+        model.objects.filter(project_id=project_id)
+        .order_by("pk")
+        .values_list(*fields)
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+
+    encoder = DjangoJSONEncoder(separators=(",", ":"))
+    lines = []
+    for row in rows:
+        lines.append(encoder.encode(dict(zip(fields, row))))
+        if len(lines) == EXPORT_CHUNK_SIZE:
+            yield ("\n".join(lines) + "\n").encode("utf-8")
+            lines = []
+
+    if lines:
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def iter_gzip(chunks):
+    """
+    Compresses the given chunks of bytes into a gzip stream.
+    """
+    # wbits=31 writes a gzip header and trailer.
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+
+    yield compressor.flush()
@@ -0,0 +1,40 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.export import EXPORTS, iter_gzip, iter_ndjson
+from core.models import Project
+
+
+class Command(BaseCommand):
+    help = "Export raw data of a project as newline delimited JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument("project_id", type=int)
+        parser.add_argument("table", choices=sorted(EXPORTS.keys()))
+        parser.add_argument(
+            "--output",
+            help="File to write to. Defaults to stdout.",
+        )
+        parser.add_argument(
+            "--gzip",
+            action="store_true",
+            help="Compress the output with gzip.",
+        )
+
+    def handle(self, *args, **options):
+        if not Project.objects.filter(pk=options["project_id"]).exists():
+            raise CommandError(f"Project {options['project_id']} does not exist.")
+
+        chunks = iter_ndjson(options["project_id"], options["table"])
+        if options["gzip"]:
+            chunks = iter_gzip(chunks)
+
+        if options["output"]:
+            with open(options["output"], "wb") as output:
+                for chunk in chunks:
+                    output.write(chunk)
+        else:
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.archive import export_archive
+from core.models import Project
+
+
+class Command(BaseCommand):
+    help = "Export the imported data of a project into a compact archive (.npz)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("project_id", type=int)
+        parser.add_argument("output", help="File to write the archive to.")
+
+    def handle(self, *args, **options):
+        try:
+            project = Project.objects.get(pk=options["project_id"])
+        except Project.DoesNotExist:
+            raise CommandError(f"Project {options['project_id']} does not exist.")
+
+        with open(options["output"], "wb") as output:
+            meta = export_archive(project, output)
+
+        for name, count in meta["tables"].items():
+            self.stdout.write(f"{name}: {count} rows")
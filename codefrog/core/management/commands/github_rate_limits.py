@@ -0,0 +1,33 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+
+from connectors.github.ratelimit import get_rate_limit_stats
+from web.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = "Show the remaining GitHub rate limit budget of every installation."
+
+    def handle(self, *args, **options):
+        installation_ids = (
+            UserProfile.objects.filter(github_app_installation_refid__isnull=False)
+            .order_by("github_app_installation_refid")
+            .values_list("github_app_installation_refid", flat=True)
+            .distinct()
+        )
+        scopes = ["public"] + [
+            f"installation:{installation_id}" for installation_id in installation_ids
+        ]
+
+        for scope, stats in get_rate_limit_stats(scopes).items():
+            reset = (
+                datetime.datetime.fromtimestamp(stats["reset"]).isoformat()
+                if stats["reset"]
+                else "-"
+            )
+            remaining = stats["remaining"] if stats["remaining"] is not None else "-"
+            self.stdout.write(
+                f"{scope}: remaining={remaining} reset={reset} "
+                f"requests={stats['requests']} throttled={stats['throttled']}"
+            )
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.archive import import_archive
+from core.models import Project
+
+
+class Command(BaseCommand):
+    help = (
+        "Import an archive written by export_project_archive into a project. "
+        "Replaces the existing data of the project."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("project_id", type=int)
+        parser.add_argument("input", help="Archive file to import.")
+
+    def handle(self, *args, **options):
+        try:
+            project = Project.objects.get(pk=options["project_id"])
+        except Project.DoesNotExist:
+            raise CommandError(f"Project {options['project_id']} does not exist.")
+
+        with open(options["input"], "rb") as archive:
+            try:
+                meta = import_archive(project, archive)
+            except ValueError as e:
+                raise CommandError(str(e))
+
+        for name, count in meta["tables"].items():
+            self.stdout.write(f"{name}: {count} rows")
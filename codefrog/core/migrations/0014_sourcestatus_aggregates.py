@@ -0,0 +1,89 @@
+# Generated by Django 3.2.11 on 2026-10-19 14:48
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+from django.db.models import Count, F, Max, Min, Sum
+
+HOTSPOTS_PER_SOURCE_STATUS = 10
+
+
+def up(apps, schema_editor):
+    SourceStatus = apps.get_model("core", "SourceStatus")
+    SourceNode = apps.get_model("core", "SourceNode")
+
+    for source_status in SourceStatus.objects.filter(active=True):
+        nodes = SourceNode.objects.filter(source_status=source_status)
+        aggregates = nodes.aggregate(
+            Min("changes"),
+            Max("changes"),
+            Min("complexity"),
+            Max("complexity"),
+        )
+        source_status.min_changes = aggregates["changes__min"] or 1
+        source_status.max_changes = aggregates["changes__max"] or 1
+        source_status.min_complexity = aggregates["complexity__min"] or 1
+        source_status.max_complexity = aggregates["complexity__max"] or 1
+
+        files = nodes.exclude(repo_link="")
+        aggregates = files.aggregate(Count("pk"), Sum("complexity"))
+        source_status.total_files = aggregates["pk__count"] or 0
+        source_status.total_complexity = aggregates["complexity__sum"] or 0
+
+        hotspots = files.annotate(hotspot=F("changes") * F("complexity")).order_by(
+            "-hotspot", "path"
+        )[:HOTSPOTS_PER_SOURCE_STATUS]
+        source_status.hotspots = [
+            {
+                "path": "/".join(node.path.split("/")[1:]),
+                "size": node.complexity,
+                "changes": node.changes,
+            }
+            for node in hotspots
+        ]
+        source_status.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0013_auto_20201013_0952"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="sourcestatus",
+            name="hotspots",
+            field=django.contrib.postgres.fields.jsonb.JSONField(default=list),
+        ),
+        migrations.AddField(
+            model_name="sourcestatus",
+            name="max_changes",
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name="sourcestatus",
+            name="max_complexity",
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name="sourcestatus",
+            name="min_changes",
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name="sourcestatus",
+            name="min_complexity",
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name="sourcestatus",
+            name="total_complexity",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="sourcestatus",
+            name="total_files",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(up, reverse_code=migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.2.11 on 2026-10-19 15:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0014_sourcestatus_aggregates"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="complexity",
+            index=models.Index(
+                fields=["project", "file_path", "timestamp"],
+                name="complexity_file_time_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="sourcenode",
+            index=models.Index(
+                fields=["source_status", "path"],
+                name="sourcenode_path_idx",
+                opclasses=["int4_ops", "varchar_pattern_ops"],
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.11 on 2026-10-19 15:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0015_query_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="project",
+            name="pull_requests_updated_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,49 @@
+from collections import Counter, defaultdict
+
+from django.db import migrations
+
+
+def up(apps, schema_editor):
+    """
+    Rolls up the ownership of the files into the directories of the active
+    source statuses, like `SourceStatus.calculate_directory_ownership`
+    does for new ones.
+    """
+    SourceStatus = apps.get_model("core", "SourceStatus")
+    SourceNode = apps.get_model("core", "SourceNode")
+
+    for source_status in SourceStatus.objects.filter(active=True):
+        nodes = SourceNode.objects.filter(source_status=source_status).order_by(
+            "-level"
+        )
+        lines = defaultdict(Counter)
+        directories = []
+
+        for node in nodes.only("pk", "parent", "level", "repo_link", "ownership"):
+            if node.repo_link != "":
+                node_lines = Counter()
+                for node_ownership in node.ownership:
+                    node_lines[node_ownership["author"]] += node_ownership["lines"]
+            else:
+                node_lines = lines.pop(node.pk, Counter())
+                node.ownership = [
+                    {"author": author, "lines": author_lines}
+                    for author, author_lines in node_lines.most_common()
+                ]
+                directories.append(node)
+
+            if node.parent_id:
+                lines[node.parent_id].update(node_lines)
+
+        SourceNode.objects.bulk_update(directories, ["ownership"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0016_project_pull_requests_updated_at"),
+    ]
+
+    operations = [
+        migrations.RunPython(up, reverse_code=migrations.RunPython.noop),
+    ]
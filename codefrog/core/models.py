@@ -1,6 +1,7 @@
 import os
 import shutil
 import tempfile
+from collections import Counter, defaultdict
 from contextlib import contextmanager
 from datetime import timedelta
 
@@ -8,12 +9,14 @@ import structlog
 from django.conf import settings
 from django.contrib.postgres.fields import JSONField
 from django.db import models
-from django.db.models import Count, Max, Min
+from django.db.models import Count, F, Max, Min, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, Substr
 from django.utils import timezone
 from mptt.models import MPTTModel, TreeForeignKey
 
+from core.cache import bump_project_data_version
 from core.mixins import GithubMixin
-from core.utils import date_range, run_shell_command, log
+from core.utils import as_date, date_range, get_day_range, run_shell_command, log
 from engine.models import CodeChange
 from settings import DEFAULT_TASK_EXPIRATION
 
@@ -29,6 +32,8 @@ STATUS_CHOICES = (
     (STATUS_UPDATING, "updating"),
 )
 
+HOTSPOTS_PER_SOURCE_STATUS = 10
+
 # Possibly nice projects to import:
 """
 Angular	https://github.com/angular/angular
@@ -69,6 +74,8 @@ class Project(GithubMixin, models.Model):
     status = models.IntegerField(choices=STATUS_CHOICES, default=STATUS_READY)
 
     last_update = models.DateTimeField(null=True, blank=True)
+    # Last update of the pull requests imported so far.
+    pull_requests_updated_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         return f"{self.name} ({self.pk})"
@@ -103,38 +110,47 @@ class Project(GithubMixin, models.Model):
             "active": True,
         }
         if date:
-            kwargs["timestamp__date__lte"] = date
+            kwargs["timestamp__lt"] = get_day_range(None, date)[1]
 
         return self.source_stati.filter(**kwargs).order_by("timestamp").last()
 
     def get_file_changes(self, date_from, date_to):
+        """
+        Return all files of the current source status ranked by their number of changes.
+
+        The changes of every file are counted in a subquery,
+        so the returned queryset can be ranked and paginated in the database.
+
+        :return: Queryset of dicts with `file_path`, `change_count` and `repo_link`.
+        """
         changes = (
             CodeChange.objects.filter(
                 project=self,
-                timestamp__date__gte=date_from,
-                timestamp__date__lte=date_to,
+                file_path=OuterRef("file_path"),
+                day__gte=as_date(date_from),
+                day__lte=as_date(date_to),
             )
+            .order_by()
             .values("file_path")
-            .annotate(changes=Count("file_path"))
-            .order_by("-changes", "file_path")
+            .annotate(change_count=Count("pk"))
+            .values("change_count")
         )
 
-        changes_dict = {x["file_path"]: x["changes"] for x in changes}
-        all_nodes = SourceNode.objects.filter(source_status=self.current_source_status)
-        all_paths = list(filter(None, list(set(x.project_path for x in all_nodes))))
+        # remove first directory
+        path_start = len(self.github_repo_name) + 2
 
-        out = []
-        for path in all_paths:
-            out.append(
-                {
-                    "file_path": path,
-                    "changes": changes_dict.get(path, 0),
-                    "repo_link": self.get_repo_link(path),
-                }
+        return (
+            SourceNode.objects.filter(source_status=self.current_source_status)
+            .exclude(repo_link="")
+            .annotate(file_path=Substr("path", path_start))
+            .annotate(
+                change_count=Coalesce(
+                    Subquery(changes, output_field=models.IntegerField()), 0
+                ),
             )
-
-        out.sort(key=lambda x: x["changes"], reverse=True)
-        return out
+            .values("file_path", "change_count", "repo_link")
+            .order_by("-change_count", "file_path")
+        )
 
     def get_repo_link(self, path):
         return f"{self.github_repo_url}/blame/master/{path}"
@@ -302,6 +318,8 @@ class Project(GithubMixin, models.Model):
         self.status = STATUS_READY
         self.save()
 
+        bump_project_data_version(self.pk)
+
     def clone_repo(self):
         from connectors.git.tasks import clone_repo
 
@@ -366,29 +384,69 @@ class Project(GithubMixin, models.Model):
         )
 
     def get_state_of_affairs(self, date_from, date_to):
-        avg_issue_age = self.get_avg_issue_age(date_from, date_to)
-        avg_pr_age = self.get_avg_pr_age(date_from, date_to)
+        state_of_affairs = self.get_state_of_affairs_for_projects(
+            [self], date_from, date_to
+        )
+        return state_of_affairs[self.pk]
 
-        # get metrics of previous period
+    @classmethod
+    def get_state_of_affairs_for_projects(cls, projects, date_from, date_to):
+        """
+        Return the state of affairs of many projects in a constant number of queries.
+
+        All the numbers of the state of affairs are taken from the last metric
+        before the start and the last metric before the end of the time period.
+        Those are loaded for all projects at once.
+
+        :return: Dict with the state of affairs of every project by project id.
+        """
         days = (date_to - date_from).days
         date_from_past = date_from - timedelta(days=days)
-        date_to_past = date_from
-        avg_issue_age_past = self.get_avg_issue_age(date_from_past, date_to_past)
-        avg_pr_age_past = self.get_avg_pr_age(date_from_past, date_to_past)
-
-        state_of_affairs = {
-            "complexity_change": self.get_complexity_change(date_from, date_to),
-            "issue_age": avg_issue_age,
-            "issue_age_change": self.get_value_change(
-                avg_issue_age_past, avg_issue_age
-            ),
-            "pr_age": avg_pr_age,
-            "pr_age_change": self.get_value_change(avg_pr_age_past, avg_pr_age),
-        }
+
+        project_ids = [project.pk for project in projects]
+        metrics_from = Metric.objects.get_last_per_project(project_ids, date_from)
+        metrics_to = Metric.objects.get_last_per_project(project_ids, date_to)
+
+        state_of_affairs = {}
+        for project_id in project_ids:
+            metric_from = metrics_from.get(project_id)
+            metric_to = metrics_to.get(project_id)
+
+            # The last metric of the period (and the previous period)
+            # is the last metric before its end, if it is inside the period.
+            metric = (
+                metric_to
+                if metric_to and metric_to.date >= as_date(date_from)
+                else None
+            )
+            metric_past = (
+                metric_from
+                if metric_from and metric_from.date >= as_date(date_from_past)
+                else None
+            )
+
+            avg_issue_age = metric.get_issue_age() if metric else 0
+            avg_pr_age = metric.get_pr_age() if metric else 0
+            avg_issue_age_past = metric_past.get_issue_age() if metric_past else 0
+            avg_pr_age_past = metric_past.get_pr_age() if metric_past else 0
+
+            complexity = metric_to.get_complexity() if metric_to else 0
+            ref_complexity = metric_from.get_complexity() if metric_from else 0
+
+            state_of_affairs[project_id] = {
+                "complexity_change": cls.get_value_change(ref_complexity, complexity),
+                "issue_age": avg_issue_age,
+                "issue_age_change": cls.get_value_change(
+                    avg_issue_age_past, avg_issue_age
+                ),
+                "pr_age": avg_pr_age,
+                "pr_age_change": cls.get_value_change(avg_pr_age_past, avg_pr_age),
+            }
 
         return state_of_affairs
 
-    def get_value_change(self, old_value, new_value):
+    @staticmethod
+    def get_value_change(old_value, new_value):
         old_value = old_value if old_value != 0 else 1
         new_value = new_value if new_value != 0 else 1
         change = new_value / old_value * 100 - 100
@@ -406,15 +464,8 @@ class Project(GithubMixin, models.Model):
             .last()
         )
 
-        try:
-            complexity = metric.metrics["complexity"]
-        except (KeyError, AttributeError):
-            complexity = 0
-
-        try:
-            ref_complexity = ref_metric.metrics["complexity"]
-        except (KeyError, AttributeError):
-            ref_complexity = 0
+        complexity = metric.get_complexity() if metric else 0
+        ref_complexity = ref_metric.get_complexity() if ref_metric else 0
 
         change = self.get_value_change(ref_complexity, complexity)
         return change
@@ -429,11 +480,7 @@ class Project(GithubMixin, models.Model):
         age = 0
         metric = Metric.objects.filter(**kwargs).order_by("date").last()
         if metric:
-            age = (
-                metric.metrics["github_issue_age"]
-                if "github_issue_age" in metric.metrics
-                else 0
-            )
+            age = metric.get_issue_age()
 
         return age
 
@@ -447,15 +494,7 @@ class Project(GithubMixin, models.Model):
         age = 0
         metric = Metric.objects.filter(**kwargs).order_by("date").last()
         if metric:
-            age = (
-                metric.metrics["github_pull_requests_cumulative_age"] or 0
-                if "github_pull_requests_cumulative_age" in metric.metrics
-                else 0 / metric.metrics["github_pull_requests_merged"] or 1
-                if "github_pull_requests_merged" in metric.metrics
-                and metric.metrics["github_pull_requests_merged"] != 0
-                else 1
-            )
-        age = age / 60 / 60
+            age = metric.get_pr_age()
 
         return age
 
@@ -466,13 +505,14 @@ class Project(GithubMixin, models.Model):
         :param path: The file for which the complexities should be returned.
         :return: Array of integers
         """
+        timestamp_from, timestamp_to = get_day_range(date_from, date_to)
         try:
             ref_complexity = (
                 Complexity.objects.filter(
                     project=self,
                     file_path=path,
-                    timestamp__date__gte=date_from,
-                    timestamp__date__lte=date_to,
+                    timestamp__gte=timestamp_from,
+                    timestamp__lt=timestamp_to,
                 )
                 .order_by("-timestamp")
                 .first()
@@ -499,8 +539,8 @@ class Project(GithubMixin, models.Model):
             comps = Complexity.objects.filter(
                 project=self,
                 file_path=path,
-                timestamp__date__gte=date_from,
-                timestamp__date__lte=date_to,
+                timestamp__gte=timestamp_from,
+                timestamp__lt=timestamp_to,
             ).order_by("timestamp")
 
             for comp in comps:
@@ -509,8 +549,8 @@ class Project(GithubMixin, models.Model):
             comps = Complexity.objects.filter(
                 project=self,
                 file_path=path,
-                timestamp__date__gte=date_from,
-                timestamp__date__lte=date_to,
+                timestamp__gte=timestamp_from,
+                timestamp__lt=timestamp_to,
             ).order_by("timestamp")
 
             for comp in comps:
@@ -548,28 +588,28 @@ class Project(GithubMixin, models.Model):
                 CodeChange.objects.filter(
                     project=self,
                     file_path=path,
-                    timestamp__date__gte=date_from,
-                    timestamp__date__lte=date_to,
+                    day__gte=as_date(date_from),
+                    day__lte=as_date(date_to),
                 )
-                .extra(select={"day": "TO_CHAR(timestamp, 'YYYY-MM-DD')"})
+                .order_by()
                 .values("day")
-                .annotate(changes=Count("timestamp"))
+                .annotate(changes=Count("pk"))
             )
         else:
             raw_changes = (
                 CodeChange.objects.filter(
                     project=self,
                     file_path__startswith=path,
-                    timestamp__date__gte=date_from,
-                    timestamp__date__lte=date_to,
+                    day__gte=as_date(date_from),
+                    day__lte=as_date(date_to),
                 )
-                .extra(select={"day": "TO_CHAR(timestamp, 'YYYY-MM-DD')"})
+                .order_by()
                 .values("day")
-                .annotate(changes=Count("timestamp"))
+                .annotate(changes=Count("pk"))
             )
 
         for raw_change in raw_changes:
-            changes[raw_change["day"]] = raw_change["changes"]
+            changes[raw_change["day"].strftime("%Y-%m-%d")] = raw_change["changes"]
 
         return sorted(changes.items())
 
@@ -586,21 +626,16 @@ class Project(GithubMixin, models.Model):
             )
 
     def get_file_ownership(self, path):
-        file_metrics = self.get_file_metrics(path)
-        if type(file_metrics) == dict:
-            ownership = file_metrics["ownership"]
-        else:
-            lines = {}
-            for node in file_metrics:
-                node_json = node.json_representation["ownership"]
-                for node_ownership in node_json:
-                    if node_ownership["author"] not in lines.keys():
-                        lines[node_ownership["author"]] = 0
-                    lines[node_ownership["author"]] = (
-                        lines[node_ownership["author"]] + node_ownership["lines"]
-                    )
-
-            ownership = [{"author": key, "lines": lines[key]} for key in lines.keys()]
+        # The ownership of directories is rolled up when the source status is
+        # finalized, so files and directories can both be read from their node.
+        ownership = (
+            SourceNode.objects.filter(
+                source_status=self.current_source_status,
+                path=os.path.join(self.github_repo_name, path),
+            )
+            .values_list("ownership", flat=True)
+            .get()
+        )
 
         # only return top 4 and the rest as "others"
         top = ownership[:4]
@@ -642,6 +677,24 @@ class LogEntry(models.Model):
         ordering = ["-timestamp_start"]
 
 
+class MetricManager(models.Manager):
+    def get_last_per_project(self, project_ids, date):
+        """
+        Return the last metric on or before the given date of every given project.
+
+        Uses `DISTINCT ON` so all projects are loaded with one query.
+
+        :return: Dict with the metrics by project id.
+        """
+        metrics = (
+            self.filter(project_id__in=project_ids, date__lte=date)
+            .order_by("project_id", "-date")
+            .distinct("project_id")
+        )
+
+        return {metric.project_id: metric for metric in metrics}
+
+
 class Metric(models.Model):
     project = models.ForeignKey(
         "Project",
@@ -652,6 +705,39 @@ class Metric(models.Model):
     file_path = models.CharField(max_length=255, blank=True)
     metrics = JSONField(null=True, blank=True)
 
+    objects = MetricManager()
+
+    def get_complexity(self):
+        try:
+            complexity = self.metrics["complexity"]
+        except KeyError:
+            complexity = 0
+
+        return complexity
+
+    def get_issue_age(self):
+        return (
+            self.metrics["github_issue_age"]
+            if "github_issue_age" in self.metrics
+            else 0
+        )
+
+    def get_pr_age(self):
+        """
+        Return the cumulated age of the pull requests merged on this day in hours.
+        """
+        age = (
+            self.metrics["github_pull_requests_cumulative_age"] or 0
+            if "github_pull_requests_cumulative_age" in self.metrics
+            else 0 / self.metrics["github_pull_requests_merged"] or 1
+            if "github_pull_requests_merged" in self.metrics
+            and self.metrics["github_pull_requests_merged"] != 0
+            else 1
+        )
+        age = age / 60 / 60
+
+        return age
+
     class Meta:
         unique_together = (("project", "date"),)
 
@@ -665,6 +751,15 @@ class SourceStatus(models.Model):
     timestamp = models.DateTimeField()
     active = models.BooleanField(default=False)
 
+    # Summary statistics, calculated when the snapshot is finalized.
+    min_changes = models.PositiveIntegerField(default=1)
+    max_changes = models.PositiveIntegerField(default=1)
+    min_complexity = models.PositiveIntegerField(default=1)
+    max_complexity = models.PositiveIntegerField(default=1)
+    total_files = models.PositiveIntegerField(default=0)
+    total_complexity = models.PositiveIntegerField(default=0)
+    hotspots = JSONField(default=list)
+
     @property
     def simple_tree(self):
         def render_tree(node):
@@ -689,36 +784,154 @@ class SourceStatus(models.Model):
         root = SourceNode.objects.get(source_status=self, parent__isnull=True)
         return render_tree(root)
 
-    @property
-    def min_changes(self):
-        return (
-            SourceNode.objects.filter(source_status=self)
-            .aggregate(Min("changes"))
-            .get("changes__min", 1)
-        )
+    def get_subtree(self, path=None, depth=1):
+        """
+        Return the part of the tree below the given path, `depth` levels deep.
 
-    @property
-    def max_changes(self):
-        return (
-            SourceNode.objects.filter(source_status=self)
-            .aggregate(Max("changes"))
-            .get("changes__max", 1)
+        Only the nodes within the lft/rght bounds of the requested node are
+        loaded. Directories on the deepest level are collapsed: their children
+        are not included, instead they get the summed up size and the changes
+        of the most changed file below them.
+
+        :param path: Directory (relative to the project root) to start from.
+            If empty the tree is returned starting at the root.
+        :param depth: Number of levels below the given path to include.
+        :return: Nested dict like `simple_tree` or None if the path does not exist.
+        """
+        kwargs = {
+            "source_status": self,
+        }
+        path = (path or "").strip(os.sep)
+        if path:
+            kwargs["path"] = os.path.join(self.project.github_repo_name, path)
+        else:
+            kwargs["parent__isnull"] = True
+
+        try:
+            root = SourceNode.objects.get(**kwargs)
+        except SourceNode.DoesNotExist:
+            return None
+
+        max_level = root.level + depth
+        nodes = root.get_descendants(include_self=True).filter(level__lte=max_level)
+
+        # Aggregate the files below the collapsed directories in the database
+        files_below = (
+            SourceNode.objects.filter(
+                tree_id=OuterRef("tree_id"),
+                lft__gt=OuterRef("lft"),
+                rght__lt=OuterRef("rght"),
+            )
+            .exclude(repo_link="")
+            .order_by()
+            .values("tree_id")
         )
+        collapsed = (
+            nodes.filter(level=max_level, repo_link="")
+            .annotate(
+                files_size=Subquery(
+                    files_below.annotate(value=Sum("complexity")).values("value")
+                ),
+                files_changes=Subquery(
+                    files_below.annotate(value=Max("changes")).values("value")
+                ),
+            )
+            .values("pk", "files_size", "files_changes")
+        )
+        collapsed = {x["pk"]: x for x in collapsed}
 
-    @property
-    def min_complexity(self):
-        return (
-            SourceNode.objects.filter(source_status=self)
-            .aggregate(Min("complexity"))
-            .get("complexity__min", 1)
+        representations = {}
+        for node in nodes.order_by("lft"):
+            current_node = node.simple_json_representation
+            current_node["collapsed"] = False
+
+            aggregates = collapsed.get(node.pk)
+            if aggregates and aggregates["files_size"] is not None:
+                current_node["collapsed"] = True
+                current_node["size"] = aggregates["files_size"]
+                current_node["changes"] = aggregates["files_changes"]
+
+            representations[node.pk] = current_node
+            if node.pk != root.pk:
+                representations[node.parent_id]["children"].append(current_node)
+
+        return representations[root.pk]
+
+    def calculate_directory_ownership(self):
+        """
+        Roll up the ownership of all files into their parent directories.
+
+        The tree is walked bottom-up, so every directory is summed up from its
+        direct children only. The result is stored on the directory nodes.
+        """
+        nodes = SourceNode.objects.filter(source_status=self).order_by("-level")
+        lines = defaultdict(Counter)
+        directories = []
+
+        for node in nodes.only("pk", "parent", "level", "repo_link", "ownership"):
+            if node.is_file:
+                node_lines = Counter()
+                for node_ownership in node.ownership:
+                    node_lines[node_ownership["author"]] += node_ownership["lines"]
+            else:
+                node_lines = lines.pop(node.pk, Counter())
+                node.ownership = [
+                    {"author": author, "lines": author_lines}
+                    for author, author_lines in node_lines.most_common()
+                ]
+                directories.append(node)
+
+            if node.parent_id:
+                lines[node.parent_id].update(node_lines)
+
+        SourceNode.objects.bulk_update(directories, ["ownership"], batch_size=1000)
+
+    def calculate_aggregates(self):
+        """
+        Calculate the summary statistics of the snapshot and store them.
+
+        Called once when the snapshot is finalized,
+        so reading the statistics afterwards does not touch the `SourceNode`s.
+        """
+        nodes = SourceNode.objects.filter(source_status=self)
+        aggregates = nodes.aggregate(
+            Min("changes"),
+            Max("changes"),
+            Min("complexity"),
+            Max("complexity"),
         )
+        self.min_changes = aggregates["changes__min"] or 1
+        self.max_changes = aggregates["changes__max"] or 1
+        self.min_complexity = aggregates["complexity__min"] or 1
+        self.max_complexity = aggregates["complexity__max"] or 1
+
+        files = nodes.exclude(repo_link="")
+        aggregates = files.aggregate(Count("pk"), Sum("complexity"))
+        self.total_files = aggregates["pk__count"] or 0
+        self.total_complexity = aggregates["complexity__sum"] or 0
+
+        hotspots = files.annotate(hotspot=F("changes") * F("complexity")).order_by(
+            "-hotspot", "path"
+        )[:HOTSPOTS_PER_SOURCE_STATUS]
+        self.hotspots = [
+            {
+                "path": node.project_path,
+                "size": node.complexity,
+                "changes": node.changes,
+            }
+            for node in hotspots
+        ]
 
-    @property
-    def max_complexity(self):
-        return (
-            SourceNode.objects.filter(source_status=self)
-            .aggregate(Max("complexity"))
-            .get("complexity__max", 1)
+        self.save(
+            update_fields=[
+                "min_changes",
+                "max_changes",
+                "min_complexity",
+                "max_complexity",
+                "total_files",
+                "total_complexity",
+                "hotspots",
+            ]
         )
 
     def __str__(self):
@@ -786,6 +999,14 @@ class SourceNode(MPTTModel):
 
     class Meta:
         unique_together = [["parent", "name"]]
+        indexes = [
+            # Nodes by path or, with `varchar_pattern_ops`, by path prefix.
+            models.Index(
+                fields=["source_status", "path"],
+                name="sourcenode_path_idx",
+                opclasses=["int4_ops", "varchar_pattern_ops"],
+            ),
+        ]
 
 
 class Release(models.Model):
@@ -810,3 +1031,11 @@ class Complexity(models.Model):
     timestamp = models.DateTimeField()
     file_path = models.CharField(max_length=255)
     complexity = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["project", "file_path", "timestamp"],
+                name="complexity_file_time_idx",
+            ),
+        ]
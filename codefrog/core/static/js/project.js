@@ -28,103 +28,23 @@ let loadProject = function (projectId) {
             });
     }
 
-    // Loading data for work area diagram
-    console.log(`Loading source-status ... ` + new Date());
-    let sourceStatusUrl = location.origin + '/api-internal/projects/' + projectId + '/source-status/';
-    fetchData(sourceStatusUrl).then(resp => {
-            window.projectSourceStatus = resp[0];
-
-            console.log(`Everything loaded from source-status ` + new Date());
-
-            const event = new Event('source-status-loaded');
-            document.dispatchEvent(event);
-        });
-
-    // Loading data for file churn diagram
-    loadPaginatedResource(projectId, 'file-changes', 'projectFileChanges');
-
-    // loading data for evolution diagrams
-    console.log(`Loading project... ` + new Date());
-    let projectUrl = location.origin + '/api-internal/projects/' + projectId + '/';
-    let promise1 = fetchData(projectUrl).then(resp => {
-            window.project = resp;
-
-            console.log(`Everything loaded from project ` + new Date());
-
-            const event = new Event('project-loaded');
-            document.dispatchEvent(event);
-        });
-    let promise2 = loadPaginatedResource(projectId, 'metrics', 'projectMetrics');
-    let promise3 = loadPaginatedResource(projectId, 'releases', 'projectReleases');
-
-    Promise.all([promise1, promise2, promise3]).then(response => {
-        console.log("Everything for evolution diagram loaded!");
-        const event = new Event('evolution-loaded');
-        document.dispatchEvent(event);
-    });
-}
-
-/**
- * Loads all pages of a paginated API endpoint and saves the result in the window object.
- * If everything was loaded the {action}-loaded event is triggered.
- *
- * @param projectId
- * @param action
- * @param propertyName
- * @returns {Promise<unknown>}
- */
-let loadPaginatedResource = function(projectId, action, propertyName) {
-    console.log(`Loading ${action} ... ` + new Date());
-
-    let params = getDateRange();
-    params['date_from'] = params['date_from'].format('YYYY-MM-DD');
-    params['date_to'] = params['date_to'].format('YYYY-MM-DD');
-    const qs = (new URLSearchParams(params)).toString();
-
-    let url = location.origin + '/api-internal/projects/' + projectId + '/' + action+ '/';
-
-    let numPages = 0;
-    return fetch(url + '?' + qs)
-        .then(response => response.json())
-        .then(data => {
-            // Fetch all pages
-            const apiPromises = [];
-            numPages = data['num_pages'];
-            console.log(`${action}: There are ${numPages} pages to load.`);
-            for (let page=1; page<=numPages; page++) {
-                params['page'] = page;
-                const qs = (new URLSearchParams(params)).toString();
-                let pageUrl = url + '?' + qs;
-
-                let promise = fetch(pageUrl)
-                    .then(response => response.json())
-                    .then(data => {
-                        return data;
-                    });
-
-                apiPromises.push(promise);
+    // Loading all data for the diagrams in one request
+    console.log(`Loading dashboard ... ` + new Date());
+    let dashboardUrl = location.origin + '/api-internal/projects/' + projectId + '/dashboard/';
+    fetchData(dashboardUrl).then(resp => {
+            const dashboard = resp[0];
+            window.project = dashboard['project'];
+            window.projectMetrics = dashboard['metrics'];
+            window.projectReleases = dashboard['releases'];
+            window.projectFileChanges = dashboard['file_changes'];
+            window.projectSourceStatus = dashboard['source_status'];
+
+            console.log(`Everything loaded from dashboard ` + new Date());
+
+            for (let name of ['project', 'source-status', 'file-changes', 'metrics', 'releases', 'evolution']) {
+                const event = new Event(name + '-loaded');
+                document.dispatchEvent(event);
             }
-
-            // Wait until loading of all pages is done.
-            let allPromise = Promise.all(apiPromises)
-                .then(responses => {
-                    const processedResponses = [];
-                    responses.map(data => {
-                        processedResponses.push(data);
-                    });
-
-                    // Save the results of all pages into window object
-                    window[propertyName] = [];
-                    for (let i in processedResponses) {
-                        window[propertyName] = window[propertyName].concat(processedResponses[i]['results']);
-                    }
-                    console.log(`Everything loaded from ${action} ` + new Date());
-
-                    // Tell everyone that we are done loading stuff
-                    const event = new Event(action + '-loaded');
-                    document.dispatchEvent(event);
-                });
-            return allPromise;
         });
 }
 
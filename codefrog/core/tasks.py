@@ -5,6 +5,7 @@ from celery import shared_task
 from django.db import transaction
 from django.utils import timezone
 
+from core.cache import bump_project_data_version
 from core.models import Project, STATUS_READY, SourceNode
 from core.utils import (
     get_file_changes,
@@ -79,10 +80,14 @@ def update_source_status_with_metrics(project_id, *args, **kwargs):
             )
             full_path = os.path.join(tmp_dir, node.project_path)
             node.complexity = get_file_complexity(full_path)
-            node.ownership = get_file_ownership(full_path, tmp_dir)
+            if node.is_file:
+                # ownership of directories is rolled up from the files below
+                node.ownership = get_file_ownership(full_path, tmp_dir)
             node.changes = get_file_changes(node.project_path, project)
             node.save()
 
+        source_status.calculate_directory_ownership()
+        source_status.calculate_aggregates()
         source_status.active = True
         source_status.save()
 
@@ -203,6 +208,9 @@ def save_last_update(project_id, *args, **kwargs):
     project.status = STATUS_READY
     project.save(update_fields=["last_update", "status"])
 
+    # All cached analytics of the project are outdated now.
+    bump_project_data_version(project_id)
+
     logger.info("Project(%s): Finished save_last_update.", project_id)
 
     return project_id
@@ -1,8 +1,49 @@
 import datetime
+import gzip
+import io
+import json
+from unittest import mock
 
-from django.test import TestCase
+import numpy as np
+from django.core.cache import caches
+from django.db import connection
+from django.db.models import Count
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
 
-from codefrog.core.utils import date_range, foo
+from connectors.git.tasks import _merge_code_changes
+from core.archive import (
+    ARCHIVE_TABLES,
+    ColumnEncoder,
+    decode_column,
+    export_archive,
+    import_archive,
+)
+from core.bulk import merge_rows
+from core.export import iter_gzip, iter_ndjson
+from core.cache import (
+    LockTimeout,
+    bump_project_data_version,
+    get_cache_stats,
+    get_or_compute,
+    lock,
+)
+from core.models import (
+    Complexity,
+    Metric,
+    Project,
+    Release,
+    SourceNode,
+    SourceStatus,
+)
+from core.utils import (
+    date_range,
+    downsample_metrics,
+    get_day_range,
+    lttb,
+    to_columnar,
+)
+from engine.models import CodeChange, Issue, PullRequest, get_issue_refid
 
 
 class DateRangeTestCase(TestCase):
@@ -19,7 +60,780 @@ class DateRangeTestCase(TestCase):
         self.assertEqual(three, start_date + datetime.timedelta(days=2))
 
 
-class FooTestCase(TestCase):
-    def test_foo(self):
-        bla = foo(5)
-        self.assertEqual(bla, 1)
+class DayRangeTestCase(SimpleTestCase):
+    def test_day_range(self):
+        timestamp_from, timestamp_to = get_day_range(
+            datetime.date(2020, 1, 1), datetime.date(2020, 1, 31)
+        )
+        self.assertEqual(timestamp_from.date(), datetime.date(2020, 1, 1))
+        self.assertEqual(timestamp_to.date(), datetime.date(2020, 2, 1))
+        self.assertEqual(timestamp_to.time(), datetime.time.min)
+        self.assertTrue(timezone.is_aware(timestamp_to))
+
+    def test_open_day_range(self):
+        self.assertIsNone(get_day_range(None, datetime.date(2020, 1, 31))[0])
+        self.assertIsNone(get_day_range(datetime.date(2020, 1, 1), None)[1])
+
+
+class LttbTestCase(SimpleTestCase):
+    x = np.arange(10, dtype=float)
+    y = np.array([[0], [1], [0], [5], [0], [1], [0], [1], [9], [2]], dtype=float)
+
+    def test_max_points_greater_or_equal_n(self):
+        np.testing.assert_array_equal(lttb(self.x, self.y, 10), np.arange(10))
+        np.testing.assert_array_equal(lttb(self.x, self.y, 20), np.arange(10))
+
+    def test_endpoints_kept(self):
+        for max_points in range(2, 10):
+            selected = lttb(self.x, self.y, max_points)
+            self.assertEqual(len(selected), max_points)
+            self.assertEqual(selected[0], 0)
+            self.assertEqual(selected[-1], 9)
+            self.assertTrue(np.all(np.diff(selected) > 0))
+
+    def test_max_points_2(self):
+        np.testing.assert_array_equal(lttb(self.x, self.y, 2), [0, 9])
+
+    def test_max_points_3(self):
+        np.testing.assert_array_equal(lttb(self.x, self.y, 3), [0, 8, 9])
+
+    def test_peaks_kept(self):
+        selected = lttb(self.x, self.y, 4)
+        self.assertIn(3, selected)
+        self.assertIn(8, selected)
+
+
+class DownsampleMetricsTestCase(SimpleTestCase):
+    def get_metrics(self):
+        start_date = datetime.date(2020, 1, 1)
+        return [
+            {
+                "date": start_date + datetime.timedelta(days=i),
+                "complexity": float(i % 4),
+                "github_issues_open": 10 + i,
+                "github_issues_closed": i,
+                "github_pull_requests_merged": 1,
+                "github_pull_requests_cumulative_age": 3600,
+            }
+            for i in range(20)
+        ]
+
+    def test_summed_metrics(self):
+        metrics = self.get_metrics()
+        downsampled = downsample_metrics(metrics, 5)
+
+        self.assertEqual(len(downsampled), 5)
+        self.assertEqual(downsampled[0]["date"], metrics[0]["date"])
+        self.assertEqual(downsampled[-1]["date"], metrics[-1]["date"])
+        for column in (
+            "github_issues_closed",
+            "github_pull_requests_merged",
+            "github_pull_requests_cumulative_age",
+        ):
+            self.assertEqual(
+                sum(row[column] for row in downsampled),
+                sum(row[column] for row in metrics),
+            )
+
+        # every point has the merged pull requests since the previous point
+        dates = [metrics[0]["date"] - datetime.timedelta(days=1)] + [
+            row["date"] for row in downsampled
+        ]
+        for row, previous_date, date in zip(downsampled, dates, dates[1:]):
+            self.assertEqual(
+                row["github_pull_requests_merged"], (date - previous_date).days
+            )
+
+    def test_level_metrics_sampled(self):
+        metrics = self.get_metrics()
+        by_date = {row["date"]: row for row in metrics}
+
+        for row in downsample_metrics(metrics, 5):
+            self.assertEqual(row["complexity"], by_date[row["date"]]["complexity"])
+            self.assertEqual(
+                row["github_issues_open"], by_date[row["date"]]["github_issues_open"]
+            )
+
+    def test_less_metrics_than_max_points(self):
+        metrics = self.get_metrics()
+        self.assertEqual(downsample_metrics(metrics, 20), metrics)
+
+
+class StateOfAffairsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.projects = [
+            Project.objects.create(
+                slug=slug,
+                name=slug,
+                git_url=f"https://github.com/codefrog-app/{slug}.git",
+            )
+            for slug in ("codefrog", "other", "empty")
+        ]
+        metrics = [
+            (cls.projects[0], datetime.date(2020, 1, 1), 10),
+            (cls.projects[0], datetime.date(2020, 1, 20), 15),
+            (cls.projects[0], datetime.date(2020, 2, 10), 20),
+            (cls.projects[1], datetime.date(2020, 1, 5), 4),
+        ]
+        for project, date, complexity in metrics:
+            Metric.objects.create(
+                project=project, date=date, metrics={"complexity": complexity}
+            )
+
+    def test_get_last_per_project(self):
+        project_ids = [project.pk for project in self.projects]
+        metrics = Metric.objects.get_last_per_project(
+            project_ids, datetime.date(2020, 1, 31)
+        )
+
+        self.assertEqual(
+            {project_id: metric.date for project_id, metric in metrics.items()},
+            {
+                self.projects[0].pk: datetime.date(2020, 1, 20),
+                self.projects[1].pk: datetime.date(2020, 1, 5),
+            },
+        )
+
+    def test_state_of_affairs_for_projects(self):
+        date_from = datetime.date(2020, 1, 1)
+        date_to = datetime.date(2020, 1, 31)
+
+        state_of_affairs = Project.get_state_of_affairs_for_projects(
+            self.projects, date_from, date_to
+        )
+
+        self.assertEqual(state_of_affairs[self.projects[0].pk]["complexity_change"], 50)
+        self.assertEqual(state_of_affairs[self.projects[2].pk]["complexity_change"], 0)
+        for project in self.projects:
+            self.assertEqual(
+                state_of_affairs[project.pk],
+                project.get_state_of_affairs(date_from, date_to),
+            )
+
+
+def create_source_tree(project):
+    """
+    Creates an active source status of the project with the tree:
+
+        codefrog/
+            core/
+                models.py (complexity 10, changes 5)
+                utils.py (complexity 4, changes 8)
+            README.md (complexity 1, changes 2)
+    """
+    source_status = SourceStatus.objects.create(
+        project=project,
+        timestamp=timezone.now(),
+        active=True,
+    )
+    root = SourceNode.objects.create(source_status=source_status, name="root")
+    repo = SourceNode.objects.create(
+        source_status=source_status, parent=root, name="codefrog", path="codefrog"
+    )
+    core = SourceNode.objects.create(
+        source_status=source_status, parent=repo, name="core", path="codefrog/core"
+    )
+
+    files = [
+        (core, "models.py", 10, 5, [("Anton Pirker", 8), ("Jane Doe", 2)]),
+        (core, "utils.py", 4, 8, [("Jane Doe", 4)]),
+        (repo, "README.md", 1, 2, [("Anton Pirker", 1)]),
+    ]
+    for parent, name, complexity, changes, ownership in files:
+        path = f"{parent.path}/{name}"
+        SourceNode.objects.create(
+            source_status=source_status,
+            parent=parent,
+            name=name,
+            path=path,
+            repo_link=project.get_repo_link(path.split("/", 1)[1]),
+            complexity=complexity,
+            changes=changes,
+            ownership=[
+                {"author": author, "lines": lines} for author, lines in ownership
+            ],
+        )
+
+    return source_status
+
+
+class SourceTreeTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.project = Project.objects.create(
+            source="github",
+            slug="codefrog",
+            name="codefrog",
+            git_url="https://github.com/codefrog-app/codefrog.git",
+        )
+        cls.source_status = create_source_tree(cls.project)
+
+    def get_children(self, tree):
+        return {child["path"]: child for child in tree["children"]}
+
+    def test_subtree_collapsed(self):
+        tree = self.source_status.get_subtree(depth=2)
+
+        repo = self.get_children(tree)[""]
+        children = self.get_children(repo)
+        self.assertEqual(set(children), {"core", "README.md"})
+
+        # The deepest directory has the summed size and the changes
+        # of its most changed file, but no children.
+        self.assertTrue(children["core"]["collapsed"])
+        self.assertEqual(children["core"]["size"], 14)
+        self.assertEqual(children["core"]["changes"], 8)
+        self.assertEqual(children["core"]["children"], [])
+
+        self.assertFalse(children["README.md"]["collapsed"])
+        self.assertEqual(children["README.md"]["size"], 1)
+
+    def test_subtree_of_path(self):
+        tree = self.source_status.get_subtree(path="/core/", depth=1)
+
+        self.assertEqual(tree["path"], "core")
+        self.assertFalse(tree["collapsed"])
+        self.assertEqual(
+            {path: child["size"] for path, child in self.get_children(tree).items()},
+            {"core/models.py": 10, "core/utils.py": 4},
+        )
+
+    def test_subtree_depth_0(self):
+        tree = self.source_status.get_subtree(path="core", depth=0)
+
+        self.assertTrue(tree["collapsed"])
+        self.assertEqual(tree["children"], [])
+
+    def test_subtree_missing_path(self):
+        self.assertIsNone(self.source_status.get_subtree(path="missing"))
+
+    def test_directory_ownership(self):
+        self.source_status.calculate_directory_ownership()
+
+        ownership = dict(
+            SourceNode.objects.filter(
+                source_status=self.source_status, repo_link=""
+            ).values_list("path", "ownership")
+        )
+        self.assertEqual(
+            ownership["codefrog/core"],
+            [
+                {"author": "Anton Pirker", "lines": 8},
+                {"author": "Jane Doe", "lines": 6},
+            ],
+        )
+        self.assertEqual(
+            ownership["codefrog"],
+            [
+                {"author": "Anton Pirker", "lines": 9},
+                {"author": "Jane Doe", "lines": 6},
+            ],
+        )
+        self.assertEqual(ownership[""], ownership["codefrog"])
+
+    def test_aggregates(self):
+        self.source_status.calculate_aggregates()
+        source_status = SourceStatus.objects.get(pk=self.source_status.pk)
+
+        self.assertEqual(source_status.total_files, 3)
+        self.assertEqual(source_status.total_complexity, 15)
+        self.assertEqual(source_status.max_changes, 8)
+        self.assertEqual(source_status.max_complexity, 10)
+        # Ordered by changes * complexity.
+        self.assertEqual(
+            [hotspot["path"] for hotspot in source_status.hotspots],
+            ["core/models.py", "core/utils.py", "README.md"],
+        )
+
+
+class ToColumnarTestCase(SimpleTestCase):
+    def test_to_columnar(self):
+        records = [
+            {"date": datetime.date(2020, 1, 1), "merged": 2, "age": 10},
+            {"date": datetime.date(2020, 1, 2), "merged": 0, "age": 0},
+        ]
+
+        columnar = to_columnar(
+            records, "date", {"avg_age": lambda df: df["age"] / df["merged"].clip(1)}
+        )
+
+        self.assertEqual(
+            columnar,
+            {
+                "dates": ["2020-01-01T00:00:00Z", "2020-01-02T00:00:00Z"],
+                "series": {
+                    "merged": [2, 0],
+                    "age": [10, 0],
+                    "avg_age": [5.0, 0.0],
+                },
+            },
+        )
+
+    def test_empty(self):
+        self.assertEqual(to_columnar([], "date"), {"dates": [], "series": {}})
+
+
+class IterGzipTestCase(SimpleTestCase):
+    def test_iter_gzip(self):
+        chunks = [b'{"id":1}\n', b"", b'{"id":2}\n']
+        self.assertEqual(gzip.decompress(b"".join(iter_gzip(chunks))), b"".join(chunks))
+
+
+class ExportTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.project = Project.objects.create(
+            slug="codefrog",
+            name="codefrog",
+            git_url="https://github.com/codefrog-app/codefrog.git",
+        )
+        for refid in ("1", "2", "3"):
+            Issue.objects.create(
+                project=cls.project,
+                issue_refid=refid,
+                opened_at=datetime.datetime(2020, 1, 1, tzinfo=timezone.utc),
+                labels=["bug"],
+            )
+
+    @mock.patch("core.export.EXPORT_CHUNK_SIZE", 2)
+    def test_iter_ndjson(self):
+        chunks = list(iter_ndjson(self.project.pk, "issues"))
+
+        # Full chunks and the rest.
+        self.assertEqual([chunk.count(b"\n") for chunk in chunks], [2, 1])
+
+        rows = [json.loads(line) for line in b"".join(chunks).splitlines()]
+        self.assertEqual([row["issue_refid"] for row in rows], ["1", "2", "3"])
+        self.assertEqual(rows[0]["opened_at"], "2020-01-01T00:00:00Z")
+        self.assertEqual(rows[0]["labels"], ["bug"])
+
+    def test_empty(self):
+        self.assertEqual(list(iter_ndjson(self.project.pk, "metrics")), [])
+
+
+class ColumnEncoderTestCase(SimpleTestCase):
+    columns = {
+        "string": ["a", None, "b", "a", "", "ü", None, "b"],
+        "json": [["bug"], None, {"complexity": 1}, ["bug"], [], None, [], {}],
+        "datetime": [
+            "2020-01-01T10:00:00.000001Z",
+            None,
+            "2020-01-02T00:00:00.000000Z",
+        ],
+        "date": ["2020-01-01", None, "2020-02-29"],
+        "integer": [1, None, -5, 0, 2**40],
+    }
+
+    def encode(self, values, kind, chunk_size):
+        encoder = ColumnEncoder(kind)
+        for i in range(0, len(values), chunk_size):
+            encoder.append(values[i : i + chunk_size])
+        return encoder.finish()
+
+    def test_round_trip(self):
+        for kind, values in self.columns.items():
+            for chunk_size in (1, 3, len(values)):
+                with self.subTest(kind=kind, chunk_size=chunk_size):
+                    parts = self.encode(values, kind, chunk_size)
+                    self.assertEqual(decode_column(parts, kind), values)
+
+    def test_strings_stored_once(self):
+        parts = self.encode(self.columns["string"], "string", chunk_size=3)
+        self.assertEqual(parts["strings"].tobytes().decode("utf-8"), "abü")
+        self.assertEqual(parts["codes"].tolist(), [0, -1, 1, 0, 2, 3, -1, 1])
+
+    def test_empty_column(self):
+        for kind in self.columns:
+            with self.subTest(kind=kind):
+                parts = ColumnEncoder(kind).finish()
+                self.assertEqual(decode_column(parts, kind), [])
+
+    def test_unknown_kind(self):
+        with self.assertRaises(ValueError):
+            ColumnEncoder("float")
+
+
+class ArchiveTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.project = Project.objects.create(
+            source="github",
+            slug="codefrog",
+            name="codefrog",
+            git_url="https://github.com/codefrog-app/codefrog.git",
+        )
+        now = timezone.now().replace(microsecond=0)
+
+        issue = Issue.objects.create(
+            project=cls.project,
+            issue_refid="1",
+            opened_at=now,
+            labels=["bug"],
+        )
+        Issue.objects.create(project=cls.project, issue_refid="2", opened_at=now)
+        PullRequest.objects.create(
+            project=cls.project,
+            pull_request_refid="3",
+            opened_at=now,
+            merged_at=now,
+            age=60,
+        )
+        CodeChange.objects.create(
+            project=cls.project,
+            timestamp=now,
+            day=now.date(),
+            file_path="core/models.py",
+            author="Anton Pirker <anton@ignaz.at>",
+            complexity_added=3,
+            complexity_removed=1,
+            description="Fixes #1",
+            git_commit_hash="abc",
+            issue=issue,
+        )
+        Complexity.objects.create(
+            project=cls.project,
+            timestamp=now,
+            file_path="core/models.py",
+            complexity=2,
+        )
+        Metric.objects.create(
+            project=cls.project,
+            date=now.date(),
+            metrics={"complexity": 2, "github_issues_open": 1},
+        )
+        # No releases, the table is empty in the archive.
+
+    def get_rows(self, project):
+        return {
+            name: list(
+                model.objects.filter(project=project)
+                .order_by("pk")
+                .values_list(*[field for field, kind in columns])
+            )
+            for name, model, columns in ARCHIVE_TABLES
+        }
+
+    def test_round_trip(self):
+        archive = io.BytesIO()
+        meta = export_archive(self.project, archive)
+        self.assertEqual(meta["tables"]["releases"], 0)
+        self.assertEqual(meta["tables"]["issues"], 2)
+
+        other_project = Project.objects.create(
+            source="github",
+            slug="other",
+            name="other",
+            git_url="https://github.com/codefrog-app/other.git",
+        )
+        archive.seek(0)
+        import_archive(other_project, archive)
+
+        self.assertEqual(self.get_rows(other_project), self.get_rows(self.project))
+        self.assertFalse(Release.objects.filter(project=other_project).exists())
+
+
+class MergeRowsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.project = Project.objects.create(
+            source="github",
+            slug="codefrog",
+            name="codefrog",
+            git_url="https://github.com/codefrog-app/codefrog.git",
+        )
+        cls.issue = Issue.objects.create(
+            project=cls.project,
+            issue_refid="12",
+            opened_at=timezone.now(),
+        )
+
+    def get_code_change_row(self, file_path, complexity_added, issue_refid=None):
+        timestamp = timezone.now().replace(microsecond=0)
+        return (
+            self.project.pk,
+            timestamp,
+            timestamp.date(),
+            file_path,
+            "Anton Pirker <anton@ignaz.at>",
+            complexity_added,
+            0,
+            f"Fixes #{issue_refid}" if issue_refid else "",
+            "abc",
+            issue_refid,
+        )
+
+    def merge_code_changes(self, rows, update_fields=()):
+        fields = ["project", "git_commit_hash", "file_path", "complexity_added"]
+        fields += ["complexity_removed", "timestamp", "day", "author"]
+        timestamp = timezone.now()
+
+        return merge_rows(
+            CodeChange,
+            fields,
+            [
+                (self.project.pk, "abc", file_path, added, 0)
+                + (timestamp, timestamp.date(), "Anton Pirker <anton@ignaz.at>")
+                for file_path, added in rows
+            ],
+            unique_fields=["project", "git_commit_hash", "file_path"],
+            update_fields=update_fields,
+        )
+
+    def get_complexity_added(self):
+        return dict(
+            CodeChange.objects.filter(project=self.project).values_list(
+                "file_path", "complexity_added"
+            )
+        )
+
+    def test_update_on_conflict(self):
+        self.merge_code_changes([("a.py", 1), ("b.py", 1)])
+        # The last of duplicate rows wins.
+        count = self.merge_code_changes(
+            [("a.py", 2), ("c.py", 1), ("a.py", 3)],
+            update_fields=["complexity_added"],
+        )
+
+        self.assertEqual(count, 2)
+        self.assertEqual(self.get_complexity_added(), {"a.py": 3, "b.py": 1, "c.py": 1})
+
+    def test_keep_existing_rows(self):
+        self.merge_code_changes([("a.py", 1)])
+        count = self.merge_code_changes([("a.py", 2), ("b.py", 1)])
+
+        self.assertEqual(count, 1)
+        self.assertEqual(self.get_complexity_added(), {"a.py": 1, "b.py": 1})
+
+    def test_json_merge(self):
+        def merge(metrics):
+            return merge_rows(
+                Metric,
+                ["project", "date", "file_path", "metrics"],
+                [(self.project.pk, datetime.date(2020, 1, 1), "", metrics)],
+                unique_fields=["project", "date"],
+                update_fields=["metrics"],
+            )
+
+        merge({"complexity": 1, "github_issues_open": 1})
+        merge({"github_issues_open": 2, "github_issues_closed": 3})
+
+        metric = Metric.objects.get(project=self.project)
+        self.assertEqual(
+            metric.metrics,
+            {"complexity": 1, "github_issues_open": 2, "github_issues_closed": 3},
+        )
+
+    def test_code_changes_linked_to_issues(self):
+        _merge_code_changes(
+            self.project.pk,
+            [
+                self.get_code_change_row("a.py", 1, issue_refid="12"),
+                self.get_code_change_row("b.py", 1, issue_refid="12"),
+                self.get_code_change_row("c.py", 1, issue_refid="13"),
+                self.get_code_change_row("d.py", 1),
+            ],
+        )
+
+        self.assertEqual(
+            dict(
+                CodeChange.objects.filter(project=self.project).values_list(
+                    "file_path", "issue"
+                )
+            ),
+            {"a.py": self.issue.pk, "b.py": self.issue.pk, "c.py": None, "d.py": None},
+        )
+
+
+class IssueRefidTestCase(SimpleTestCase):
+    def test_get_issue_refid(self):
+        self.assertEqual(get_issue_refid("Fixes #12"), "#12")
+        self.assertEqual(
+            get_issue_refid("See #12 and codefrog/codefrog#3"), "codefrog/codefrog#3"
+        )
+        self.assertIsNone(get_issue_refid("Update README"))
+
+
+class QueryPlanTestCase(TestCase):
+    """
+    Makes sure the hot queries are answered using the indexes made for them.
+
+    The test tables are (nearly) empty, so sequential scans are disabled
+    while planning. Otherwise the planner would scan the tiny tables.
+    """
+
+    date_from = datetime.date(2020, 1, 1)
+    date_to = datetime.date(2020, 12, 31)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.project = Project.objects.create(
+            slug="codefrog",
+            name="codefrog",
+            git_url="https://github.com/codefrog-app/codefrog.git",
+        )
+        cls.source_status = SourceStatus.objects.create(
+            project=cls.project,
+            timestamp=timezone.now(),
+            active=True,
+        )
+
+    def setUp(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SET enable_seqscan = off")
+
+    def tearDown(self):
+        with connection.cursor() as cursor:
+            cursor.execute("RESET enable_seqscan")
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan, msg=plan)
+
+    def test_file_changes(self):
+        queryset = self.project.get_file_changes(self.date_from, self.date_to)
+        self.assertUsesIndex(queryset, "codechange_file_day_idx")
+
+    def test_code_changes_of_file(self):
+        queryset = CodeChange.objects.filter(
+            project=self.project,
+            file_path="codefrog/core/models.py",
+            day__gte=self.date_from,
+            day__lte=self.date_to,
+        ).values("author")
+        self.assertUsesIndex(queryset, "codechange_file_day_idx")
+
+    def test_code_changes_of_directory(self):
+        queryset = (
+            CodeChange.objects.filter(
+                project=self.project,
+                file_path__startswith="codefrog/core/",
+                day__gte=self.date_from,
+                day__lte=self.date_to,
+            )
+            .order_by()
+            .values("day")
+            .annotate(changes=Count("pk"))
+        )
+        self.assertUsesIndex(queryset, "codechange_file_day_idx")
+
+    def test_code_changes_of_project(self):
+        queryset = CodeChange.objects.filter(
+            project=self.project,
+            day__gte=self.date_from,
+        ).order_by("timestamp")
+        self.assertUsesIndex(queryset, "codechange_day_idx")
+
+    def test_complexity_of_file(self):
+        timestamp_from, timestamp_to = get_day_range(self.date_from, self.date_to)
+        queryset = Complexity.objects.filter(
+            project=self.project,
+            file_path="codefrog/core/models.py",
+            timestamp__gte=timestamp_from,
+            timestamp__lt=timestamp_to,
+        ).order_by("timestamp")
+        self.assertUsesIndex(queryset, "complexity_file_time_idx")
+
+    def test_metrics(self):
+        queryset = Metric.objects.filter(
+            project=self.project,
+            date__gte=self.date_from,
+            date__lte=self.date_to,
+        ).order_by("date")
+        # The unique index of (project, date)
+        self.assertRegex(queryset.explain(), r"core_metric_project_id_date_\w+_uniq")
+
+    def test_source_node_by_path(self):
+        queryset = SourceNode.objects.filter(
+            source_status=self.source_status,
+            path="codefrog/core/models.py",
+        )
+        self.assertUsesIndex(queryset, "sourcenode_path_idx")
+
+    def test_source_nodes_by_path_prefix(self):
+        queryset = SourceNode.objects.filter(
+            source_status=self.source_status,
+            path__startswith="codefrog/core/",
+        )
+        self.assertUsesIndex(queryset, "sourcenode_path_idx")
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class AnalyticsCacheTestCase(SimpleTestCase):
+    def setUp(self):
+        caches["default"].clear()
+        self.calls = 0
+
+    def compute(self):
+        self.calls += 1
+        return [self.calls]
+
+    def test_get_or_compute(self):
+        params = {"date_from": "2020-01-01"}
+        self.assertEqual(get_or_compute(1, "metrics", params, self.compute), [1])
+        self.assertEqual(get_or_compute(1, "metrics", params, self.compute), [1])
+
+        # Other parameters and other projects are cached separately.
+        other_params = {"date_from": "2020-02-01"}
+        self.assertEqual(get_or_compute(1, "metrics", other_params, self.compute), [2])
+        self.assertEqual(get_or_compute(2, "metrics", params, self.compute), [3])
+
+        self.assertEqual(
+            get_cache_stats(["metrics"]), {"metrics": {"hits": 1, "misses": 3}}
+        )
+
+    def test_bump_project_data_version(self):
+        get_or_compute(1, "metrics", {}, self.compute)
+        get_or_compute(2, "metrics", {}, self.compute)
+
+        bump_project_data_version(1)
+
+        self.assertEqual(get_or_compute(1, "metrics", {}, self.compute), [3])
+        self.assertEqual(get_or_compute(2, "metrics", {}, self.compute), [2])
+
+
+@override_settings(
+    CACHES={
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+        "locks": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "locks",
+        },
+    }
+)
+class LockTestCase(SimpleTestCase):
+    def test_lock(self):
+        with lock("repo:1", timeout=60):
+            with self.assertRaises(LockTimeout):
+                with lock("repo:1", timeout=60, wait=0):
+                    pass
+
+            # Other names are not locked.
+            with lock("repo:2", timeout=60, wait=0):
+                pass
+
+        # Released after the block.
+        with lock("repo:1", timeout=60, wait=0):
+            pass
+
+    def test_release_on_error(self):
+        with self.assertRaises(ValueError):
+            with lock("repo:1", timeout=60):
+                raise ValueError
+
+        with lock("repo:1", timeout=60, wait=0):
+            pass
+
+    def test_cache_error(self):
+        block = mock.Mock()
+
+        # The block does not run unlocked if the cache is not available.
+        with mock.patch.object(
+            caches["locks"], "add", side_effect=ConnectionError
+        ), self.assertRaises(ConnectionError):
+            with lock("repo:1", timeout=60):
+                block()
+
+        block.assert_not_called()
@@ -1,21 +1,30 @@
+import collections
+import contextvars
 import datetime
+import itertools
 import json
 import os
 import subprocess
-import time
 import urllib
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta
 from urllib.parse import parse_qs
 
-import jwt
 import numpy as np
 import pandas as pd
-import requests
 import structlog
 from dateutil.parser import parse
 from django.conf import settings
 from django.utils import timezone
 
+from connectors.github import ratelimit
+from connectors.github.http import get_session
+from connectors.github.utils import (
+    OAUTH_SCOPE,
+    get_access_token,
+    get_installation_scope,
+    get_token_scope,
+)
 from engine.models import CodeChange
 
 logger = structlog.get_logger(__name__)
@@ -57,6 +66,33 @@ def date_range(start_date, end_date):
         yield start_date + timedelta(n)
 
 
+def as_date(value):
+    return value.date() if isinstance(value, datetime.datetime) else value
+
+
+def get_day_range(date_from, date_to):
+    """
+    Return the first and the last timestamp (exclusive) of the days from `date_from` to `date_to`.
+
+    Filtering timestamps by this range instead of with the `__date` lookups
+    does not cast the column, so indexes on it can be used.
+    If one of the dates is None, its timestamp is None too (an open range).
+    """
+    start = end = None
+    if date_from:
+        start = timezone.make_aware(
+            datetime.datetime.combine(as_date(date_from), datetime.time.min)
+        )
+    if date_to:
+        end = timezone.make_aware(
+            datetime.datetime.combine(
+                as_date(date_to) + timedelta(days=1), datetime.time.min
+            )
+        )
+
+    return start, end
+
+
 def get_file_changes(filename, project, days=30):
     ref_date = timezone.now() - timedelta(days=days)
     ref_date = ref_date.replace(hour=0, minute=0, second=0, microsecond=0)
@@ -181,6 +217,94 @@ def resample_metrics(queryset, frequency):
     return metrics
 
 
+# Metrics that are counted per day and have to be summed up when aggregating days
+SUMMED_METRICS = (
+    "github_issues_closed",
+    "github_pull_requests_merged",
+    "github_pull_requests_cumulative_age",
+)
+
+
+def lttb(x, y, max_points):
+    """
+    Largest-Triangle-Three-Buckets downsampling.
+
+    Returns the indices of the (at most) `max_points` points that keep
+    the visual shape of the series best. The first and the last point are
+    always kept. The points between are split into equally sized buckets
+    and from every bucket the point is selected that forms the largest
+    triangle with the point selected in the previous bucket and the
+    average of the next bucket.
+
+    :param x: 1D array with the x values (sorted)
+    :param y: 2D array with one column per series. The triangle areas of all
+        series are added up, so the series should be normalized.
+    :param max_points: Maximum number of points to return.
+    """
+    n = len(x)
+    if max_points >= n:
+        return np.arange(n)
+    if max_points < 3:
+        return np.array([0, n - 1][:max_points], dtype=int)
+
+    buckets = np.floor(np.linspace(1, n - 1, max_points - 1)).astype(int)
+
+    selected = np.zeros(max_points, dtype=int)
+    selected[-1] = n - 1
+    a = 0
+    for i in range(max_points - 2):
+        start, end = buckets[i], buckets[i + 1]
+
+        # Average point of the next bucket (or the last point)
+        if i + 2 < len(buckets):
+            next_start, next_end = buckets[i + 1], buckets[i + 2]
+            x_c = x[next_start:next_end].mean()
+            y_c = y[next_start:next_end].mean(axis=0)
+        else:
+            x_c = x[n - 1]
+            y_c = y[n - 1]
+
+        x_b = x[start:end, np.newaxis]
+        y_b = y[start:end]
+        areas = np.abs((x[a] - x_c) * (y_b - y[a]) - (x[a] - x_b) * (y_c - y[a]))
+
+        a = start + np.argmax(areas.sum(axis=1))
+        selected[i + 1] = a
+
+    return selected
+
+
+def downsample_metrics(metrics, max_points):
+    """
+    Reduces the (daily) metrics to `max_points` points using LTTB.
+
+    The level metrics are normalized to 0..1 and taken into account
+    together, so the selected days are the same for every metric.
+    The summed metrics (see `SUMMED_METRICS`) are counts per day, they are
+    not sampled but added up from the day after the previous selected day
+    up to the selected day, so no counts are lost.
+    """
+    if len(metrics) <= max_points:
+        return metrics
+
+    df = pd.DataFrame.from_records(metrics)
+    x = pd.to_datetime(df["date"]).to_numpy().astype("int64") / (24 * 60 * 60 * 1e9)
+
+    summed = [column for column in SUMMED_METRICS if column in df.columns]
+    y = df.drop(columns=["date"] + summed).to_numpy(dtype=float)
+    y_min = y.min(axis=0)
+    y_range = y.max(axis=0) - y_min
+    y = (y - y_min) / np.where(y_range == 0, 1, y_range)
+
+    selected = lttb(x, y, max_points)
+    df_sampled = df.iloc[selected].copy()
+    if summed:
+        bucket_starts = np.concatenate(([0], selected[:-1] + 1))
+        df_sampled[summed] = np.add.reduceat(df[summed].to_numpy(), bucket_starts)
+
+    return df_sampled.to_dict("records")
+
+
 def resample_releases(queryset, frequency):
     if queryset.count() == 0:
         return queryset
@@ -204,6 +328,33 @@ def resample_releases(queryset, frequency):
     return releases
 
 
+def to_columnar(records, date_column, derived=None):
+    """
+    Converts a list of records to one list per column.
+
+    Returns `{"dates": [...], "series": {name: [...]}}` with the dates
+    in ISO 8601 format (UTC).
+
+    :param records: List of dicts (e.g. the result of `resample_metrics`)
+    :param date_column: Name of the column holding the dates.
+    :param derived: Dict of additional series to calculate.
+        Maps the name of the series to a function that is called with the data frame.
+    """
+    df = pd.DataFrame.from_records(list(records))
+    if df.empty:
+        return {"dates": [], "series": {}}
+
+    dates = pd.to_datetime(df.pop(date_column), utc=True)
+
+    for name, calculate in (derived or {}).items():
+        df[name] = calculate(df)
+
+    return {
+        "dates": dates.dt.strftime("%Y-%m-%dT%H:%M:%SZ").tolist(),
+        "series": {name: df[name].to_numpy().tolist() for name in df.columns},
+    }
+
+
 def log(project_id, message, event):
     """
     Add log entry to project.
@@ -245,11 +396,14 @@ class GitHub:
 
     user_access_token = None
     installation_access_token = None
+    installation_id = None
 
     def __init__(self, installation_id=None, code=None, state=None):
         logger.debug(
             f"---> GitHub __init__ installation_id={installation_id}, code={code}, state={state}"
         )
+        self.installation_id = installation_id
+
         if not self.installation_access_token and installation_id:
             self.installation_access_token = self.get_access_token(installation_id)
 
@@ -269,7 +423,7 @@ class GitHub:
             "state": state,
         }
 
-        out = requests.post(api_url, data=payload)
+        out = get_session().post(api_url, data=payload, cache_scope=OAUTH_SCOPE)
         data = parse_qs(out.content.decode())
 
         try:
@@ -280,7 +434,21 @@ class GitHub:
 
         return user_access_token
 
-    def _get(self, url, headers=None):
+    @property
+    def cache_scope(self):
+        """
+        Scope of the cached responses of requests made with the installation access token.
+        """
+        if self.installation_access_token:
+            return get_installation_scope(self.installation_id)
+
+        return "public"
+
+    def _get(self, url, headers=None, cache_scope=None):
+        """
+        :param cache_scope: Scope of the request if `headers` with
+            another authorization than the installation access token are given.
+        """
         logger.debug(f"---> GitHub _get url={url}")
         api_url = f"{self.api_base_url}{url}"
 
@@ -288,55 +456,30 @@ class GitHub:
             headers = {
                 "Authorization": "token %s" % self.installation_access_token,
             }
+            cache_scope = self.cache_scope
 
-        out = requests.get(api_url, headers=headers)
+        out = get_session().get(api_url, headers=headers, cache_scope=cache_scope)
         return json.loads(out.content)
 
     def _post(self, url, headers=None):
         logger.debug(f"---> GitHub _post url={url}")
         api_url = f"{self.api_base_url}{url}"
 
-        out = requests.post(api_url, headers=headers)
+        out = get_session().post(api_url, headers=headers, cache_scope=self.cache_scope)
         return json.loads(out.content)
 
-    def create_jwt(self):
-        logger.debug(f"---> GitHub create_jwt")
-        """
-        Generate a JSON web token (JWT)
-        """
-        private_key = settings.GITHUB_PRIVATE_KEY.decode("utf-8")
-        current_time = int(time.time())
-
-        payload = {
-            "iat": current_time,  # issued at time
-            "exp": current_time + (10 * 60),  # JWT expiration time (10 minute maximum)
-            "iss": settings.GITHUB_APP_IDENTIFIER,  # GitHub App's identifier
-        }
-
-        token = jwt.encode(payload, private_key, algorithm="RS256").decode("utf-8")
-        return token
-
     def get_access_token(self, installation_id):
         logger.debug(f"---> GitHub get_access_token installation_id={installation_id}")
         """
         Authenticate as a Github App and get an installation access token.
         """
-        url = f"/app/installations/{installation_id}/access_tokens"
-
-        headers = {
-            "Accept": "application/vnd.github.machine-man-preview+json",
-            "Authorization": "Bearer %s" % self.create_jwt(),
-        }
-
-        out = self._post(url, headers=headers)
-        token = out.get("token", None)
-
-        if not token:
+        try:
+            return get_access_token(installation_id)
+        except KeyError:
             logger.warn(
-                f"Could not get access token for installation id {installation_id}: {out}"
+                f"Could not get access token for installation id {installation_id}."
             )
-
-        return token
+            return None
 
     def get_repository(self, repository_full_name):
         logger.debug(
@@ -357,7 +500,9 @@ class GitHub:
             "Authorization": "token %s" % self.user_access_token,
         }
 
-        return self._get(url, headers=headers)
+        return self._get(
+            url, headers=headers, cache_scope=get_token_scope(self.user_access_token)
+        )
 
     def get_installation_repositories(self, installations_id):
         url = f"/user/installations/{installations_id}/repositories"
@@ -367,7 +512,9 @@ class GitHub:
             "Authorization": "token %s" % self.user_access_token,
         }
 
-        return self._get(url, headers=headers)
+        return self._get(
+            url, headers=headers, cache_scope=get_token_scope(self.user_access_token)
+        )
 
     def get_issues(self, repo_owner, repo_name, start_date=None):
         params = {
@@ -417,34 +564,110 @@ class GitHub:
             params
         )
 
-        retries = 0
+        yield from self._get_pages(url, headers)
+
+    def _get_page(self, url, headers):
+        """
+        Returns the response of one page of a list endpoint
+        or None if the page does not exist or is not accessible.
+
+        Raises an exception if the page can not be loaded because of
+        the rate limit or server errors, so no incomplete data is returned.
+        """
+        r = get_session().get(url, headers=headers, cache_scope=self.cache_scope)
+        if r.status_code != 200:
+            if ratelimit.is_retryable(r):
+                r.raise_for_status()
+
+            logger.warning(f"Could not get {url}: {r.status_code} {r.content}")
+            return None
+
+        return r
+
+    @staticmethod
+    def _get_page_urls(response):
+        """
+        Returns the urls of all pages following the given first page
+        or None if the response does not link to the last page.
+        """
+        last_url = response.links.get("last", {}).get("url")
+        if not last_url:
+            return None
+
+        parts = urllib.parse.urlsplit(last_url)
+        query = parse_qs(parts.query)
+        try:
+            last_page = int(query["page"][0])
+        except (KeyError, ValueError):
+            return None
+
+        urls = []
+        for page in range(2, last_page + 1):
+            query["page"] = [str(page)]
+            urls.append(
+                urllib.parse.urlunsplit(
+                    parts._replace(query=urllib.parse.urlencode(query, doseq=True))
+                )
+            )
 
-        while url:
-            r = requests.get(url, headers=headers)
-            if r.status_code != 200:
-                if retries < 5:
-                    time.sleep(1)
-                    retries += 1
-                    continue
+        return urls
 
-            if retries == 5:
-                return
+    def _get_pages(self, url, headers, concurrent=True):
+        """
+        Yields the items of all pages of a list endpoint in order.
 
-            issues = json.loads(r.content)
-            for issue in issues:
-                yield issue
+        If `concurrent` is set and the first page links to the last page,
+        the following pages are loaded in parallel by a few threads. Only a limited
+        number of pages is loaded ahead of the consumer, every request still goes
+        through the rate limit.
+        Otherwise the `next` links are followed one page after the other.
+        """
+        r = self._get_page(url, headers)
+        if r is None:
+            return
 
+        yield from json.loads(r.content)
+
+        urls = self._get_page_urls(r) if concurrent else None
+        if urls is None:
             # get url of next page (if any)
-            url = None
+            url = r.links.get("next", {}).get("url")
+            while url:
+                r = self._get_page(url, headers)
+                if r is None:
+                    return
+
+                yield from json.loads(r.content)
+                url = r.links.get("next", {}).get("url")
+            return
+
+        urls = iter(urls)
+        workers = settings.GITHUB_CONCURRENT_PAGES
+        futures = collections.deque()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+
+            def submit(url):
+                # In the context of the caller (see `ratelimit.fail_fast`).
+                context = contextvars.copy_context()
+                return executor.submit(context.run, self._get_page, url, headers)
+
             try:
-                links = requests.utils.parse_header_links(r.headers["Link"])
-                for link in links:
-                    if link["rel"] == "next":
-                        url = link["url"]
-                        retries = 0
-                        break
-            except KeyError:
-                pass
+                for url in itertools.islice(urls, 2 * workers):
+                    futures.append(submit(url))
+
+                while futures:
+                    r = futures.popleft().result()
+                    if r is None:
+                        return
+
+                    for url in itertools.islice(urls, 1):
+                        futures.append(submit(url))
+
+                    yield from json.loads(r.content)
+            finally:
+                # The consumer stopped early or a page failed.
+                for future in futures:
+                    future.cancel()
 
     def get_releases(self, repo_owner, repo_name):
         headers = {
@@ -464,36 +687,15 @@ class GitHub:
             params
         )
 
-        retries = 0
-
-        while url:
-            r = requests.get(url, headers=headers)
-            if r.status_code != 200:
-                if retries < 5:
-                    time.sleep(1)
-                    retries += 1
-                    continue
+        yield from self._get_pages(url, headers)
 
-            if retries == 5:
-                return
-
-            releases = json.loads(r.content)
-            for release in releases:
-                yield release
-
-            # get url of next page (if any)
-            url = None
-            try:
-                links = requests.utils.parse_header_links(r.headers["Link"])
-                for link in links:
-                    if link["rel"] == "next":
-                        url = link["url"]
-                        retries = 0
-                        break
-            except KeyError:
-                pass
+    def get_pull_requests(self, repo_owner, repo_name, updated_since=None):
+        """
+        Yields the closed pull requests, the last updated first.
 
-    def get_pull_requests(self, repo_owner, repo_name):
+        If `updated_since` is given, stops at the first pull request updated before.
+        Then usually only the first page is needed, so the pages are not loaded in parallel.
+        """
         params = {
             "state": "closed",
             "sort": "updated",
@@ -501,9 +703,16 @@ class GitHub:
             "per_page": str(self.GITHUB_ITEMS_PER_PAGE),
         }
 
-        return self._get_pull_requests(repo_owner, repo_name, params)
+        pull_requests = self._get_pull_requests(
+            repo_owner, repo_name, params, concurrent=updated_since is None
+        )
+        for pull_request in pull_requests:
+            if updated_since and parse(pull_request["updated_at"]) < updated_since:
+                break
+
+            yield pull_request
 
-    def _get_pull_requests(self, repo_owner, repo_name, params):
+    def _get_pull_requests(self, repo_owner, repo_name, params, concurrent=True):
         headers = {
             "Accept": "application/vnd.github.machine-man-preview+json",
             "Authorization": "token %s" % self.installation_access_token,
@@ -520,34 +729,7 @@ class GitHub:
             % urllib.parse.urlencode(params)
         )
 
-        retries = 0
-
-        while url:
-            r = requests.get(url, headers=headers)
-            if r.status_code != 200:
-                if retries < 5:
-                    time.sleep(1)
-                    retries += 1
-                    continue
-
-            if retries == 5:
-                return
-
-            items = json.loads(r.content)
-            for item in items:
-                yield item
-
-            # get url of next page (if any)
-            url = None
-            try:
-                links = requests.utils.parse_header_links(r.headers["Link"])
-                for link in links:
-                    if link["rel"] == "next":
-                        url = link["url"]
-                        retries = 0
-                        break
-            except KeyError:
-                pass
+        yield from self._get_pages(url, headers, concurrent=concurrent)
 
 
 def make_one(list_or_value):
@@ -0,0 +1,29 @@
+# Generated by Django 3.2.11 on 2026-10-19 15:04
+
+from django.db import migrations
+
+# Keep only the newest of duplicated code changes before adding the constraint.
+DELETE_DUPLICATES = """
+DELETE FROM engine_codechange a
+USING engine_codechange b
+WHERE a.id < b.id
+  AND a.project_id = b.project_id
+  AND a.git_commit_hash = b.git_commit_hash
+  AND a.file_path = b.file_path
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0014_sourcestatus_aggregates"),
+        ("engine", "0011_auto_20201013_1131"),
+    ]
+
+    operations = [
+        migrations.RunSQL(DELETE_DUPLICATES, reverse_sql=migrations.RunSQL.noop),
+        migrations.AlterUniqueTogether(
+            name="codechange",
+            unique_together={("project", "git_commit_hash", "file_path")},
+        ),
+    ]
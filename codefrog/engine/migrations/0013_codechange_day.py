@@ -0,0 +1,45 @@
+# Generated by Django 3.2.11 on 2026-10-19 15:10
+
+from django.db import migrations, models
+
+FILL_DAY = """
+UPDATE engine_codechange
+SET day = (timestamp AT TIME ZONE 'UTC')::date
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0014_sourcestatus_aggregates"),
+        ("engine", "0012_codechange_unique"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="codechange",
+            name="day",
+            field=models.DateField(null=True),
+        ),
+        migrations.RunSQL(FILL_DAY, reverse_sql=migrations.RunSQL.noop),
+        migrations.AlterField(
+            model_name="codechange",
+            name="day",
+            field=models.DateField(),
+        ),
+        migrations.AddIndex(
+            model_name="codechange",
+            index=models.Index(
+                fields=["project", "file_path", "day"],
+                name="codechange_file_day_idx",
+                opclasses=["int4_ops", "varchar_pattern_ops", "date_ops"],
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="codechange",
+            index=models.Index(
+                fields=["project", "day", "timestamp"],
+                name="codechange_day_idx",
+            ),
+        ),
+    ]
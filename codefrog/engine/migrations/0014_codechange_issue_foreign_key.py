@@ -0,0 +1,24 @@
+# Generated by Django 3.2.11 on 2026-10-19 15:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("engine", "0013_codechange_day"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="codechange",
+            name="issue",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="code_changes",
+                to="engine.issue",
+            ),
+        ),
+    ]
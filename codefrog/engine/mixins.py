@@ -1,3 +1,9 @@
+import functools
+import re
+
+import numpy as np
+import pandas as pd
+
 CATEGORY_BUG = "bug"
 CATEGORY_CHANGE = "change"
 
@@ -7,19 +13,56 @@ CATEGORY_CHOICES = (
 )
 
 
-class CategorizationMixin:
-    def get_category(self):
-        bug_labels = self.project.get_bug_labels()
-        for label in self.labels:
-            if label in bug_labels:
-                return CATEGORY_BUG
+@functools.lru_cache(maxsize=32)
+def _compile_bug_labels(bug_labels):
+    return re.compile("|".join(re.escape(label) for label in bug_labels))
+
+
+def get_bug_label_matcher(bug_labels):
+    """
+    Return one regular expression finding any of the bug labels in a label
+    (or None if there are no bug labels).
+
+    A label is a bug label if it is one of the bug labels or contains one.
+    """
+    if not bug_labels:
+        return None
+
+    return _compile_bug_labels(tuple(sorted(set(bug_labels))))
+
 
-        for label in self.labels:
-            for bug_label in bug_labels:
-                if bug_label in label:
-                    return CATEGORY_BUG
+def get_category(labels, bug_labels):
+    """
+    Return the category of an issue or pull request with the given labels.
+    """
+    matcher = get_bug_label_matcher(bug_labels)
+    if matcher and any(matcher.search(label) for label in labels):
+        return CATEGORY_BUG
 
-        return CATEGORY_CHANGE
+    return CATEGORY_CHANGE
+
+
+def get_categories(labels_list, bug_labels):
+    """
+    Return the categories of many issues or pull requests at once.
+
+    :param labels_list: List of the labels of each issue or pull request.
+    :return: List of categories in the same order.
+    """
+    matcher = get_bug_label_matcher(bug_labels)
+    if not matcher or not labels_list:
+        return [CATEGORY_CHANGE] * len(labels_list)
+
+    # All labels of an item in one string, the bug labels never contain a newline.
+    labels = pd.Series(["\n".join(labels) for labels in labels_list], dtype=object)
+    is_bug = labels.str.contains(matcher).to_numpy(dtype=bool)
+
+    return np.where(is_bug, CATEGORY_BUG, CATEGORY_CHANGE).tolist()
+
+
+class CategorizationMixin:
+    def get_category(self):
+        return get_category(self.labels, self.project.get_bug_labels())
 
     def save(self, *args, **kwargs):
         self.category = self.get_category()
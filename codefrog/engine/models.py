@@ -8,19 +8,51 @@ from django.utils import timezone
 from engine.mixins import CategorizationMixin, CATEGORY_CHOICES, CATEGORY_CHANGE
 
 
+def get_day(timestamp):
+    """
+    Return the day of the timestamp in the current time zone (like the `__date` lookup).
+    """
+    if timezone.is_aware(timestamp):
+        return timezone.localdate(timestamp)
+
+    return timestamp.date()
+
+
+def get_issue_refid(text):
+    """
+    Return the issue referenced in `text` (`#123` or `owner/repo#123`) or None.
+
+    A reference to an issue in another repository wins over a local one.
+    """
+    issue_refid = None
+    regex_issue_number = r"#[0-9]{1,8}"
+    search_object = re.search(regex_issue_number, text)
+    if search_object:
+        issue_refid = search_object.group(0)
+
+    regex_issue_number_other_repo = r"[\w-]+\/[\w-]+#[0-9]{1,8}"
+    search_object = re.search(regex_issue_number_other_repo, text)
+    if search_object:
+        issue_refid = search_object.group(0)
+
+    return issue_refid
+
+
 class CodeChange(models.Model):
     project = models.ForeignKey(
         "core.Project",
         on_delete=models.CASCADE,
         related_name="code_changes",
     )
-    issue = models.OneToOneField(
+    issue = models.ForeignKey(
         "engine.Issue",
         null=True,
         on_delete=models.SET_NULL,
-        related_name="code_change",
+        related_name="code_changes",
     )
     timestamp = models.DateTimeField()
+    # The day of `timestamp`, stored so it can be filtered by and indexed.
+    day = models.DateField()
     file_path = models.CharField(max_length=255)
     author = models.CharField(max_length=255)
     complexity_added = models.PositiveIntegerField()
@@ -28,30 +60,36 @@ class CodeChange(models.Model):
     description = models.TextField(null=False, default="")
     git_commit_hash = models.CharField(max_length=255, null=False, default="")
 
+    class Meta:
+        unique_together = (
+            (
+                "project",
+                "git_commit_hash",
+                "file_path",
+            ),
+        )
+        indexes = [
+            # Changes of a file or, with `varchar_pattern_ops`,
+            # of a directory (`file_path LIKE 'dir/%'`) in a date range.
+            models.Index(
+                fields=["project", "file_path", "day"],
+                name="codechange_file_day_idx",
+                opclasses=["int4_ops", "varchar_pattern_ops", "date_ops"],
+            ),
+            # All changes of a project in a date range.
+            models.Index(
+                fields=["project", "day", "timestamp"],
+                name="codechange_day_idx",
+            ),
+        ]
+
     def save(self, *args, **kwargs):
-        issue_refid = None
-        regex_issue_number = r"#[0-9]{1,8}"
-        search_object = re.search(regex_issue_number, self.description)
-        if search_object:
-            issue_refid = search_object.group(0)
-
-        regex_issue_number_other_repo = r"[\w-]+\/[\w-]+#[0-9]{1,8}"
-        search_object = re.search(regex_issue_number_other_repo, self.description)
-        if search_object:
-            issue_refid = search_object.group(0)
-
-        if not issue_refid:
-            return
-
-        if issue_refid.startswith("#"):
-            self.issue = self.project.issue_set.filter(
-                issue_refid=issue_refid[1:]
-            ).first()
-        else:
-            # TODO: implement links to other repositories
-            raise NotImplemented(
-                "References to issues in other repositories is currently not implemented."
-            )
+        self.day = get_day(self.timestamp)
+
+        # References to issues in other repositories are not linked (yet).
+        issue_refid = get_issue_refid(self.description)
+        if issue_refid and issue_refid.startswith("#"):
+            self.issue = self.project.issues.filter(issue_refid=issue_refid[1:]).first()
 
         super().save(*args, **kwargs)
 
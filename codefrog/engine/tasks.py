@@ -7,9 +7,10 @@ from dateutil.parser import parse
 from django.db.models import Q, Sum
 from django.utils import timezone
 
+from core.bulk import copy_rows, merge_rows
 from core.models import Metric, Complexity
 from core.utils import date_range, log, make_one
-from engine.models import CodeChange, Issue, PullRequest
+from engine.models import CodeChange, Issue, PullRequest, get_day
 
 logger = structlog.get_logger(__name__)
 
@@ -17,35 +18,68 @@ logger = structlog.get_logger(__name__)
 DAYS_PER_CHUNK = 365 * 10
 
 
+def _merge_metrics(rows):
+    """
+    Saves the metrics of the given days.
+
+    The given metrics are merged into the metrics already saved for the day,
+    so the tasks calculating different metrics do not overwrite each other.
+    """
+    return merge_rows(
+        Metric,
+        ["project", "date", "file_path", "metrics"],
+        rows,
+        unique_fields=["project", "date"],
+        update_fields=["metrics"],
+    )
+
+
+def _get_start_date(first_date, start_date=None):
+    """
+    Return the first day metrics are calculated for.
+    """
+    if start_date is None:
+        return first_date
+
+    if isinstance(start_date, str):
+        start_date = parse(start_date)
+    if isinstance(start_date, datetime.datetime):
+        start_date = get_day(start_date)
+
+    return max(get_day(first_date), start_date)
+
+
 @shared_task
-def calculate_code_complexity(project_id, *args, **kwargs):
-    logger.info("Project(%s): Starting calculate_code_complexity.", project_id)
+def calculate_code_complexity(project_id, start_date=None, *args, **kwargs):
+    """
+    Calculates the complexity of the files after each of their code changes.
+
+    :param start_date: Only the complexity of the code changes since this
+        timestamp is recalculated (defaults to all code changes).
+    :return: project_id
+    """
+    logger.info(
+        "Project(%s): Starting calculate_code_complexity (%s).", project_id, start_date
+    )
+    project_id = make_one(project_id)
 
-    Complexity.objects.filter(
-        project_id=project_id
-    ).delete()  # TODO: maybe do this in a better way?
+    if isinstance(start_date, str):
+        start_date = parse(start_date)
 
-    # Get the newest Complexity we have
-    try:
-        timestamp = (
-            Complexity.objects.filter(project_id=project_id)
-            .order_by("-timestamp")
-            .first()
-            .timestamp
-        )
-    except AttributeError:
-        timestamp = datetime.datetime(1970, 1, 1)
+    complexities = Complexity.objects.filter(project_id=project_id)
+    code_changes = CodeChange.objects.filter(project_id=project_id)
+    if start_date:
+        complexities = complexities.filter(timestamp__gte=start_date)
+        code_changes = code_changes.filter(timestamp__gte=start_date)
 
-    # List all code change since the newest complexity we have
-    code_changes = CodeChange.objects.filter(
-        project_id=project_id,
-        timestamp__gte=timestamp,
-    ).order_by("file_path", "timestamp")
+    complexities.delete()
+    code_changes = code_changes.order_by("file_path", "timestamp")
 
     complexity = defaultdict(int)
-    for change in code_changes:
+    rows = []
+    for change in code_changes.iterator():
         # if we do not have a complexity for the file, get the last one from the database.
-        if complexity[change.file_path] == 0:
+        if change.file_path not in complexity:
             comp = (
                 Complexity.objects.filter(
                     project_id=project_id,
@@ -64,15 +98,25 @@ def calculate_code_complexity(project_id, *args, **kwargs):
         complexity[change.file_path] -= change.complexity_removed
 
         # save as new Complexity object.
-        Complexity.objects.create(
-            project_id=project_id,
-            file_path=change.file_path,
-            timestamp=change.timestamp,
-            complexity=complexity[change.file_path],
+        rows.append(
+            (
+                project_id,
+                change.file_path,
+                change.timestamp,
+                complexity[change.file_path],
+            )
         )
 
+    copy_rows(
+        Complexity._meta.db_table,
+        ["project_id", "file_path", "timestamp", "complexity"],
+        rows,
+    )
+
     logger.info("Project(%s): Finished calculate_code_complexity.", project_id)
 
+    return project_id
+
 
 @shared_task
 def calculate_code_metrics(project_id, start_date=None, *args, **kwargs):
@@ -110,7 +154,7 @@ def calculate_code_metrics(project_id, start_date=None, *args, **kwargs):
 
     code_changes = CodeChange.objects.filter(
         project_id=project_id,
-        timestamp__date__gte=start_date,
+        day__gte=start_date,
     ).order_by("timestamp")
 
     # Calculate complexity and change frequency at the end of the respective day
@@ -125,23 +169,6 @@ def calculate_code_metrics(project_id, start_date=None, *args, **kwargs):
         # overall change frequency
         change_frequency[day] += 1
 
-    # Save calculated complexity and change frequency to metrics
-    for day in complexity.keys():
-        logger.debug("Project(%s): Code Metric %s", project_id, day)
-        # save the metrics to db
-        metric, _ = Metric.objects.get_or_create(
-            project_id=project_id,
-            date=day,
-        )
-        metric_json = metric.metrics
-        if not metric_json:
-            metric_json = {}
-
-        metric_json["complexity"] = complexity[day]
-        metric_json["change_frequency"] = change_frequency[day]
-        metric.metrics = metric_json
-        metric.save()
-
     # Fill gaps in metrics (so there is one Metric object all the metrics set for each and every day)
     try:
         old_metric = Metric.objects.get(
@@ -154,31 +181,38 @@ def calculate_code_metrics(project_id, start_date=None, *args, **kwargs):
         old_complexity = 0
         old_change_frequency = 0
 
-    for day in date_range(start_date, timezone.now().date()):
-        metric, _ = Metric.objects.get_or_create(
+    # Metrics already saved, for the days without code changes.
+    existing_metrics = dict(
+        Metric.objects.filter(
             project_id=project_id,
-            date=day,
-        )
-        metric_json = metric.metrics
-        if not metric_json:
-            metric_json = {}
-
-        metric_json["complexity"] = (
-            metric_json["complexity"]
-            if "complexity" in metric_json and metric_json["complexity"]
-            else old_complexity
-        )
-        metric_json["change_frequency"] = (
-            metric_json["change_frequency"]
-            if "change_frequency" in metric_json and metric_json["change_frequency"]
-            else old_change_frequency
-        )
-        metric.metrics = metric_json
-        metric.save()
+            date__gte=start_date,
+        ).values_list("date", "metrics")
+    )
+
+    rows = []
+    days = sorted(set(date_range(start_date, timezone.now().date())) | set(complexity))
+    for day in days:
+        logger.debug("Project(%s): Code Metric %s", project_id, day)
+        if day in complexity:
+            metric_json = {
+                "complexity": complexity[day],
+                "change_frequency": change_frequency[day],
+            }
+        else:
+            metric_json = existing_metrics.get(day) or {}
+
+        metric_json = {
+            "complexity": metric_json.get("complexity") or old_complexity,
+            "change_frequency": metric_json.get("change_frequency")
+            or old_change_frequency,
+        }
+        rows.append((project_id, day, "", metric_json))
 
         old_complexity = metric_json["complexity"]
         old_change_frequency = metric_json["change_frequency"]
 
+    _merge_metrics(rows)
+
     logger.info("Project(%s): Finished calculate_code_metrics.", project_id)
     log(project_id, "Calculating code evolution", "stop")
 
@@ -186,8 +220,13 @@ def calculate_code_metrics(project_id, start_date=None, *args, **kwargs):
 
 
 @shared_task
-def calculate_issue_metrics(project_id, *args, **kwargs):
-    logger.info("Project(%s): Starting calculate_issue_metrics.", project_id)
+def calculate_issue_metrics(project_id, start_date=None, *args, **kwargs):
+    """
+    Calculates the issue metrics of every day (or of the days from `start_date` on).
+    """
+    logger.info(
+        "Project(%s): Starting calculate_issue_metrics (%s).", project_id, start_date
+    )
     project_id = make_one(project_id)
     log(project_id, "Calculating issue metrics", "start")
 
@@ -200,9 +239,10 @@ def calculate_issue_metrics(project_id, *args, **kwargs):
         logger.info("Project(%s): Finished calculate_issue_metrics.", project_id)
         return
 
-    start_date = issues.first().opened_at
+    start_date = _get_start_date(issues.first().opened_at, start_date)
     end_date = timezone.now()
 
+    rows = []
     for day in date_range(start_date, end_date):
         # open issues
         open_issues = issues.filter(
@@ -233,19 +273,14 @@ def calculate_issue_metrics(project_id, *args, **kwargs):
             f"{count_open_issues}/{age_opened_issues}/"
             f"{count_closed_issues}/{age_closed_issues}/{age}"
         )
-        metric, _ = Metric.objects.get_or_create(
-            project_id=project_id,
-            date=day,
-        )
+        metric_json = {
+            "github_issues_open": count_open_issues,
+            "github_issues_closed": count_issues_closed_today,
+            "github_issue_age": age,
+        }
+        rows.append((project_id, day, "", metric_json))
 
-        metric_json = metric.metrics
-        if not metric_json:
-            metric_json = {}
-        metric_json["github_issues_open"] = count_open_issues
-        metric_json["github_issues_closed"] = count_issues_closed_today
-        metric_json["github_issue_age"] = age
-        metric.metrics = metric_json
-        metric.save()
+    _merge_metrics(rows)
 
     logger.info("Project(%s): Finished calculate_issue_metrics.", project_id)
     log(project_id, "Calculating issue metrics", "stop")
@@ -254,8 +289,15 @@ def calculate_issue_metrics(project_id, *args, **kwargs):
 
 
 @shared_task
-def calculate_pull_request_metrics(project_id, *args, **kwargs):
-    logger.info("Project(%s): Starting calculate_pull_request_metrics.", project_id)
+def calculate_pull_request_metrics(project_id, start_date=None, *args, **kwargs):
+    """
+    Calculates the pull request metrics of every day (or of the days from `start_date` on).
+    """
+    logger.info(
+        "Project(%s): Starting calculate_pull_request_metrics (%s).",
+        project_id,
+        start_date,
+    )
     project_id = make_one(project_id)
     log(project_id, "Calculating pull request metrics", "start")
 
@@ -269,9 +311,10 @@ def calculate_pull_request_metrics(project_id, *args, **kwargs):
         logger.info("Project(%s): Finished calculate_pull_request_metrics.", project_id)
         return
 
-    start_date = pull_requests.first().opened_at
+    start_date = _get_start_date(pull_requests.first().opened_at, start_date)
     end_date = timezone.now()
 
+    rows = []
     for day in date_range(start_date, end_date):
         count_pull_requests_merged_today = pull_requests.filter(
             merged_at__date=day
@@ -286,21 +329,13 @@ def calculate_pull_request_metrics(project_id, *args, **kwargs):
             f"{count_pull_requests_merged_today}/"
             f"{cumulative_pull_requests_age}"
         )
-        metric, _ = Metric.objects.get_or_create(
-            project_id=project_id,
-            date=day,
-        )
-
-        metric_json = metric.metrics
-        if not metric_json:
-            metric_json = {}
+        metric_json = {
+            "github_pull_requests_merged": count_pull_requests_merged_today,
+            "github_pull_requests_cumulative_age": cumulative_pull_requests_age,
+        }
+        rows.append((project_id, day, "", metric_json))
 
-        metric_json["github_pull_requests_merged"] = count_pull_requests_merged_today
-        metric_json[
-            "github_pull_requests_cumulative_age"
-        ] = cumulative_pull_requests_age
-        metric.metrics = metric_json
-        metric.save()
+    _merge_metrics(rows)
 
     logger.info("Project(%s): Finished calculate_pull_request_metrics.", project_id)
     log(project_id, "Calculating pull request metrics", "stop")
@@ -0,0 +1,126 @@
+import datetime
+
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from core.models import Complexity, Project
+from engine.mixins import (
+    CATEGORY_BUG,
+    CATEGORY_CHANGE,
+    get_categories,
+    get_category,
+)
+from engine.models import CodeChange
+from engine.tasks import calculate_code_complexity
+
+
+class CategoriesTestCase(SimpleTestCase):
+    bug_labels = ["bug", "type:bug", "crash (major)"]
+
+    labels_list = [
+        ["bug"],
+        ["enhancement"],
+        [],
+        ["docs", "type:bug"],
+        ["Bug"],
+        ["bugfix"],
+        ["crash (major)"],
+        ["crash major"],
+    ]
+
+    def test_get_categories(self):
+        self.assertEqual(
+            get_categories(self.labels_list, self.bug_labels),
+            [
+                CATEGORY_BUG,
+                CATEGORY_CHANGE,
+                CATEGORY_CHANGE,
+                CATEGORY_BUG,
+                CATEGORY_CHANGE,
+                # Labels containing a bug label are bug labels.
+                CATEGORY_BUG,
+                # Bug labels are matched literally, not as regular expressions.
+                CATEGORY_BUG,
+                CATEGORY_CHANGE,
+            ],
+        )
+
+    def test_same_as_get_category(self):
+        self.assertEqual(
+            get_categories(self.labels_list, self.bug_labels),
+            [get_category(labels, self.bug_labels) for labels in self.labels_list],
+        )
+
+    def test_no_bug_labels(self):
+        self.assertEqual(
+            get_categories([["bug"], []], []), [CATEGORY_CHANGE, CATEGORY_CHANGE]
+        )
+
+    def test_nothing_to_categorize(self):
+        self.assertEqual(get_categories([], self.bug_labels), [])
+
+
+class CodeComplexityTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.project = Project.objects.create(
+            source="github",
+            slug="codefrog",
+            name="codefrog",
+            git_url="https://github.com/codefrog-app/codefrog.git",
+        )
+
+        # file name: (complexity added, complexity removed) per day
+        files = {
+            "a.py": [(5, 0), (0, 5), (3, 0)],
+            "b.py": [(2, 0), (4, 1)],
+        }
+        for file_path, changes in files.items():
+            for day, (added, removed) in enumerate(changes, start=1):
+                timestamp = datetime.datetime(2020, 1, day, 10, tzinfo=timezone.utc)
+                CodeChange.objects.create(
+                    project=cls.project,
+                    timestamp=timestamp,
+                    day=timestamp.date(),
+                    file_path=file_path,
+                    author="Anton Pirker <anton@ignaz.at>",
+                    complexity_added=added,
+                    complexity_removed=removed,
+                    git_commit_hash=f"{file_path}{day}",
+                )
+
+    def get_complexities(self):
+        return list(
+            Complexity.objects.filter(project=self.project)
+            .order_by("file_path", "timestamp")
+            .values_list("file_path", "timestamp__day", "complexity")
+        )
+
+    def test_complexity(self):
+        self.assertEqual(calculate_code_complexity(self.project.pk), self.project.pk)
+
+        self.assertEqual(
+            self.get_complexities(),
+            [
+                ("a.py", 1, 5),
+                # A file without complexity does not start again from the database.
+                ("a.py", 2, 0),
+                ("a.py", 3, 3),
+                ("b.py", 1, 2),
+                ("b.py", 2, 5),
+            ],
+        )
+
+    def test_start_date(self):
+        calculate_code_complexity(self.project.pk)
+        complexities = self.get_complexities()
+
+        CodeChange.objects.filter(project=self.project, file_path="b.py").update(
+            complexity_added=1
+        )
+        calculate_code_complexity(self.project.pk, start_date="2020-01-02T00:00:00Z")
+
+        # Only the complexity since the start date is recalculated,
+        # starting from the complexity of the file before.
+        complexities[4] = ("b.py", 2, 2)
+        self.assertEqual(self.get_complexities(), complexities)
@@ -238,6 +238,11 @@ CELERY_TASK_TIME_LIMIT = get_env(
     env.bool, "CELERY_TASK_TIME_LIMIT", default=1 * 60 * 60 * 2
 )
 CELERY_CHUNK_SIZE = get_env(env.int, "CELERY_CHUNK_SIZE", default=10)
+# GitHub waits for the result of the complexity check,
+# so it must not wait behind the imports of projects.
+CELERY_TASK_ROUTES = {
+    "connectors.github.tasks.run_complexity_check": {"queue": "high"},
+}
 CELERY_WORKER_LOG_FORMAT = (
     "%(asctime)s %(processName)-16s %(levelname)-8s "
     "%(name)s %(funcName)s:%(lineno)d %(message)s"
@@ -248,6 +253,56 @@ CELERY_WORKER_TASK_LOG_FORMAT = (
     "%(name)s %(funcName)s:%(lineno)d %(message)s"
 )
 
+# Cache
+# The cache should run on its own Redis instance with a `maxmemory` limit and
+# the `volatile-lru` eviction policy: cached analytics expire and are evicted
+# least recently used first, data versions and statistics are kept.
+# The "github" cache holds the rate limits, access tokens, responses for
+# conditional requests and delivered web hooks of GitHub. Evicting them would
+# break the rate limiting, so it runs on a persistent Redis without eviction.
+CACHES = {
+    "default": {
+        "BACKEND": "django_redis.cache.RedisCache",
+        "LOCATION": get_env(
+            env.url, "CACHE_URL", default="redis://localhost:6379/2"
+        ).geturl(),
+        "KEY_PREFIX": "codefrog",
+        "OPTIONS": {
+            "CLIENT_CLASS": "django_redis.client.DefaultClient",
+            # If the cache is down, compute everything like there was no cache.
+            "IGNORE_EXCEPTIONS": True,
+        },
+    },
+    "github": {
+        "BACKEND": "django_redis.cache.RedisCache",
+        "LOCATION": get_env(
+            env.url, "GITHUB_CACHE_URL", default="redis://localhost:6379/3"
+        ).geturl(),
+        "KEY_PREFIX": "codefrog",
+        "OPTIONS": {
+            "CLIENT_CLASS": "django_redis.client.DefaultClient",
+            # If the cache is down, GitHub is called without the cache.
+            "IGNORE_EXCEPTIONS": True,
+        },
+    },
+    "locks": {
+        "BACKEND": "django_redis.cache.RedisCache",
+        "LOCATION": get_env(
+            env.url, "LOCK_CACHE_URL", default="redis://localhost:6379/4"
+        ).geturl(),
+        "KEY_PREFIX": "codefrog",
+        "OPTIONS": {
+            "CLIENT_CLASS": "django_redis.client.DefaultClient",
+            # Errors are raised, so nothing runs without holding its lock.
+        },
+    },
+}
+ANALYTICS_CACHE_TIMEOUT = get_env(
+    env.int, "ANALYTICS_CACHE_TIMEOUT", default=7 * 24 * 60 * 60
+)
+# How long the result of a paginated request is kept for loading the following pages.
+CURSOR_CACHE_TIMEOUT = get_env(env.int, "CURSOR_CACHE_TIMEOUT", default=5 * 60)
+
 # Github Setup
 # TODO: can these be removed?
 GITHUB_CLIENT_ID = get_env(env.str, "GITHUB_CLIENT_ID", default=None)
@@ -264,6 +319,35 @@ try:
     GITHUB_PRIVATE_KEY = get_env(env.str, "GITHUB_PRIVATE_KEY", multiline=True).encode()
 except Exception:
     GITHUB_PRIVATE_KEY = None
+# Connections kept open per GitHub host and process.
+# Should be at least the number of threads making requests in a process.
+GITHUB_HTTP_POOL_SIZE = get_env(env.int, "GITHUB_HTTP_POOL_SIZE", default=10)
+# Seconds to wait for GitHub to connect or to send data.
+GITHUB_HTTP_TIMEOUT = get_env(env.int, "GITHUB_HTTP_TIMEOUT", default=30)
+# How long responses of GitHub are kept for conditional requests.
+GITHUB_HTTP_CACHE_TIMEOUT = get_env(
+    env.int, "GITHUB_HTTP_CACHE_TIMEOUT", default=7 * 24 * 60 * 60
+)
+# Requests left in the rate limit of an installation that workers do not use,
+# so the web requests of its users still work.
+GITHUB_RATE_LIMIT_RESERVE = get_env(env.int, "GITHUB_RATE_LIMIT_RESERVE", default=100)
+# Longest time in seconds a worker waits for the rate limit before giving up.
+GITHUB_RATE_LIMIT_MAX_WAIT = get_env(
+    env.int, "GITHUB_RATE_LIMIT_MAX_WAIT", default=15 * 60
+)
+# Longest time in seconds a web request (view or web hook) waits for the rate limit,
+# it fails if it had to wait longer.
+GITHUB_REQUEST_RATE_LIMIT_MAX_WAIT = get_env(
+    env.int, "GITHUB_REQUEST_RATE_LIMIT_MAX_WAIT", default=0
+)
+# How often a request failing because of a rate limit or a server error is retried.
+GITHUB_MAX_RETRIES = get_env(env.int, "GITHUB_MAX_RETRIES", default=5)
+# Pages of a GitHub listing loaded in parallel (at most GITHUB_HTTP_POOL_SIZE).
+GITHUB_CONCURRENT_PAGES = get_env(env.int, "GITHUB_CONCURRENT_PAGES", default=4)
+# Redelivered web hooks and check suites of the same commit are ignored for this long.
+GITHUB_WEBHOOK_DEDUPLICATION_TIMEOUT = get_env(
+    env.int, "GITHUB_WEBHOOK_DEDUPLICATION_TIMEOUT", default=24 * 60 * 60
+)
 
 
 # Codefrog Configuration
@@ -273,6 +357,14 @@ PROJECT_SOURCE_CODE_DIR = get_env(
 if not os.path.exists(PROJECT_SOURCE_CODE_DIR):
     os.makedirs(PROJECT_SOURCE_CODE_DIR)
 
+# Longest time in seconds a pull or clone of a repository may keep it locked.
+REPO_LOCK_TIMEOUT = get_env(env.int, "REPO_LOCK_TIMEOUT", default=30 * 60)
+# Seconds after which a push builds a new source status of the repository.
+# Until then the periodic update of the project builds it.
+PUSH_SOURCE_STATUS_INTERVAL = get_env(
+    env.int, "PUSH_SOURCE_STATUS_INTERVAL", default=60 * 60
+)
+
 
 # Anymail setup
 EMAIL_BACKEND = "anymail.backends.sendinblue.EmailBackend"